@@ -0,0 +1,86 @@
+"""
+Throughput of one MockFirestore shared by several threads.
+
+    python benchmarks/concurrency.py [operations per thread]
+
+Each workload runs with 1, 2, 4 and 8 threads and prints the total number
+of operations per second. Reads never lock; writes only wait for writes to
+the same top-level collection. The interpreter lock still runs one thread at
+a time, so the totals should stay level as threads are added, rather than
+drop from lock contention.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mockfirestore import MockFirestore  # noqa: E402
+
+THREAD_COUNTS = (1, 2, 4, 8)
+DOCUMENTS = 1000
+
+
+def seeded_client() -> MockFirestore:
+    client = MockFirestore()
+    client._data = {'users': {str(i): {'age': i % 100, 'name': 'user {}'.format(i)} for i in range(DOCUMENTS)}}
+    return client
+
+
+def get_documents(client: MockFirestore, thread: int, operations: int):
+    users = client.collection('users')
+    for i in range(operations):
+        users.document(str(i % DOCUMENTS)).get()
+
+
+def run_queries(client: MockFirestore, thread: int, operations: int):
+    query = client.collection('users').where('age', '==', thread).order_by('name').limit(5)
+    for _ in range(operations):
+        list(query.stream())
+
+
+def set_own_collection(client: MockFirestore, thread: int, operations: int):
+    collection = client.collection('writes{}'.format(thread))
+    for i in range(operations):
+        collection.document(str(i % DOCUMENTS)).set({'value': i})
+
+
+def merge_shared_document(client: MockFirestore, thread: int, operations: int):
+    document = client.collection('counters').document('shared')
+    for i in range(operations):
+        document.set({'thread{}'.format(thread): i}, merge=True)
+
+
+def mixed(client: MockFirestore, thread: int, operations: int):
+    if thread % 2:
+        set_own_collection(client, thread, operations)
+    else:
+        get_documents(client, thread, operations)
+
+
+WORKLOADS = (get_documents, run_queries, set_own_collection, merge_shared_document, mixed)
+
+
+def throughput(workload, thread_count: int, operations: int) -> float:
+    client = seeded_client()
+    threads = [threading.Thread(target=workload, args=(client, thread, operations))
+               for thread in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return thread_count * operations / (time.perf_counter() - start)
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print('{:<24}'.format('ops/s') + ''.join('{:>12}'.format('{} threads'.format(n)) for n in THREAD_COUNTS))
+    for workload in WORKLOADS:
+        results = [throughput(workload, n, operations) for n in THREAD_COUNTS]
+        print('{:<24}'.format(workload.__name__) + ''.join('{:>12,.0f}'.format(r) for r in results))
+
+
+if __name__ == '__main__':
+    main()
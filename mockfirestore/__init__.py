@@ -3,13 +3,24 @@
 # try to import gcloud exceptions
 # and if gcloud is not installed, define our own
 try:
-    from google.api_core.exceptions import ClientError, Conflict, NotFound, AlreadyExists
+    from google.api_core.exceptions import ClientError, Conflict, NotFound, AlreadyExists, FailedPrecondition, Aborted
 except ImportError:
-    from mockfirestore.exceptions import ClientError, Conflict, NotFound, AlreadyExists
+    from mockfirestore.exceptions import ClientError, Conflict, NotFound, AlreadyExists, FailedPrecondition, Aborted
 
 from mockfirestore.client import MockFirestore
 from mockfirestore.document import DocumentSnapshot, DocumentReference
 from mockfirestore.collection import CollectionReference
 from mockfirestore.query import Query
+from mockfirestore.aggregation import AggregationQuery, AggregationResult
 from mockfirestore._helpers import Timestamp
-from mockfirestore.transaction import Transaction
+from mockfirestore.transaction import Transaction, transactional
+from mockfirestore.batch import WriteBatch
+from mockfirestore.bulk_writer import BulkWriter, BulkWriteFailure
+from mockfirestore.watch import Watch, DocumentChange, ChangeType
+from mockfirestore.async_client import AsyncMockFirestore
+from mockfirestore.async_document import AsyncDocumentReference
+from mockfirestore.async_collection import AsyncCollectionReference
+from mockfirestore.async_query import AsyncQuery
+from mockfirestore.async_aggregation import AsyncAggregationQuery
+from mockfirestore.async_transaction import AsyncTransaction, async_transactional
+from mockfirestore.async_batch import AsyncWriteBatch
@@ -1,15 +1,593 @@
+import itertools
 import operator
+from copy import deepcopy
 import random
 import string
+import threading
+import time
 from datetime import datetime as dt
 from functools import reduce
-from typing import (Dict, Any, Tuple, TypeVar, Sequence, Iterator)
+from typing import (
+    Dict, Any, Callable, ContextManager, Iterable, Tuple, TypeVar, Sequence, Iterator, Optional, Union, List, Set
+)
+
+from mockfirestore._indexes import FieldIndex, CompositeIndex, IndexFields
 
 T = TypeVar('T')
 KeyValuePair = Tuple[str, Dict[str, Any]]
 Document = Dict[str, Any]
-Collection = Dict[str, Document]
-Store = Dict[str, Collection]
+# Kinds of write-ahead log records.
+WRITE, DELETE, CLEAR = 'write', 'delete', 'clear'
+CollectionGroups = Dict[str, Set[Tuple[str, ...]]]
+# Versions of documents, unique across stores; a document that was never written has version 0.
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    return next(_versions)
+
+
+# Locks guarding the writes to a store, see `Store.lock`.
+LOCK_STRIPES = 64
+
+
+class DocumentNode:
+    """
+    A stored document. Fields and subcollections are kept apart, so reading or
+    replacing the fields never touches the documents nested below.
+
+    Nodes only change during the store generation they were created in, older
+    ones may be shared with checkpoints and are copied before being written to.
+    Every write gives the document a new version, which transactions compare
+    to detect concurrent changes. A node that was never written only holds the
+    subcollections of a missing document.
+    """
+    __slots__ = ('fields', 'collections', 'create_time', 'update_time', 'generation', 'version')
+
+    def __init__(self, fields: Optional[Document] = None, generation: int = 0) -> None:
+        self.fields = {} if fields is None else fields
+        self.collections = {}  # type: Dict[str, CollectionNode]
+        self.create_time = None  # type: Optional[Timestamp]
+        self.update_time = None  # type: Optional[Timestamp]
+        self.generation = generation
+        self.version = 0
+
+    @property
+    def exists(self) -> bool:
+        return self.create_time is not None
+
+    def copy(self, generation: int) -> 'DocumentNode':
+        node = DocumentNode(self.fields, generation)
+        node.collections = dict(self.collections)
+        node.create_time = self.create_time
+        node.update_time = self.update_time
+        node.version = self.version
+        return node
+
+
+class CollectionNode:
+    """
+    The documents of a collection, plus single-field indexes over them. An index
+    is built the first time a query filters on its field and is kept up to date
+    by `write` and `remove` from then on. Declared composite indexes are built
+    and maintained the same way.
+
+    Readers don't lock: `sequence` is odd while a write is changing the
+    documents or indexes, and goes up after every write, so `read` can tell
+    when a write overlapped it and try again.
+    """
+    __slots__ = ('documents', 'indexes', '_sorted_ids', 'generation', 'sequence')
+
+    def __init__(self, generation: int = 0) -> None:
+        self.documents = {}  # type: Dict[str, DocumentNode]
+        self.indexes = {}  # type: Dict[Union[str, IndexFields], Union[FieldIndex, CompositeIndex]]
+        self._sorted_ids = []  # type: Optional[List[str]]
+        self.generation = generation
+        self.sequence = 0
+
+    def copy(self, generation: int) -> 'CollectionNode':
+        node = CollectionNode(generation)
+        node.documents = dict(self.documents)
+        node.indexes = {key: index.copy() for key, index in self.indexes.items()}
+        # The cached list is replaced rather than modified, so it can be shared.
+        node._sorted_ids = self._sorted_ids
+        return node
+
+    def document(self, doc_id: str, create: bool = False) -> Optional[DocumentNode]:
+        """:returns: a document node that can be modified, copying it if it is shared."""
+        node = self.documents.get(doc_id)
+        if node is None:
+            if create:
+                node = self.documents[doc_id] = DocumentNode(generation=self.generation)
+        elif node.generation != self.generation:
+            node = self.documents[doc_id] = node.copy(self.generation)
+        return node
+
+    def read(self, read: Callable[[], T]) -> T:
+        """
+        Calls `read` until no write to the collection overlaps it, for reads that
+        must see the documents and indexes in a consistent state.
+        """
+        while True:
+            sequence = self.sequence
+            if sequence & 1:
+                # Let the writer finish.
+                time.sleep(0)
+                continue
+            try:
+                result = read()
+            except Exception:
+                if self.sequence == sequence:
+                    raise
+                continue
+            if self.sequence == sequence:
+                return result
+
+    def write(self, doc_id: str, fields: Document) -> DocumentNode:
+        self.sequence += 1
+        try:
+            node = self._write_node(doc_id, fields, Timestamp.from_now())
+            for index in self.indexes.values():
+                index.update(doc_id, fields)
+        finally:
+            self.sequence += 1
+        return node
+
+    def write_many(self, writes: Sequence[Tuple[str, Optional[Document]]], timestamp: 'Timestamp'):
+        """
+        Applies the final state of many documents, each listed once, with None
+        for a deletion. Every index is updated a single time for all of them.
+        """
+        self.sequence += 1
+        try:
+            for doc_id, fields in writes:
+                if fields is not None:
+                    self._write_node(doc_id, fields, timestamp)
+                elif self.documents.pop(doc_id, None) is not None:
+                    self._sorted_ids = None
+            for index in self.indexes.values():
+                index.update_many(writes)
+        finally:
+            self.sequence += 1
+
+    def _write_node(self, doc_id: str, fields: Document, timestamp: 'Timestamp') -> DocumentNode:
+        node = self.document(doc_id, create=True)
+        created = not node.exists
+        node.update_time = timestamp
+        # Fields are replaced before the document exists and before the version
+        # changes, so a reader that checks either first never pairs them with
+        # the old fields.
+        node.fields = fields
+        if created:
+            node.create_time = timestamp
+        node.version = next_version()
+        return node
+
+    def remove(self, doc_id: str):
+        self.sequence += 1
+        try:
+            del self.documents[doc_id]
+            self._sorted_ids = None
+            for index in self.indexes.values():
+                index.update(doc_id, None)
+        finally:
+            self.sequence += 1
+
+    def sorted_ids(self) -> List[str]:
+        """
+        :returns: the document ids in ascending order. The list is cached: documents
+            are added in several places, but only ever removed by `remove`, so a
+            change in length is enough to spot additions.
+        """
+        if self._sorted_ids is None or len(self._sorted_ids) != len(self.documents):
+            self._sorted_ids = sorted(self.documents)
+        return self._sorted_ids
+
+    def index(self, field_path: str) -> FieldIndex:
+        """Builds the index on first use, which counts as a write, see `Store.index`."""
+        index = self.indexes.get(field_path)
+        if index is None:
+            index = FieldIndex(field_path)
+            index.build((doc_id, node.fields) for doc_id, node in self.documents.items())
+            self.indexes[field_path] = index
+        return index
+
+    def composite_index(self, fields: IndexFields) -> CompositeIndex:
+        index = self.indexes.get(fields)
+        if index is None:
+            index = CompositeIndex(fields)
+            index.build((doc_id, node.fields) for doc_id, node in self.documents.items())
+            self.indexes[fields] = index
+        return index
+
+
+class _HeldLocks:
+    __slots__ = ('_locks',)
+
+    def __init__(self, locks: Sequence[threading.RLock]) -> None:
+        self._locks = locks
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for lock in reversed(self._locks):
+            lock.release()
+
+
+class Checkpoint:
+    """
+    The state of a store at some point, see `Store.checkpoint`. The registry of
+    collection paths may also be given as a function that builds it, so it is
+    only loaded when needed.
+    """
+    __slots__ = ('collections', 'collection_groups')
+
+    def __init__(self, collections: Dict[str, CollectionNode],
+                 collection_groups: Union[CollectionGroups, Callable[[], CollectionGroups]]) -> None:
+        self.collections = collections
+        self.collection_groups = collection_groups
+
+
+class ResolvedCollection:
+    """
+    The collection node a reference's path resolved to, reused by its later
+    lookups until `Store.epoch` moves on, see `Store.resolve_collection`.
+    Documents of a collection share the resolved node of their parent.
+    """
+    __slots__ = ('path', 'epoch', 'node')
+
+    def __init__(self, path: Sequence[str]) -> None:
+        self.path = path
+        self.epoch = -1
+        self.node = None  # type: Optional[CollectionNode]
+
+
+class Store:
+    """
+    Root of the in-memory node tree. Paths alternate between collection and
+    document ids, e.g. ['users', 'alovelace', 'friends'].
+
+    Checkpoints share the node tree with the store. Taking or restoring one
+    starts a new generation, and from then on the nodes along the path of a
+    write are copied before being modified, so the tree of the checkpoint is
+    never changed.
+
+    Writes hold the locks of the top-level collections they change, see
+    `lock`, so writes to unrelated collections don't wait for each other and a
+    transaction can check what it read and commit as one step. Nodes are
+    only created or copied for a write, with the lock of their path held.
+    Reads never lock: documents and their fields are replaced rather than
+    modified, and reads of a collection's indexes go through
+    `CollectionNode.read`. Checkpoints, restores and clears take every lock.
+
+    Every change is also passed to the listeners of the store once one has been
+    registered, see `mockfirestore.watch`.
+
+    References keep the collection node their path resolved to, so that
+    lookups don't walk the tree from the root every time. `epoch` goes up
+    whenever a collection node stops being part of the tree: when it is copied
+    for a write, when the document it belongs to is deleted, and on restores
+    and clears. It is bumped after the change, so a reference that read the
+    epoch before resolving its path never keeps a node that was replaced.
+    """
+
+    def __init__(self, read_only_snapshots: bool = False, require_indexes: bool = False) -> None:
+        self.collections = {}  # type: Dict[str, CollectionNode]
+        self.read_only_snapshots = read_only_snapshots
+        self.require_indexes = require_indexes
+        # Composite index definitions by collection id.
+        self.index_definitions = {}  # type: Dict[str, List[IndexFields]]
+        # Paths of all the collections with a given id, for collection group queries.
+        self._collection_groups = {}  # type: CollectionGroups
+        self._load_collection_groups = None  # type: Optional[Callable[[], CollectionGroups]]
+        self.generation = 0
+        self._collections_generation = 0
+        self.epoch = 0
+        # Receives every change when the store is durable, see `mockfirestore._wal`.
+        self.log = None  # type: Optional[WriteAheadLog]
+        # Feeds the on_snapshot watches, created with the first one.
+        self.listeners = None  # type: Optional[Listeners]
+        self._locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        # Guards the top-level collections and the registry, shared by all the locks.
+        self._root_lock = threading.RLock()
+
+    def __getstate__(self):
+        # A pickled store is a detached copy of the documents: the locks are
+        # recreated, and the log and listeners stay with the original.
+        state = dict(self.__dict__)
+        del state['_locks'], state['_root_lock']
+        state['log'] = state['listeners'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self._root_lock = threading.RLock()
+
+    @property
+    def collection_groups(self) -> CollectionGroups:
+        if self._load_collection_groups is not None:
+            with self._root_lock:
+                if self._load_collection_groups is not None:
+                    self._collection_groups = self._load_collection_groups()
+                    self._load_collection_groups = None
+        return self._collection_groups
+
+    def lock(self, *paths: Sequence[str]) -> ContextManager:
+        """
+        Holds the locks of the top-level collections of `paths` for a write.
+        Locks are striped: each top-level collection id maps to one of a fixed
+        number, taken in a fixed order so that writes never deadlock.
+        """
+        if len(paths) == 1:
+            return self._locks[hash(paths[0][0]) % LOCK_STRIPES]
+        stripes = sorted({hash(path[0]) % LOCK_STRIPES for path in paths})
+        return _HeldLocks([self._locks[stripe] for stripe in stripes])
+
+    def lock_all(self) -> ContextManager:
+        """Holds every lock, for changes to the whole store."""
+        return _HeldLocks(self._locks)
+
+    def _get_node(self, path: Sequence[str], create: bool,
+                  write: bool) -> Union['Store', DocumentNode, CollectionNode, None]:
+        if create and not write:
+            # Existing nodes are only copied when something has to be added below them.
+            node = self._get_node(path, create=False, write=False)
+            if node is not None:
+                return node
+            write = True
+        if write:
+            # The caller holds the lock of the path, which leaves the top level to guard.
+            with self._root_lock:
+                return self._walk(path, create, write)
+        return self._walk(path, create, write)
+
+    def _walk(self, path: Sequence[str], create: bool,
+              write: bool) -> Union['Store', DocumentNode, CollectionNode, None]:
+        if write and self._collections_generation != self.generation:
+            self.collections = dict(self.collections)
+            self._collections_generation = self.generation
+        node = self
+        for depth, name in enumerate(path):
+            children = node.collections if depth % 2 == 0 else node.documents
+            child = children.get(name)
+            if child is None:
+                if not create:
+                    return None
+                if depth % 2 == 0:
+                    child = children[name] = CollectionNode(self.generation)
+                    self.collection_groups.setdefault(name, set()).add(tuple(path[:depth + 1]))
+                else:
+                    # Like any other change to the documents, see `CollectionNode.read`.
+                    node.sequence += 1
+                    child = children[name] = DocumentNode(generation=self.generation)
+                    node.sequence += 1
+            elif write and child.generation != self.generation:
+                child = children[name] = child.copy(self.generation)
+                if depth % 2 == 0:
+                    self._detached()
+            node = child
+        return node
+
+    def get_collection(self, path: Sequence[str], create: bool = False,
+                       write: bool = False) -> Optional[CollectionNode]:
+        """
+        :param create: creates the collection and its parents if they are missing.
+        :param write: the collection is about to be modified, so it is copied if it
+            is shared with a checkpoint. Nodes returned for a write must not be
+            kept around, and `lock` must be held while using them.
+        """
+        return self._get_node(path, create, write)
+
+    def get_document(self, path: Sequence[str], create: bool = False,
+                     write: bool = False) -> Optional[DocumentNode]:
+        return self._get_node(path, create, write)
+
+    def resolve_collection(self, resolved: ResolvedCollection, create: bool = False,
+                           write: bool = False) -> Optional[CollectionNode]:
+        """
+        `get_collection` for the path of `resolved`, answered from the node it
+        holds when no collection was detached from the tree since it was
+        resolved. For a write, the node must also belong to the current
+        generation, which its parents then do as well.
+        """
+        epoch = self.epoch
+        node = resolved.node
+        if node is not None and resolved.epoch == epoch and (not write or node.generation == self.generation):
+            return node
+        node = self._get_node(resolved.path, create, write)
+        if node is not None:
+            resolved.epoch, resolved.node = epoch, node
+        return node
+
+    def _detached(self):
+        """Called after collection nodes were replaced or removed, so that references resolve them again."""
+        with self._root_lock:
+            self.epoch += 1
+
+    def index(self, path: Sequence[str], collection: CollectionNode,
+              fields: Union[str, IndexFields]) -> Union[FieldIndex, CompositeIndex]:
+        """
+        :returns: an index of a collection looked up for reading, building it
+            with the lock held if it doesn't exist yet.
+        """
+        index = collection.indexes.get(fields)
+        if index is None:
+            with self.lock(path):
+                index = collection.index(fields) if isinstance(fields, str) else collection.composite_index(fields)
+        return index
+
+    def document_version(self, path: Sequence[str]) -> int:
+        """:returns: the version of a document, 0 if it was never written or was deleted."""
+        node = self._get_node(path, create=False, write=False)
+        return 0 if node is None else node.version
+
+    def checkpoint(self) -> Checkpoint:
+        """Captures the documents of the store, in time proportional to the number of collections."""
+        with self.lock_all():
+            self.generation += 1
+            collection_groups = self._load_collection_groups or self._copy_collection_groups(self._collection_groups)
+            return Checkpoint(self.collections, collection_groups)
+
+    def restore(self, checkpoint: Checkpoint):
+        """Puts back the documents of a checkpoint, which can be restored again later."""
+        with self.lock_all():
+            self.generation += 1
+            self.collections = checkpoint.collections
+            self._detached()
+            if callable(checkpoint.collection_groups):
+                self._collection_groups, self._load_collection_groups = {}, checkpoint.collection_groups
+            else:
+                self._collection_groups = self._copy_collection_groups(checkpoint.collection_groups)
+                self._load_collection_groups = None
+            if self.listeners is not None:
+                self.listeners.reset()
+            if self.log is not None:
+                # The log can't describe a restore, so the whole state is compacted instead.
+                self.log.compact()
+
+    def clear(self):
+        """Removes every document, keeping the options and index definitions."""
+        with self.lock_all():
+            self.generation += 1
+            self.collections = {}
+            self._detached()
+            self._collection_groups = {}
+            self._load_collection_groups = None
+            if self.log is not None:
+                self.log.append([(CLEAR,)])
+            if self.listeners is not None:
+                self.listeners.reset()
+
+    @staticmethod
+    def _copy_collection_groups(groups: CollectionGroups) -> CollectionGroups:
+        return {collection_id: set(paths) for collection_id, paths in groups.items()}
+
+    def remove_document(self, path: Sequence[str]):
+        """Removes a document along with its subcollections, if there is one."""
+        with self.lock(path):
+            if self.get_document(path) is None:
+                return
+            collection = self.get_collection(path[:-1], write=True)
+            node = collection.documents[path[-1]]
+            self._unregister_subcollections(path, node)
+            collection.remove(path[-1])
+            if node.collections:
+                self._detached()
+            if self.log is not None:
+                self.log.append([(DELETE, tuple(path))])
+            if self.listeners is not None:
+                self.listeners.notify(self._removals(tuple(path), node))
+
+    def log_write(self, path: Sequence[str], node: DocumentNode):
+        """Records a document written outside of the store's own methods, for the log and listeners."""
+        if self.log is not None:
+            self.log.append([(WRITE, tuple(path), node.fields, node.create_time._timestamp,
+                              node.update_time._timestamp)])
+        if self.listeners is not None:
+            self.listeners.notify([(tuple(path), node)])
+
+    def replay(self, records: Iterable[Tuple]):
+        """Applies records of the write-ahead log, with the times they were written at."""
+        with self.lock_all():
+            for record in records:
+                if record[0] == WRITE:
+                    _, path, fields, create_time, update_time = record
+                    node = self.get_collection(path[:-1], create=True, write=True).write(path[-1], fields)
+                    node.create_time, node.update_time = Timestamp(create_time), Timestamp(update_time)
+                    if self.listeners is not None:
+                        self.listeners.notify([(path, node)])
+                elif record[0] == DELETE:
+                    if self.get_document(record[1]) is not None:
+                        self.remove_document(record[1])
+                else:
+                    self.clear()
+
+    def write_many(self, writes: Dict[Tuple[str, ...], Optional[Document]]) -> 'Timestamp':
+        """
+        Applies the final state of many documents by path, with None for a
+        deletion, resolving each collection once.
+
+        :returns: the update time shared by all the documents.
+        """
+        by_collection = {}  # type: Dict[Tuple[str, ...], List[Tuple[str, Optional[Document]]]]
+        for path, fields in writes.items():
+            by_collection.setdefault(path[:-1], []).append((path[-1], fields))
+
+        with self.lock(*by_collection):
+            timestamp = Timestamp.from_now()
+            records = []
+            changes = []  # type: List[Tuple[Tuple[str, ...], Optional[DocumentNode]]]
+            for collection_path, documents in by_collection.items():
+                creates = any(fields is not None for _, fields in documents)
+                collection = self.get_collection(collection_path, create=creates, write=True)
+                if collection is None:
+                    continue
+                removed = [collection.documents.get(doc_id) for doc_id, _ in documents]
+                for node, (doc_id, fields) in zip(removed, documents):
+                    if fields is None and node is not None:
+                        self._unregister_subcollections(collection_path + (doc_id,), node)
+                        if self.listeners is not None:
+                            changes.extend(self._removals(collection_path + (doc_id,), node))
+                collection.write_many(documents, timestamp)
+                if any(fields is None and node is not None and node.collections
+                       for node, (doc_id, fields) in zip(removed, documents)):
+                    self._detached()
+                if self.listeners is not None:
+                    changes.extend((collection_path + (doc_id,), collection.documents[doc_id])
+                                   for doc_id, fields in documents if fields is not None)
+                if self.log is not None:
+                    records.extend((DELETE, collection_path + (doc_id,)) if fields is None
+                                   else (WRITE, collection_path + (doc_id,), fields,
+                                         collection.documents[doc_id].create_time._timestamp, timestamp._timestamp)
+                                   for doc_id, fields in documents)
+            if records:
+                self.log.append(records)
+            if changes:
+                self.listeners.notify(changes)
+            return timestamp
+
+    def collection_group(self, collection_id: str) -> List[Tuple[str, ...]]:
+        """:returns: the paths of all the collections with the given id, in order."""
+        return sorted(self.collection_groups.get(collection_id, ()))
+
+    def _unregister_subcollections(self, path: Sequence[str], node: DocumentNode):
+        for name, collection in node.collections.items():
+            collection_path = tuple(path) + (name,)
+            self.collection_groups[name].discard(collection_path)
+            for doc_id, document in collection.documents.items():
+                self._unregister_subcollections(collection_path + (doc_id,), document)
+
+    @staticmethod
+    def _removals(path: Tuple[str, ...], node: DocumentNode) -> List[Tuple[Tuple[str, ...], None]]:
+        """:returns: the removal of a document and of every document nested below it, for listeners."""
+        removals = [(path, None)]
+        for name, collection in node.collections.items():
+            for doc_id, document in collection.documents.items():
+                removals.extend(Store._removals(path + (name, doc_id), document))
+        return removals
+
+
+_SCALAR_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+
+def copy_document(value: T) -> T:
+    """
+    Deep copy of document data. Plain dicts and lists are rebuilt directly and
+    immutable values are shared, which is much cheaper than `deepcopy`; any
+    other value is still copied with `deepcopy`.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {key: item if type(item) in _SCALAR_TYPES else copy_document(item)
+                for key, item in value.items()}
+    if value_type is list:
+        return [item if type(item) in _SCALAR_TYPES else copy_document(item) for item in value]
+    if value_type in _SCALAR_TYPES or isinstance(value, dt):
+        return value
+    return deepcopy(value)
 
 
 def get_by_path(data: Dict[str, T], path: Sequence[str], create_nested: bool = False) -> T:
@@ -36,6 +614,34 @@ def delete_by_path(data: Dict[str, T], path: Sequence[str]):
     del get_by_path(data, path[:-1])[path[-1]]
 
 
+def mask_document(document: Document, field_paths: Iterable[str]) -> Document:
+    """
+    :returns: a document with only the given fields of `document`, which share
+        their values with it. A field already selected as a whole is not
+        selected again through one of its subfields.
+    """
+    masked = {}  # type: Document
+    selected = set()  # type: Set[Tuple[str, ...]]
+    for path in sorted((tuple(field_path.split('.')) for field_path in field_paths), key=len):
+        if any(path[:depth] in selected for depth in range(1, len(path))):
+            continue
+        selected.add(path)
+        try:
+            value = reduce(operator.getitem, path, document)
+        except (KeyError, TypeError):
+            continue
+        set_by_path(masked, path, value)
+    return masked
+
+
+def get_by_field_path(document: Document, path: Sequence[str], default: Any = None) -> Any:
+    """Access a field of a document by its split field path, or `default` if it is missing."""
+    try:
+        return reduce(operator.getitem, path, document)
+    except (KeyError, TypeError):
+        return default
+
+
 def generate_random_string():
     return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(20))
 
@@ -0,0 +1,458 @@
+from bisect import bisect_left, insort
+from functools import reduce
+import operator
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+Key = Tuple
+
+# Ranks of the value types, in the order Firestore sorts them.
+_NULL, _BOOLEAN, _NUMBER, _TIMESTAMP, _STRING, _BYTES, _REFERENCE, _GEO_POINT, _ARRAY, _MAP, _OTHER = range(11)
+
+INDEXED_OPERATORS = ('==', 'in', '<', '<=', '>', '>=', 'array_contains', 'array_contains_any')
+EQUALITY_OPERATORS = ('==', 'in')
+ARRAY_OPERATORS = ('array_contains', 'array_contains_any')
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+CONTAINS = 'CONTAINS'
+
+IndexFields = Tuple[Tuple[str, str], ...]
+
+# Below this many writes, entries are moved one at a time rather than re-sorted.
+_BULK_UPDATE_SIZE = 64
+
+
+class _After:
+    """Sorts after any document id, to bisect past every entry with a given key."""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_AFTER = _After()
+
+
+class Descending:
+    """Inverts the ordering of a key, for descending index fields."""
+    __slots__ = ('key',)
+
+    def __init__(self, key) -> None:
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, Descending) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __lt__(self, other):
+        if not isinstance(other, Descending):
+            return NotImplemented
+        return other.key < self.key
+
+    def __gt__(self, other):
+        if not isinstance(other, Descending):
+            return NotImplemented
+        return self.key < other.key
+
+
+def bisect_entries(entries: Sequence[Tuple], keys: Any, doc_id: Any = None, after: bool = False) -> int:
+    """
+    Locates a cursor in index entries of the form (keys, document id, ...), sorted
+    ascending. With a document id the cursor is that exact entry, otherwise it
+    stands for every entry whose keys start with `keys`.
+
+    :returns: the position of the first entry at the cursor, or past it with `after`.
+    """
+    if doc_id is None:
+        return bisect_left(entries, (keys + (_AFTER,),) if after else (keys,))
+    return bisect_left(entries, (keys, doc_id, _AFTER) if after else (keys, doc_id))
+
+
+def _positions(start: int, end: int, reverse: bool) -> range:
+    return range(end - 1, start - 1, -1) if reverse else range(start, end)
+
+
+def value_key(value: Any) -> Key:
+    """
+    :returns: a tuple that orders values the way Firestore does, first by type
+    and then by value within the type. Equal values get equal keys.
+    """
+    if value is None:
+        return (_NULL,)
+    if isinstance(value, bool):
+        return (_BOOLEAN, value)
+    if isinstance(value, (int, float)):
+        return (_NUMBER, value)
+    if hasattr(value, 'timestamp') and hasattr(value, 'isoformat'):
+        return (_TIMESTAMP, value)
+    if isinstance(value, str):
+        return (_STRING, value)
+    if isinstance(value, bytes):
+        return (_BYTES, value)
+    if isinstance(value, (list, tuple)):
+        return (_ARRAY, tuple(value_key(item) for item in value))
+    if isinstance(value, dict):
+        return (_MAP, tuple((k, value_key(v)) for k, v in sorted(value.items())))
+    if hasattr(value, '_path') and hasattr(value, 'parent'):
+        return (_REFERENCE, tuple(value._path))
+    if hasattr(value, 'latitude') and hasattr(value, 'longitude'):
+        return (_GEO_POINT, value.latitude, value.longitude)
+    return (_OTHER, type(value).__name__, repr(value))
+
+
+def _key_set(values: Iterable[Any]) -> Set[Key]:
+    keys = set()
+    for value in values:
+        try:
+            keys.add(value_key(value))
+        except TypeError:
+            # Unhashable keys can't be looked up in an index either.
+            pass
+    return keys
+
+
+def compile_index_filter(field_path: str, op: str, value: Any) -> Callable[[Dict[str, Any]], bool]:
+    """
+    :returns: a predicate matching the fields of a single document the way
+        `FieldIndex.lookup` matches indexed ones: documents missing the field
+        never match, and ranges only compare values of the same type.
+    """
+    path = field_path.split('.')
+
+    def key_of(fields: Dict[str, Any]) -> Optional[Key]:
+        try:
+            return value_key(reduce(operator.getitem, path, fields))
+        except (KeyError, TypeError):
+            return None
+
+    if op in ('in', 'array_contains_any'):
+        keys = _key_set(value)
+    elif op == 'array_contains':
+        keys = _key_set([value])
+
+    if op in ('==', 'in'):
+        if op == '==':
+            keys = _key_set([value])
+
+        def equals(fields: Dict[str, Any]) -> bool:
+            try:
+                return key_of(fields) in keys
+            except TypeError:
+                return False
+        return equals
+    if op in ('array_contains', 'array_contains_any'):
+        def contains(fields: Dict[str, Any]) -> bool:
+            key = key_of(fields)
+            return key is not None and key[0] == _ARRAY and not keys.isdisjoint(key[1])
+        return contains
+
+    compare = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}.get(op)
+    if compare is None:
+        raise ValueError('Operator {} is not indexed'.format(op))
+    operand = value_key(value)
+
+    def in_range(fields: Dict[str, Any]) -> bool:
+        key = key_of(fields)
+        return key is not None and key[0] == operand[0] and compare(key, operand)
+    return in_range
+
+
+class FieldIndex:
+    """
+    Single-field index over the documents of one collection. Entries are kept
+    sorted by (value key, document id); array values are also indexed by element.
+    """
+
+    def __init__(self, field_path: str) -> None:
+        self._path = field_path.split('.')
+        self._entries = []  # type: List[Tuple[Key, str]]
+        self._keys = {}  # type: Dict[str, Key]
+        self._array_members = {}  # type: Dict[Key, Set[str]]
+
+    def add(self, doc_id: str, fields: Dict[str, Any], sort: bool = True):
+        try:
+            value = reduce(operator.getitem, self._path, fields)
+        except (KeyError, TypeError):
+            return
+        key = value_key(value)
+        if sort:
+            insort(self._entries, (key, doc_id))
+        else:
+            self._entries.append((key, doc_id))
+        self._keys[doc_id] = key
+        if key[0] == _ARRAY:
+            for member in set(key[1]):
+                self._array_members.setdefault(member, set()).add(doc_id)
+
+    def build(self, documents: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Adds many documents at once, sorting the entries a single time."""
+        for doc_id, fields in documents:
+            self.add(doc_id, fields, sort=False)
+        self._entries.sort()
+
+    def remove(self, doc_id: str):
+        key = self._forget(doc_id)
+        if key is not None:
+            del self._entries[bisect_left(self._entries, (key, doc_id))]
+
+    def _forget(self, doc_id: str) -> Optional[Key]:
+        """Drops everything but the sorted entry of a document, and returns its key."""
+        key = self._keys.pop(doc_id, None)
+        if key is not None and key[0] == _ARRAY:
+            for member in set(key[1]):
+                members = self._array_members[member]
+                members.discard(doc_id)
+                if not members:
+                    del self._array_members[member]
+        return key
+
+    def update(self, doc_id: str, fields: Optional[Dict[str, Any]]):
+        self.remove(doc_id)
+        if fields is not None:
+            self.add(doc_id, fields)
+
+    def copy(self) -> 'FieldIndex':
+        index = FieldIndex.__new__(FieldIndex)
+        index._path = self._path
+        index._entries = list(self._entries)
+        index._keys = dict(self._keys)
+        index._array_members = {member: set(doc_ids) for member, doc_ids in self._array_members.items()}
+        return index
+
+    def update_many(self, documents: Sequence[Tuple[str, Optional[Dict[str, Any]]]]):
+        """
+        Updates many documents, each listed once, dropping their stale entries in
+        a single pass and sorting the entries once.
+        """
+        if len(documents) < _BULK_UPDATE_SIZE:
+            for doc_id, fields in documents:
+                self.update(doc_id, fields)
+            return
+        stale = set()
+        for doc_id, _ in documents:
+            key = self._forget(doc_id)
+            if key is not None:
+                stale.add((key, doc_id))
+        if stale:
+            self._entries = [entry for entry in self._entries if entry not in stale]
+        for doc_id, fields in documents:
+            if fields is not None:
+                self.add(doc_id, fields, sort=False)
+        self._entries.sort()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def numbers(self) -> List[Any]:
+        """:returns: the numeric values of the field, without booleans."""
+        start, end = self._bisect((_NUMBER,)), self._bisect((_NUMBER + 1,))
+        return [key[1] for key, _ in self._entries[start:end]]
+
+    def position(self, values: Sequence[Any], doc_id: Optional[str] = None, after: bool = False) -> int:
+        """:returns: the position of a cursor at `values`, see `bisect_entries`."""
+        if not values:
+            return len(self._entries) if after else 0
+        return bisect_entries(self._entries, value_key(values[0]), doc_id, after)
+
+    def scan(self, start: int = 0, end: Optional[int] = None, reverse: bool = False) -> Iterator[str]:
+        """:returns: ids of the indexed documents between two positions, in index order."""
+        entries = self._entries
+        return (entries[i][1] for i in _positions(start, len(entries) if end is None else end, reverse))
+
+    def lookup(self, op: str, value: Any) -> Set[str]:
+        """:returns: ids of the documents matching `field op value`."""
+        if op == 'in':
+            return self._union('==', value)
+        if op == 'array_contains':
+            return set(self._array_members.get(value_key(value), ()))
+        if op == 'array_contains_any':
+            return self._union('array_contains', value)
+
+        key = value_key(value)
+        start, end = self._bisect((key[0],)), self._bisect((key[0] + 1,))
+        if op == '==':
+            start, end = self._bisect(key), self._bisect(key, after=True)
+        elif op == '<':
+            end = self._bisect(key)
+        elif op == '<=':
+            end = self._bisect(key, after=True)
+        elif op == '>':
+            start = self._bisect(key, after=True)
+        elif op == '>=':
+            start = self._bisect(key)
+        else:
+            raise ValueError('Operator {} is not indexed'.format(op))
+        return {doc_id for _, doc_id in self._entries[start:end]}
+
+    def _bisect(self, key: Key, after: bool = False) -> int:
+        return bisect_left(self._entries, (key, _AFTER) if after else (key,))
+
+    def _union(self, op: str, values: Iterable[Any]) -> Set[str]:
+        doc_ids = set()
+        for value in values:
+            doc_ids |= self.lookup(op, value)
+        return doc_ids
+
+
+class CompositeIndex:
+    """
+    Index over several fields of one collection, e.g.
+    (('city', 'ASCENDING'), ('population', 'DESCENDING')). Documents missing any
+    of the ordered fields are left out, and ties are broken by document id in the
+    direction of the last field, as Firestore does. Array CONTAINS fields are
+    part of the definition, but are not used to order the entries.
+    """
+
+    def __init__(self, fields: IndexFields) -> None:
+        self.fields = fields
+        self._paths = [(path.split('.'), direction == DESCENDING)
+                       for path, direction in fields if direction != CONTAINS]
+        self._descending_ids = bool(self._paths) and self._paths[-1][1]
+        self._entries = []  # type: List[Tuple[Tuple, Any]]
+        self._keys = {}  # type: Dict[str, Tuple[Tuple, Any]]
+
+    def add(self, doc_id: str, fields: Dict[str, Any], sort: bool = True):
+        keys = []
+        for path, descending in self._paths:
+            try:
+                key = value_key(reduce(operator.getitem, path, fields))
+            except (KeyError, TypeError):
+                return
+            keys.append(Descending(key) if descending else key)
+        entry = (tuple(keys), Descending(doc_id) if self._descending_ids else doc_id)
+        if sort:
+            insort(self._entries, entry)
+        else:
+            self._entries.append(entry)
+        self._keys[doc_id] = entry
+
+    def build(self, documents: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Adds many documents at once, sorting the entries a single time."""
+        for doc_id, fields in documents:
+            self.add(doc_id, fields, sort=False)
+        self._entries.sort()
+
+    def remove(self, doc_id: str):
+        entry = self._keys.pop(doc_id, None)
+        if entry is not None:
+            del self._entries[bisect_left(self._entries, entry)]
+
+    def update(self, doc_id: str, fields: Optional[Dict[str, Any]]):
+        self.remove(doc_id)
+        if fields is not None:
+            self.add(doc_id, fields)
+
+    def copy(self) -> 'CompositeIndex':
+        index = CompositeIndex(self.fields)
+        index._entries = list(self._entries)
+        index._keys = dict(self._keys)
+        return index
+
+    def update_many(self, documents: Sequence[Tuple[str, Optional[Dict[str, Any]]]]):
+        """See `FieldIndex.update_many`."""
+        if len(documents) < _BULK_UPDATE_SIZE:
+            for doc_id, fields in documents:
+                self.update(doc_id, fields)
+            return
+        stale = {self._keys.pop(doc_id) for doc_id, _ in documents if doc_id in self._keys}
+        if stale:
+            self._entries = [entry for entry in self._entries if entry not in stale]
+        for doc_id, fields in documents:
+            if fields is not None:
+                self.add(doc_id, fields, sort=False)
+        self._entries.sort()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def position(self, values: Sequence[Any], doc_id: Optional[str] = None, after: bool = False) -> int:
+        """
+        :returns: the position of a cursor at the values of the leading ordered
+            fields, see `bisect_entries`.
+        """
+        keys = tuple(Descending(value_key(value)) if descending else value_key(value)
+                     for value, (_, descending) in zip(values, self._paths))
+        if doc_id is not None and self._descending_ids:
+            doc_id = Descending(doc_id)
+        return bisect_entries(self._entries, keys, doc_id, after)
+
+    def scan(self, start: int = 0, end: Optional[int] = None, reverse: bool = False) -> Iterator[str]:
+        """:returns: ids of the indexed documents between two positions, in index order."""
+        entries = self._entries
+        for i in _positions(start, len(entries) if end is None else end, reverse):
+            doc_id = entries[i][1]
+            yield doc_id.key if self._descending_ids else doc_id
+
+
+def _split_orders(definition: IndexFields, prefix_fields: Set[str], orders: Sequence[Tuple[str, str]]) \
+        -> Optional[bool]:
+    """
+    Checks whether the ordered fields of an index are `prefix_fields` (in any
+    order and direction) followed by `orders`.
+
+    :returns: None if they are not, otherwise whether the index has to be read
+        in reverse to produce `orders`.
+    """
+    ordered = [(path, direction) for path, direction in definition if direction != CONTAINS]
+    prefix, rest = ordered[:len(prefix_fields)], ordered[len(prefix_fields):]
+    if {path for path, _ in prefix} != prefix_fields or len(rest) != len(orders):
+        return None
+    if [path for path, _ in rest] != [path for path, _ in orders]:
+        return None
+    directions = [direction == DESCENDING for _, direction in rest]
+    wanted = [direction == DESCENDING for _, direction in orders]
+    if directions == wanted:
+        return False
+    if directions == [not direction for direction in wanted]:
+        return True
+    return None
+
+
+def find_scan_index(definitions: Iterable[IndexFields], equality_fields: Set[str],
+                    orders: Sequence[Tuple[str, str]]) -> Optional[Tuple[IndexFields, bool]]:
+    """
+    :returns: an index definition that lists the documents matching
+        `equality_fields` in `orders` order, and whether to read it in reverse.
+    """
+    for definition in definitions:
+        if any(direction == CONTAINS for _, direction in definition):
+            continue
+        reverse = _split_orders(definition, equality_fields, orders)
+        if reverse is not None:
+            return definition, reverse
+    return None
+
+
+def needs_composite_index(filters: Sequence[Tuple[str, str]], orders: Sequence[Tuple[str, str]]) -> bool:
+    """
+    Queries on a single field, or with only equality and array-contains
+    filters, are served from single-field indexes. Anything else needs a
+    composite index.
+    """
+    fields = {field for field, _ in filters} | {field for field, _ in orders}
+    if len(fields) <= 1:
+        return False
+    if orders:
+        return True
+    return any(op not in EQUALITY_OPERATORS + ARRAY_OPERATORS for _, op in filters)
+
+
+def satisfies(definition: IndexFields, filters: Sequence[Tuple[str, str]],
+              orders: Sequence[Tuple[str, str]]) -> bool:
+    """Checks whether a composite index can serve a query with these filters and orders."""
+    array_fields = {field for field, op in filters if op in ARRAY_OPERATORS}
+    if {path for path, direction in definition if direction == CONTAINS} != array_fields:
+        return False
+
+    equality_fields = {field for field, op in filters if op in EQUALITY_OPERATORS}
+    range_fields = {field for field, op in filters
+                    if op not in EQUALITY_OPERATORS + ARRAY_OPERATORS}
+    if not orders:
+        orders = [(field, ASCENDING) for field in range_fields]
+    if len(range_fields) > 1 or (range_fields and orders[0][0] not in range_fields):
+        return False
+    return _split_orders(definition, equality_fields, orders) is not None
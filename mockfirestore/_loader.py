@@ -0,0 +1,106 @@
+import io
+import json
+from typing import IO, Any, Iterator, Tuple
+
+from mockfirestore._helpers import Document
+
+_CHUNK_SIZE = 1 << 16
+_WHITESPACE = ' \t\n\r'
+
+
+def as_text(file: IO) -> IO[str]:
+    """Wraps binary files, so both kinds can be parsed the same way."""
+    if isinstance(file.read(0), bytes):
+        return io.TextIOWrapper(file, encoding='utf-8')
+    return file
+
+
+def iter_ndjson_documents(file: IO[str]) -> Iterator[Tuple[str, Document]]:
+    """
+    Reads one document per line, as {"path": "users/alovelace", "data": {...}}.
+    Only a line is held in memory at a time.
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        try:
+            path, data = record['path'], record['data']
+        except (KeyError, TypeError):
+            raise ValueError('Line {} is not a {{"path": ..., "data": ...}} object'.format(number))
+        yield path, data
+
+
+class _JSONStream:
+    """Buffered reader that decodes one JSON value at a time from a text file."""
+
+    def __init__(self, file: IO[str]) -> None:
+        self._file = file
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+        # Reading at least as much as is left keeps re-decoding a large value linear.
+        chunk = self._file.read(max(_CHUNK_SIZE, len(self._buffer) - self._position))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def peek(self) -> str:
+        """:returns: the next character that is not whitespace, or '' at the end."""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_more():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """Consumes the next character that is not whitespace, which must be one of `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected one of {!r} at {!r}'.format(chars, self._buffer[self._position:self._position + 20]))
+        self._position += 1
+        return char
+
+    def value(self) -> Any:
+        """Decodes the next value, reading further until it is complete."""
+        decoder = json.JSONDecoder()
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._read_more():
+                    continue
+                raise
+            self._position = end
+            return value
+
+
+def iter_json_documents(file: IO[str]) -> Iterator[Tuple[str, Document]]:
+    """
+    Reads an object mapping document paths to their fields, e.g.
+    {"users/alovelace": {...}, "users/alovelace/friends/cbabbage": {...}}.
+    The object is decoded one document at a time, so the whole file is never
+    held in memory.
+    """
+    stream = _JSONStream(file)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        path = stream.value()
+        if not isinstance(path, str):
+            raise ValueError('Expected a document path, found {!r}'.format(path))
+        stream.expect(':')
+        yield path, stream.value()
+        if stream.expect(',}') == '}':
+            return
@@ -0,0 +1,314 @@
+"""
+Binary snapshot files of a store, which are memory-mapped read-only so that
+several processes can share one copy of a large fixture.
+
+Layout, little-endian:
+    header       magic, offset of the root collections table, offset of the
+                 collection paths
+    fields       one pickle per document
+    collection   document count, the offsets of the document entries, then
+                 the entries sorted by id: id length, fields offset and length,
+                 create and update times (NaN if unset), offset of the
+                 subcollections table (0 if none), id
+    table        collection count, then for each collection: name length,
+                 offset of the collection, name
+    paths        a pickle of every collection path
+
+Collections and tables are written after everything they point to. When
+reading, single documents are found by bisecting the entries of their
+collection, whose other documents are only decoded once it is iterated.
+The fields of a document are decoded when they are first read.
+"""
+import io
+import math
+import mmap
+import os
+import pickle
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Mapping, Tuple
+
+from mockfirestore._helpers import (
+    Checkpoint, CollectionGroups, CollectionNode, DocumentNode, Store, Timestamp, next_version
+)
+from mockfirestore.document import DocumentReference
+
+MAGIC = b'MFSNAP01'
+_HEADER = struct.Struct('<8sQQ')
+_COUNT = struct.Struct('<I')
+_DOCUMENT = struct.Struct('<IQIddQ')
+_COLLECTION = struct.Struct('<IQ')
+_LENGTH = _OFFSET = struct.Struct('<Q')
+
+# Snapshot nodes are never modified: every write copies them into the tree first.
+_SHARED = -1
+
+
+class _Pickler(pickle.Pickler):
+    """Pickles references to other documents as their path, leaving the store out."""
+
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, DocumentReference):
+            return tuple(obj._path)
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    """Binds the references pickled by `_Pickler` to a store."""
+
+    def __init__(self, file: BinaryIO, store: Store) -> None:
+        super().__init__(file)
+        self._store = store
+
+    def persistent_load(self, path: Tuple[str, ...]) -> DocumentReference:
+        from mockfirestore.collection import CollectionReference
+        parent = CollectionReference(self._store, list(path[:-1]))
+        return DocumentReference(self._store, list(path), parent=parent)
+
+
+def dumps(value: Any) -> bytes:
+    """Pickles document data, keeping references to other documents by path."""
+    out = io.BytesIO()
+    _Pickler(out, pickle.HIGHEST_PROTOCOL).dump(value)
+    return out.getvalue()
+
+
+def loads(data: Any, store: Store) -> Any:
+    """Unpickles document data, with references to other documents of `store`."""
+    return _Unpickler(io.BytesIO(data), store).load()
+
+
+def _time(timestamp: Any) -> float:
+    return math.nan if timestamp is None else timestamp._timestamp
+
+
+def _timestamp(value: float) -> Any:
+    return None if math.isnan(value) else Timestamp(value)
+
+
+def _write_collections(out: BinaryIO, collections: Dict[str, CollectionNode]) -> int:
+    offsets = [(name, _write_collection(out, collection)) for name, collection in collections.items()]
+    offset = out.tell()
+    out.write(_COUNT.pack(len(offsets)))
+    for name, collection_offset in offsets:
+        encoded = name.encode('utf-8')
+        out.write(_COLLECTION.pack(len(encoded), collection_offset))
+        out.write(encoded)
+    return offset
+
+
+def _write_collection(out: BinaryIO, collection: CollectionNode) -> int:
+    entries = []
+    for doc_id, node in collection.documents.items():
+        fields = dumps(node.fields)
+        fields_offset = out.tell()
+        out.write(fields)
+        collections_offset = _write_collections(out, node.collections) if node.collections else 0
+        entries.append((doc_id.encode('utf-8'), fields_offset, len(fields),
+                        _time(node.create_time), _time(node.update_time), collections_offset))
+    entries.sort()
+    offset = out.tell()
+    out.write(_COUNT.pack(len(entries)))
+    entry_offset = offset + _COUNT.size + _OFFSET.size * len(entries)
+    for entry in entries:
+        out.write(_OFFSET.pack(entry_offset))
+        entry_offset += _DOCUMENT.size + len(entry[0])
+    for encoded, fields_offset, fields_length, create_time, update_time, collections_offset in entries:
+        out.write(_DOCUMENT.pack(len(encoded), fields_offset, fields_length,
+                                 create_time, update_time, collections_offset))
+        out.write(encoded)
+    return offset
+
+
+def write_snapshot_file(store: Store, path: str, sync: bool = False):
+    """:param sync: whether to fsync the file before returning."""
+    with open(path, 'wb') as out:
+        out.write(_HEADER.pack(MAGIC, 0, 0))
+        root_offset = _write_collections(out, store.collections)
+        paths = dumps([path for paths in store.collection_groups.values() for path in paths])
+        paths_offset = out.tell()
+        out.write(_LENGTH.pack(len(paths)))
+        out.write(paths)
+        out.seek(0)
+        out.write(_HEADER.pack(MAGIC, root_offset, paths_offset))
+        if sync:
+            out.flush()
+            os.fsync(out.fileno())
+
+
+class _SnapshotDocumentNode(DocumentNode):
+    """A document whose fields and subcollections are decoded on first access."""
+    __slots__ = ('_file', '_fields', '_fields_offset', '_fields_length', '_collections', '_collections_offset')
+
+    def __init__(self, file: '_SnapshotFile', fields_offset: int, fields_length: int,
+                 collections_offset: int, create_time: Any, update_time: Any) -> None:
+        self._file = file
+        self._fields = None
+        self._fields_offset = fields_offset
+        self._fields_length = fields_length
+        self._collections = None
+        self._collections_offset = collections_offset
+        self.create_time = create_time
+        self.update_time = update_time
+        self.generation = _SHARED
+        self.version = next_version()
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        if self._fields is None:
+            self._fields = self._file.load(self._fields_offset, self._fields_length)
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields: Dict[str, Any]):
+        self._fields = fields
+
+    @property
+    def collections(self) -> Dict[str, CollectionNode]:
+        if self._collections is None:
+            self._collections = self._file.collections(self._collections_offset) if self._collections_offset else {}
+        return self._collections
+
+    @collections.setter
+    def collections(self, collections: Dict[str, CollectionNode]):
+        self._collections = collections
+
+
+class _SnapshotCollectionNode(CollectionNode):
+    """A collection whose documents are decoded on first access."""
+    __slots__ = ('_file', '_offset', '_documents')
+
+    def __init__(self, file: '_SnapshotFile', offset: int) -> None:
+        self._file = file
+        self._offset = offset
+        self._documents = None
+        self.indexes = {}
+        self._sorted_ids = None
+        self.generation = _SHARED
+        self.sequence = 0
+
+    @property
+    def documents(self) -> Mapping[str, DocumentNode]:
+        if self._documents is None:
+            self._documents = self._file.documents(self._offset)
+        return self._documents
+
+    @documents.setter
+    def documents(self, documents: Mapping[str, DocumentNode]):
+        self._documents = documents
+
+
+class _SnapshotDocuments(Mapping):
+    """
+    The documents of a snapshot collection. Looking up a document bisects the
+    entries, which are sorted by id; iterating decodes them all once.
+    """
+
+    def __init__(self, file: '_SnapshotFile', offset: int) -> None:
+        self._file = file
+        self._offset = offset
+        self._count = file.count(offset)
+        self._nodes = {}  # type: Dict[str, DocumentNode]
+        self._complete = False
+
+    def _node(self, position: int) -> Tuple[str, DocumentNode]:
+        doc_id, fields_offset, fields_length, collections_offset, create_time, update_time = self._file.entry(
+            self._file.entry_offset(self._offset, position))
+        node = self._nodes.get(doc_id)
+        if node is None:
+            # Concurrent readers may decode the same entry, but keep the same node.
+            node = self._nodes.setdefault(doc_id, _SnapshotDocumentNode(
+                self._file, fields_offset, fields_length, collections_offset,
+                _timestamp(create_time), _timestamp(update_time)))
+        return doc_id, node
+
+    def __getitem__(self, doc_id: str) -> DocumentNode:
+        node = self._nodes.get(doc_id)
+        if node is not None or self._complete:
+            if node is None:
+                raise KeyError(doc_id)
+            return node
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_id = self._file.entry(self._file.entry_offset(self._offset, middle))[0]
+            if middle_id < doc_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            found_id, node = self._node(low)
+            if found_id == doc_id:
+                return node
+        raise KeyError(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        if not self._complete:
+            for position in range(self._count):
+                self._node(position)
+            self._complete = True
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class _SnapshotFile:
+    def __init__(self, path: str, store: Store) -> None:
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.root_offset, self._paths_offset = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a snapshot file'.format(path))
+        self._store = store
+
+    def load(self, offset: int, length: int) -> Any:
+        with memoryview(self._buffer)[offset:offset + length] as data:
+            return loads(data, self._store)
+
+    def collections(self, offset: int) -> Dict[str, CollectionNode]:
+        buffer = self._buffer
+        count, = _COUNT.unpack_from(buffer, offset)
+        offset += _COUNT.size
+        collections = {}
+        for _ in range(count):
+            name_length, collection_offset = _COLLECTION.unpack_from(buffer, offset)
+            offset += _COLLECTION.size
+            name = buffer[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            collections[name] = _SnapshotCollectionNode(self, collection_offset)
+        return collections
+
+    def documents(self, offset: int) -> '_SnapshotDocuments':
+        return _SnapshotDocuments(self, offset)
+
+    def entry(self, offset: int) -> Tuple[str, int, int, int, float, float]:
+        """:returns: the document entry at an offset, as (id, end of the entry, ...)."""
+        id_length, fields_offset, fields_length, create_time, update_time, collections_offset = _DOCUMENT.unpack_from(
+            self._buffer, offset)
+        offset += _DOCUMENT.size
+        doc_id = self._buffer[offset:offset + id_length].decode('utf-8')
+        return doc_id, fields_offset, fields_length, collections_offset, create_time, update_time
+
+    def entry_offset(self, offset: int, position: int) -> int:
+        return _OFFSET.unpack_from(self._buffer, offset + _COUNT.size + _OFFSET.size * position)[0]
+
+    def count(self, offset: int) -> int:
+        return _COUNT.unpack_from(self._buffer, offset)[0]
+
+    def collection_groups(self) -> CollectionGroups:
+        length, = _LENGTH.unpack_from(self._buffer, self._paths_offset)
+        offset = self._paths_offset + _LENGTH.size
+        groups = {}  # type: CollectionGroups
+        paths = self.load(offset, length)  # type: List[Tuple[str, ...]]
+        for path in paths:
+            groups.setdefault(path[-1], set()).add(path)
+        return groups
+
+
+def open_snapshot_file(path: str, store: Store) -> Checkpoint:
+    """
+    :returns: a checkpoint of the documents in the file, for `store`. Only the
+        top-level collection names are read until the data is accessed.
+    """
+    snapshot = _SnapshotFile(path, store)
+    return Checkpoint(snapshot.collections(snapshot.root_offset), snapshot.collection_groups)
@@ -0,0 +1,159 @@
+"""
+Write-ahead log that makes a store durable across restarts. A data directory
+holds, for the current epoch n:
+
+    snapshot.<n>.mfs    the state when the log was last compacted (none for 0)
+    log.<n>             groups of changes since then, each framed as
+                        length, crc32, pickled records
+
+Every group is written to the log as soon as it is complete, so it survives
+the process exiting. fsync is batched: groups written within `sync_interval`
+seconds share one, done by a background timer, so at most that much is lost
+if the machine itself goes down. With `sync_interval=0` every group is synced
+before the write returns.
+
+Compaction writes the whole store as the snapshot of the next epoch, then
+starts its empty log, so a crash at any point leaves one complete epoch to
+recover from. Once the log grows past `compact_size`, compaction runs on a
+background thread. On recovery the snapshot is memory-mapped, the log replayed,
+and a torn or corrupt group at the end of the log is discarded.
+"""
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+from mockfirestore._helpers import Store
+from mockfirestore._snapshot_file import dumps, loads, open_snapshot_file, write_snapshot_file
+
+_FRAME = struct.Struct('<II')
+_SNAPSHOT_NAME = re.compile(r'^snapshot\.(\d+)\.mfs$')
+_LOG_NAME = re.compile(r'^log\.(\d+)$')
+
+DEFAULT_SYNC_INTERVAL = 0.05
+DEFAULT_COMPACT_SIZE = 64 << 20
+
+
+def _sync_directory(directory: str):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, store: Store, directory: str, sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 compact_size: int = DEFAULT_COMPACT_SIZE) -> None:
+        self._store = store
+        self._directory = directory
+        self._sync_interval = sync_interval
+        self._compact_size = compact_size
+        self._lock = threading.RLock()
+        self._timer = None  # type: Optional[threading.Timer]
+        self._compacting = False
+        os.makedirs(directory, exist_ok=True)
+        self._epoch = self._recover()
+        self._file = open(self._log_path(self._epoch), 'ab')
+        self._size = self._file.tell()
+        store.log = self
+
+    def _snapshot_path(self, epoch: int) -> str:
+        return os.path.join(self._directory, 'snapshot.{}.mfs'.format(epoch))
+
+    def _log_path(self, epoch: int) -> str:
+        return os.path.join(self._directory, 'log.{}'.format(epoch))
+
+    def _recover(self) -> int:
+        """Loads the latest snapshot and replays its log. :returns: the epoch recovered."""
+        names = os.listdir(self._directory)
+        epochs = [int(match.group(1)) for match in map(_SNAPSHOT_NAME.match, names) if match]
+        epoch = max(epochs, default=0)
+        if epoch:
+            self._store.restore(open_snapshot_file(self._snapshot_path(epoch), self._store))
+
+        log_path = self._log_path(epoch)
+        if os.path.exists(log_path):
+            with open(log_path, 'r+b') as f:
+                data = f.read()
+                end = self._replay(data)
+                if end < len(data):
+                    f.truncate(end)
+
+        for name in names:
+            match = _SNAPSHOT_NAME.match(name) or _LOG_NAME.match(name)
+            if (match and int(match.group(1)) != epoch) or name.endswith('.tmp'):
+                os.remove(os.path.join(self._directory, name))
+        return epoch
+
+    def _replay(self, data: bytes) -> int:
+        """:returns: the end of the last complete group."""
+        position = 0
+        while position + _FRAME.size <= len(data):
+            length, checksum = _FRAME.unpack_from(data, position)
+            start, end = position + _FRAME.size, position + _FRAME.size + length
+            payload = data[start:end]
+            if end > len(data) or zlib.crc32(payload) != checksum:
+                break
+            self._store.replay(loads(payload, self._store))
+            position = end
+        return position
+
+    def append(self, records: List[Tuple]):
+        """Logs a group of records that must be recovered all together or not at all."""
+        payload = dumps(records)
+        with self._lock:
+            self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            self._size += _FRAME.size + len(payload)
+            if self._sync_interval <= 0:
+                os.fsync(self._file.fileno())
+            elif self._timer is None:
+                self._timer = threading.Timer(self._sync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+        if self._size >= self._compact_size and not self._compacting:
+            # The writer holds locks that compaction has to wait for, so it runs on its own thread.
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def sync(self):
+        with self._lock:
+            self._timer = None
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def compact(self):
+        """Starts a new epoch from a snapshot of the whole store, with an empty log."""
+        with self._store.lock_all(), self._lock:
+            self._compacting = False
+            if self._file.closed:
+                return
+            epoch = self._epoch + 1
+            snapshot_path = self._snapshot_path(epoch)
+            write_snapshot_file(self._store, snapshot_path + '.tmp', sync=True)
+            os.replace(snapshot_path + '.tmp', snapshot_path)
+            _sync_directory(self._directory)
+
+            self._file.close()
+            self._file = open(self._log_path(epoch), 'ab')
+            self._size = 0
+            for path in (self._snapshot_path(self._epoch), self._log_path(self._epoch)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._epoch = epoch
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+        if self._store.log is self:
+            self._store.log = None
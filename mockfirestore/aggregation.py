@@ -0,0 +1,64 @@
+from typing import Any, Iterator, List, Optional, Tuple
+
+from mockfirestore._helpers import Timestamp
+
+COUNT, SUM, AVG = 'count', 'sum', 'avg'
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: Any, read_time: Optional[Timestamp] = None) -> None:
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class AggregationQuery:
+    """
+    Aggregations over the results of a query, mirroring
+    https://googleapis.dev/python/firestore/latest/aggregation.html
+
+    Results are computed from the stored documents without building snapshots:
+    counts come straight from the indexes when the filters allow it, and sums
+    and averages over a whole collection from an existing index on the field.
+    """
+
+    def __init__(self, nested_query: 'Query') -> None:
+        self._nested_query = nested_query
+        self._aggregations = []  # type: List[Tuple[str, Optional[str], str]]
+
+    def _add(self, kind: str, field_path: Optional[str], alias: Optional[str]) -> 'AggregationQuery':
+        if alias is None:
+            alias = 'field_{}'.format(len(self._aggregations) + 1)
+        self._aggregations.append((kind, field_path, alias))
+        return self
+
+    def count(self, alias: Optional[str] = None) -> 'AggregationQuery':
+        return self._add(COUNT, None, alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> 'AggregationQuery':
+        return self._add(SUM, field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> 'AggregationQuery':
+        return self._add(AVG, field_ref, alias)
+
+    def get(self, transaction=None) -> List[List[AggregationResult]]:
+        return list(self.stream(transaction))
+
+    def stream(self, transaction=None) -> Iterator[List[AggregationResult]]:
+        read_time = Timestamp.from_now()
+        if transaction is not None:
+            # Documents read in a transaction are recorded, which needs their snapshots.
+            documents = [snapshot._stored for snapshot in transaction._read(self._nested_query.stream())
+                         if snapshot.exists]
+        results = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == COUNT:
+                value = len(documents) if transaction is not None else self._nested_query._count()
+            else:
+                numbers = self._nested_query._numbers(field_path, None if transaction is None else documents)
+                if kind == SUM:
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(AggregationResult(alias, value, read_time))
+        yield results
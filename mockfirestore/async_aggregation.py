@@ -0,0 +1,32 @@
+from typing import AsyncIterator, List, Optional
+
+from mockfirestore.aggregation import AggregationQuery, AggregationResult
+
+
+class AsyncAggregationQuery:
+    """
+    Async counterpart of `AggregationQuery`, mirroring
+    https://googleapis.dev/python/firestore/latest/aggregation.html#google.cloud.firestore_v1.async_aggregation.AsyncAggregationQuery
+    """
+
+    def __init__(self, aggregation_query: AggregationQuery) -> None:
+        self._aggregation_query = aggregation_query
+
+    def count(self, alias: Optional[str] = None) -> 'AsyncAggregationQuery':
+        self._aggregation_query.count(alias)
+        return self
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> 'AsyncAggregationQuery':
+        self._aggregation_query.sum(field_ref, alias)
+        return self
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> 'AsyncAggregationQuery':
+        self._aggregation_query.avg(field_ref, alias)
+        return self
+
+    async def get(self, transaction=None) -> List[List[AggregationResult]]:
+        return [results async for results in self.stream(transaction)]
+
+    async def stream(self, transaction=None) -> AsyncIterator[List[AggregationResult]]:
+        for results in self._aggregation_query.stream(None if transaction is None else transaction._transaction):
+            yield results
@@ -0,0 +1,47 @@
+from typing import Any, Dict, List
+
+from mockfirestore.async_document import AsyncDocumentReference
+from mockfirestore.batch import WriteBatch, WriteResult
+
+
+class AsyncWriteBatch:
+    """
+    Async counterpart of `WriteBatch`, mirroring
+    https://googleapis.dev/python/firestore/latest/batch.html#google.cloud.firestore_v1.async_batch.AsyncWriteBatch
+    """
+
+    def __init__(self, batch: WriteBatch) -> None:
+        self._batch = batch
+
+    def __len__(self):
+        return len(self._batch)
+
+    @property
+    def write_results(self):
+        return self._batch.write_results
+
+    @property
+    def commit_time(self):
+        return self._batch.commit_time
+
+    def create(self, reference: AsyncDocumentReference, document_data: Dict[str, Any]):
+        self._batch.create(reference._reference, document_data)
+
+    def set(self, reference: AsyncDocumentReference, document_data: Dict[str, Any], merge=False):
+        self._batch.set(reference._reference, document_data, merge=merge)
+
+    def update(self, reference: AsyncDocumentReference, field_updates: Dict[str, Any], option=None):
+        self._batch.update(reference._reference, field_updates, option)
+
+    def delete(self, reference: AsyncDocumentReference, option=None):
+        self._batch.delete(reference._reference, option)
+
+    async def commit(self) -> List[WriteResult]:
+        return self._batch.commit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.commit()
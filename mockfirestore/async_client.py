@@ -0,0 +1,92 @@
+from typing import AsyncIterator, Dict, IO, Iterable, Mapping, Optional, Sequence, Tuple, Union
+
+from mockfirestore._helpers import Checkpoint, Document
+from mockfirestore._wal import DEFAULT_SYNC_INTERVAL
+from mockfirestore.async_batch import AsyncWriteBatch
+from mockfirestore.async_collection import AsyncCollectionReference
+from mockfirestore.async_document import AsyncDocumentReference, stream_snapshots
+from mockfirestore.async_query import AsyncQuery
+from mockfirestore.async_transaction import AsyncTransaction
+from mockfirestore.client import MockFirestore
+from mockfirestore.document import DocumentSnapshot
+
+
+class AsyncMockFirestore:
+    """
+    Async counterpart of `MockFirestore`, in the same way as
+    `google.cloud.firestore.AsyncClient` is of `Client`. Documents are read
+    and written straight away, so awaiting never waits, but streams hand
+    control back to the event loop every so often.
+    """
+
+    def __init__(self, read_only_snapshots: bool = False, require_indexes: bool = False,
+                 data_dir: Optional[str] = None, sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 nested_collections: bool = False) -> None:
+        self._client = MockFirestore(read_only_snapshots=read_only_snapshots, require_indexes=require_indexes,
+                                     data_dir=data_dir, sync_interval=sync_interval,
+                                     nested_collections=nested_collections)
+        self._store = self._client._store
+
+    @property
+    def _data(self) -> Mapping[str, Mapping[str, Document]]:
+        return self._client._data
+
+    @_data.setter
+    def _data(self, data: Dict[str, Dict[str, Document]]):
+        self._client._data = data
+
+    def document(self, path: str) -> AsyncDocumentReference:
+        return AsyncDocumentReference(self._client.document(path))
+
+    def collection(self, path: str) -> AsyncCollectionReference:
+        return AsyncCollectionReference(self._client.collection(path))
+
+    def collection_group(self, collection_id: str) -> AsyncQuery:
+        return AsyncQuery(self._client.collection_group(collection_id))
+
+    async def collections(self) -> AsyncIterator[AsyncCollectionReference]:
+        for collection in self._client.collections():
+            yield AsyncCollectionReference(collection)
+
+    def get_all(self, references: Iterable[AsyncDocumentReference],
+                field_paths=None,
+                transaction: Optional[AsyncTransaction] = None) -> AsyncIterator[DocumentSnapshot]:
+        return stream_snapshots(self._client.get_all(
+            [reference._reference for reference in references], field_paths,
+            None if transaction is None else transaction._transaction))
+
+    def transaction(self, **kwargs) -> AsyncTransaction:
+        return AsyncTransaction(self._client.transaction(**kwargs))
+
+    def batch(self) -> AsyncWriteBatch:
+        return AsyncWriteBatch(self._client.batch())
+
+    def reset(self):
+        self._client.reset()
+
+    def checkpoint(self) -> Checkpoint:
+        return self._client.checkpoint()
+
+    def restore(self, checkpoint: Checkpoint):
+        self._client.restore(checkpoint)
+
+    def compact(self):
+        self._client.compact()
+
+    def close(self):
+        self._client.close()
+
+    def save_snapshot(self, path: str):
+        self._client.save_snapshot(path)
+
+    def load_snapshot(self, path: str) -> Checkpoint:
+        return self._client.load_snapshot(path)
+
+    def add_index(self, collection_id: str, fields: Sequence[Tuple[str, str]]):
+        self._client.add_index(collection_id, fields)
+
+    def load_indexes(self, path_or_file: Union[str, IO]):
+        self._client.load_indexes(path_or_file)
+
+    def load(self, path_or_file: Union[str, IO], format: str = 'ndjson', **kwargs) -> int:
+        return self._client.load(path_or_file, format, **kwargs)
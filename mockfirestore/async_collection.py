@@ -0,0 +1,85 @@
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from mockfirestore._helpers import Timestamp
+from mockfirestore.async_aggregation import AsyncAggregationQuery
+from mockfirestore.async_document import AsyncDocumentReference, stream_snapshots
+from mockfirestore.async_query import AsyncQuery
+from mockfirestore.collection import CollectionReference
+from mockfirestore.document import DocumentSnapshot
+
+
+class AsyncCollectionReference:
+    """
+    Async counterpart of `CollectionReference`, mirroring
+    https://googleapis.dev/python/firestore/latest/collection.html#google.cloud.firestore_v1.async_collection.AsyncCollectionReference
+    """
+
+    def __init__(self, reference: CollectionReference) -> None:
+        self._reference = reference
+
+    @property
+    def _path(self) -> List[str]:
+        return self._reference._path
+
+    @property
+    def id(self):
+        return self._reference._path[-1]
+
+    @property
+    def parent(self) -> Optional[AsyncDocumentReference]:
+        parent = self._reference.parent
+        return None if parent is None else AsyncDocumentReference(parent)
+
+    def document(self, document_id: Optional[str] = None) -> AsyncDocumentReference:
+        return AsyncDocumentReference(self._reference.document(document_id))
+
+    async def add(self, document_data: Dict, document_id: str = None) \
+            -> Tuple[Timestamp, AsyncDocumentReference]:
+        timestamp, reference = self._reference.add(document_data, document_id)
+        return timestamp, AsyncDocumentReference(reference)
+
+    def stream(self, transaction=None) -> AsyncIterator[DocumentSnapshot]:
+        return stream_snapshots(self._reference.stream(None if transaction is None else transaction._transaction))
+
+    async def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return [snapshot async for snapshot in self.stream(transaction)]
+
+    async def list_documents(self, page_size: Optional[int] = None) -> AsyncIterator[AsyncDocumentReference]:
+        for reference in self._reference.list_documents(page_size):
+            yield AsyncDocumentReference(reference)
+
+    def count(self, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._reference.count(alias))
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._reference.sum(field_ref, alias))
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._reference.avg(field_ref, alias))
+
+    def select(self, field_paths: Iterable[str]) -> AsyncQuery:
+        return AsyncQuery(self._reference.select(field_paths))
+
+    def where(self, field: str, op: str, value: Any) -> AsyncQuery:
+        return AsyncQuery(self._reference.where(field, op, value))
+
+    def order_by(self, key: str, direction: Optional[str] = None) -> AsyncQuery:
+        return AsyncQuery(self._reference.order_by(key, direction))
+
+    def limit(self, limit_amount: int) -> AsyncQuery:
+        return AsyncQuery(self._reference.limit(limit_amount))
+
+    def offset(self, offset: int) -> AsyncQuery:
+        return AsyncQuery(self._reference.offset(offset))
+
+    def start_at(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> AsyncQuery:
+        return AsyncQuery(self._reference.start_at(document_fields_or_snapshot))
+
+    def start_after(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> AsyncQuery:
+        return AsyncQuery(self._reference.start_after(document_fields_or_snapshot))
+
+    def end_at(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> AsyncQuery:
+        return AsyncQuery(self._reference.end_at(document_fields_or_snapshot))
+
+    def end_before(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> AsyncQuery:
+        return AsyncQuery(self._reference.end_before(document_fields_or_snapshot))
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from mockfirestore.batch import CREATE, StagedWrites
+from mockfirestore.document import DocumentReference, DocumentSnapshot
+
+# Documents streamed between two yields to the event loop.
+YIELD_INTERVAL = 100
+
+
+async def stream_snapshots(snapshots: Iterable[DocumentSnapshot]) -> AsyncIterator[DocumentSnapshot]:
+    """
+    Streams snapshots read from the store, with async references. Control goes
+    back to the event loop every `YIELD_INTERVAL` documents, so a large scan
+    doesn't hold up other tasks.
+    """
+    for count, snapshot in enumerate(snapshots, 1):
+        snapshot.reference = AsyncDocumentReference(snapshot.reference)
+        yield snapshot
+        if count % YIELD_INTERVAL == 0:
+            await asyncio.sleep(0)
+
+
+class AsyncDocumentReference:
+    """
+    Async counterpart of `DocumentReference`, mirroring
+    https://googleapis.dev/python/firestore/latest/document.html#google.cloud.firestore_v1.async_document.AsyncDocumentReference
+    """
+
+    def __init__(self, reference: DocumentReference) -> None:
+        self._reference = reference
+
+    @property
+    def _data(self):
+        return self._reference._data
+
+    @property
+    def _path(self) -> List[str]:
+        return self._reference._path
+
+    @property
+    def id(self):
+        return self._reference.id
+
+    def __eq__(self, other):
+        return isinstance(other, AsyncDocumentReference) and self._reference == other._reference
+
+    def __hash__(self):
+        return hash(self._reference)
+
+    @property
+    def parent(self) -> 'AsyncCollectionReference':
+        from mockfirestore.async_collection import AsyncCollectionReference
+        return AsyncCollectionReference(self._reference.parent)
+
+    async def get(self, field_paths: Optional[Iterable[str]] = None) -> DocumentSnapshot:
+        snapshot = self._reference.get(field_paths)
+        snapshot.reference = self
+        return snapshot
+
+    async def create(self, document_data: Dict[str, Any]):
+        staged = StagedWrites(self._data)
+        with self._data.lock(self._path):
+            staged.stage(self._reference, CREATE, document_data)
+            staged.apply()
+
+    async def set(self, document_data: Dict, merge=False):
+        self._reference.set(document_data, merge=merge)
+
+    async def update(self, field_updates: Dict[str, Any]):
+        self._reference.update(field_updates)
+
+    async def delete(self):
+        self._reference.delete()
+
+    def collection(self, name) -> 'AsyncCollectionReference':
+        from mockfirestore.async_collection import AsyncCollectionReference
+        return AsyncCollectionReference(self._reference.collection(name))
@@ -0,0 +1,68 @@
+from typing import Any, AsyncIterator, Iterable, List, Optional, Union
+
+from mockfirestore.async_aggregation import AsyncAggregationQuery
+from mockfirestore.async_document import stream_snapshots
+from mockfirestore.document import DocumentSnapshot
+from mockfirestore.query import Query
+
+
+class AsyncQuery:
+    """
+    Async counterpart of `Query`, mirroring
+    https://googleapis.dev/python/firestore/latest/query.html#google.cloud.firestore_v1.async_query.AsyncQuery
+    Like `Query`, the filtering methods modify the query and return it.
+    """
+
+    def __init__(self, query: Query) -> None:
+        self._query = query
+
+    def stream(self, transaction=None) -> AsyncIterator[DocumentSnapshot]:
+        return stream_snapshots(self._query.stream(None if transaction is None else transaction._transaction))
+
+    async def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return [snapshot async for snapshot in self.stream(transaction)]
+
+    def count(self, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._query.count(alias))
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._query.sum(field_ref, alias))
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> AsyncAggregationQuery:
+        return AsyncAggregationQuery(self._query.avg(field_ref, alias))
+
+    def select(self, field_paths: Iterable[str]) -> 'AsyncQuery':
+        self._query.select(field_paths)
+        return self
+
+    def where(self, field: str, op: str, value: Any) -> 'AsyncQuery':
+        self._query.where(field, op, value)
+        return self
+
+    def order_by(self, key: str, direction: Optional[str] = 'ASCENDING') -> 'AsyncQuery':
+        self._query.order_by(key, direction)
+        return self
+
+    def limit(self, limit_amount: int) -> 'AsyncQuery':
+        self._query.limit(limit_amount)
+        return self
+
+    def offset(self, offset_amount: int) -> 'AsyncQuery':
+        self._query.offset(offset_amount)
+        return self
+
+    def start_at(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> 'AsyncQuery':
+        self._query.start_at(document_fields_or_snapshot)
+        return self
+
+    def start_after(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> 'AsyncQuery':
+        self._query.start_after(document_fields_or_snapshot)
+        return self
+
+    def end_at(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> 'AsyncQuery':
+        self._query.end_at(document_fields_or_snapshot)
+        return self
+
+    def end_before(self, document_fields_or_snapshot: Union[dict, DocumentSnapshot]) -> 'AsyncQuery':
+        self._query.end_before(document_fields_or_snapshot)
+        return self
@@ -0,0 +1,112 @@
+from functools import wraps
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Union
+
+from mockfirestore import Aborted
+from mockfirestore.async_document import AsyncDocumentReference, stream_snapshots
+from mockfirestore.async_query import AsyncQuery
+from mockfirestore.batch import WriteResult
+from mockfirestore.document import DocumentSnapshot
+from mockfirestore.transaction import Transaction, _EXCEED_ATTEMPTS_TEMPLATE
+
+
+class AsyncTransaction:
+    """
+    Async counterpart of `Transaction`, with the same optimistic concurrency.
+    This mostly follows the model from
+    https://googleapis.dev/python/firestore/latest/transaction.html#google.cloud.firestore_v1.async_transaction.AsyncTransaction
+    """
+
+    def __init__(self, transaction: Transaction) -> None:
+        self._transaction = transaction
+
+    @property
+    def _max_attempts(self) -> int:
+        return self._transaction._max_attempts
+
+    @property
+    def in_progress(self):
+        return self._transaction.in_progress
+
+    @property
+    def id(self):
+        return self._transaction.id
+
+    @property
+    def write_results(self):
+        return self._transaction.write_results
+
+    @property
+    def commit_time(self):
+        return self._transaction.commit_time
+
+    async def _begin(self, retry_id=None):
+        self._transaction._begin(retry_id)
+
+    async def _rollback(self):
+        self._transaction._rollback()
+
+    async def _commit(self) -> List[WriteResult]:
+        return self._transaction._commit()
+
+    async def get_all(self, references: Iterable[AsyncDocumentReference]) -> AsyncIterator[DocumentSnapshot]:
+        return stream_snapshots(self._transaction.get_all([reference._reference for reference in references]))
+
+    async def get(self, ref_or_query: Union[AsyncDocumentReference, AsyncQuery]) -> AsyncIterator[DocumentSnapshot]:
+        if isinstance(ref_or_query, AsyncDocumentReference):
+            return stream_snapshots(self._transaction.get(ref_or_query._reference))
+        elif isinstance(ref_or_query, AsyncQuery):
+            return ref_or_query.stream(transaction=self)
+        else:
+            raise ValueError(
+                'Value for argument "ref_or_query" must be a AsyncDocumentReference or a AsyncQuery.'
+            )
+
+    def create(self, reference: AsyncDocumentReference, document_data):
+        self._transaction.create(reference._reference, document_data)
+
+    def set(self, reference: AsyncDocumentReference, document_data: dict, merge=False):
+        self._transaction.set(reference._reference, document_data, merge=merge)
+
+    def update(self, reference: AsyncDocumentReference, field_updates: dict, option=None):
+        self._transaction.update(reference._reference, field_updates, option)
+
+    def delete(self, reference: AsyncDocumentReference, option=None):
+        self._transaction.delete(reference._reference, option)
+
+    async def commit(self) -> List[WriteResult]:
+        return await self._commit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.commit()
+
+
+def async_transactional(to_wrap: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """
+    Decorates a coroutine function taking an async transaction as its first
+    argument, like `transactional`: conflicting commits are retried up to the
+    transaction's `max_attempts`, any other error rolls it back and is raised.
+    """
+    @wraps(to_wrap)
+    async def wrapper(transaction: AsyncTransaction, *args, **kwargs):
+        for _ in range(transaction._max_attempts):
+            await transaction._begin()
+            try:
+                result = await to_wrap(transaction, *args, **kwargs)
+            except BaseException:
+                await transaction._rollback()
+                raise
+            try:
+                await transaction._commit()
+            except Aborted:
+                await transaction._rollback()
+                continue
+            except BaseException:
+                await transaction._rollback()
+                raise
+            return result
+        raise ValueError(_EXCEED_ATTEMPTS_TEMPLATE.format(transaction._max_attempts))
+    return wrapper
@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from mockfirestore import AlreadyExists, NotFound
+from mockfirestore._helpers import Document, Store, CollectionNode, Timestamp, copy_document
+from mockfirestore._transformations import apply_transformations
+from mockfirestore.document import DocumentReference
+
+MAX_BATCH_SIZE = 500
+CREATE, SET, UPDATE, DELETE = 'create', 'set', 'update', 'delete'
+
+
+class WriteResult:
+    def __init__(self, update_time: Optional[Timestamp] = None):
+        self.update_time = Timestamp.from_now() if update_time is None else update_time
+
+
+class StagedWrites:
+    """
+    Final states of the documents written so far, by path, to be applied to the
+    store in a single pass. Each collection is looked up once. Transforms are
+    applied to a copy of the fields, so a write that fails halfway leaves the
+    staged state as it was.
+    """
+
+    def __init__(self, store: Store) -> None:
+        self._store = store
+        self.documents = {}  # type: Dict[Tuple[str, ...], Optional[Document]]
+        self._collections = {}  # type: Dict[Tuple[str, ...], Optional[CollectionNode]]
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _current(self, path: Tuple[str, ...]) -> Optional[Document]:
+        collection_path = path[:-1]
+        if collection_path in self._collections:
+            collection = self._collections[collection_path]
+        else:
+            collection = self._collections[collection_path] = self._store.get_collection(collection_path)
+        node = None if collection is None else collection.documents.get(path[-1])
+        return None if node is None or not node.exists else node.fields
+
+    def stage(self, reference: DocumentReference, kind: str,
+              document_data: Optional[Dict[str, Any]] = None, merge: bool = False):
+        """Stages a write, or raises without staging anything if it can't be applied."""
+        path = tuple(reference._path)
+        fields = self.documents[path] if path in self.documents else self._current(path)
+
+        if kind == DELETE:
+            self.documents[path] = None
+            return
+        if kind == CREATE and fields is not None:
+            raise AlreadyExists('Document already exists: {}'.format(list(path)))
+        if kind == UPDATE and fields is None:
+            raise NotFound('No document to update: {}'.format(list(path)))
+
+        if kind in (CREATE, SET) and not (merge and fields is not None):
+            self.documents[path] = copy_document(document_data)
+        else:
+            # Copy on write: snapshots may still be sharing the stored fields.
+            fields = copy_document(fields)
+            apply_transformations(fields, copy_document(document_data))
+            self.documents[path] = fields
+
+    def apply(self) -> Timestamp:
+        """:returns: the update time of the written documents."""
+        return self._store.write_many(self.documents)
+
+
+class WriteBatch:
+    """
+    Queues writes and applies them atomically on commit. This mostly follows the model from
+    https://googleapis.dev/python/firestore/latest/batch.html
+    """
+
+    def __init__(self, client) -> None:
+        self._client = client
+        self._writes = []  # type: List[Tuple[DocumentReference, str, Optional[Dict[str, Any]], bool]]
+        self.write_results = None
+        self.commit_time = None
+
+    def __len__(self):
+        return len(self._writes)
+
+    def _add_write(self, reference: DocumentReference, kind: str,
+                   document_data: Optional[Dict[str, Any]] = None, merge: bool = False):
+        if len(self._writes) >= MAX_BATCH_SIZE:
+            raise ValueError('A batch can hold at most {} writes.'.format(MAX_BATCH_SIZE))
+        self._writes.append((reference, kind, document_data, merge))
+
+    def create(self, reference: DocumentReference, document_data: Dict[str, Any]):
+        self._add_write(reference, CREATE, document_data)
+
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge=False):
+        self._add_write(reference, SET, document_data, merge)
+
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any], option=None):
+        self._add_write(reference, UPDATE, field_updates)
+
+    def delete(self, reference: DocumentReference, option=None):
+        self._add_write(reference, DELETE)
+
+    def commit(self) -> List[WriteResult]:
+        """
+        Works out the final state of every written document first, so a failing
+        create or update leaves the store untouched, then applies them together.
+        The locks of the written paths are held throughout, so the documents
+        can't change between being read for a transform and being written.
+        """
+        store = self._client._store
+        with store.lock(*[reference._path for reference, _, _, _ in self._writes]):
+            staged = StagedWrites(store)
+            for reference, kind, document_data, merge in self._writes:
+                staged.stage(reference, kind, document_data, merge)
+            self.commit_time = staged.apply()
+        self.write_results = [WriteResult(self.commit_time) for _ in self._writes]
+        self._writes = []
+        return self.write_results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
@@ -0,0 +1,142 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mockfirestore.batch import MAX_BATCH_SIZE, CREATE, SET, UPDATE, DELETE, StagedWrites, WriteResult
+from mockfirestore.document import DocumentReference
+
+MAX_ATTEMPTS = 15
+
+# (reference, kind, document data, merge, attempts)
+_Write = Tuple[DocumentReference, str, Optional[Dict[str, Any]], bool, int]
+
+
+class BulkWriteFailure:
+    """A write that could not be applied, as passed to `on_write_error` callbacks."""
+
+    def __init__(self, reference: DocumentReference, operation: str, error: Exception, attempts: int) -> None:
+        self.reference = reference
+        self.operation = operation
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def code(self):
+        return getattr(self.error, 'code', None)
+
+    @property
+    def message(self) -> str:
+        return str(self.error)
+
+
+def _no_retry(failure: BulkWriteFailure, bulk_writer: 'BulkWriter') -> bool:
+    # The store answers the same way every time, so retrying only helps when
+    # a callback knows something will change in between.
+    return False
+
+
+class BulkWriter:
+    """
+    Buffers an unbounded stream of writes and applies them in chunks of up to
+    `batch_size`. Unlike a WriteBatch, each write succeeds or fails on its own,
+    and the outcome is reported through the `on_write_result` and
+    `on_write_error` callbacks. This mostly follows the model from
+    https://googleapis.dev/python/firestore/latest/bulk_writer.html
+    """
+
+    def __init__(self, client, batch_size: int = MAX_BATCH_SIZE, max_attempts: int = MAX_ATTEMPTS) -> None:
+        self._client = client
+        self._batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self._max_attempts = max_attempts
+        self._buffer = []  # type: List[_Write]
+        self._on_write_result = None  # type: Optional[Callable[[DocumentReference, WriteResult, BulkWriter], None]]
+        self._on_write_error = _no_retry  # type: Callable[[BulkWriteFailure, BulkWriter], bool]
+        self._closed = False
+        self._started = None  # type: Optional[float]
+        # Throughput counters.
+        self.succeeded = 0
+        self.failed = 0
+        self.batches = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def ops_per_second(self) -> float:
+        """Successful writes per second since the first write was enqueued."""
+        if self._started is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started
+        return self.succeeded / elapsed if elapsed > 0 else 0.0
+
+    def on_write_result(self, callback: Optional[Callable[[DocumentReference, WriteResult, 'BulkWriter'], None]]):
+        self._on_write_result = callback
+
+    def on_write_error(self, callback: Optional[Callable[[BulkWriteFailure, 'BulkWriter'], bool]]):
+        """Sets the callback deciding whether a failed write is retried with the next chunk."""
+        self._on_write_error = callback or _no_retry
+
+    def _add_write(self, reference: DocumentReference, kind: str,
+                   document_data: Optional[Dict[str, Any]] = None, merge: bool = False, attempts: int = 0):
+        """:param attempts: how many times the write was already attempted, counting towards `max_attempts`."""
+        if self._closed:
+            raise ValueError('Cannot add writes to a closed BulkWriter.')
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._buffer.append((reference, kind, document_data, merge, attempts + 1))
+        if len(self._buffer) >= self._batch_size:
+            self._send()
+
+    def create(self, reference: DocumentReference, document_data: Dict[str, Any], attempts: int = 0):
+        self._add_write(reference, CREATE, document_data, attempts=attempts)
+
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge=False, attempts: int = 0):
+        self._add_write(reference, SET, document_data, merge, attempts)
+
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any], option=None,
+               attempts: int = 0):
+        self._add_write(reference, UPDATE, field_updates, attempts=attempts)
+
+    def delete(self, reference: DocumentReference, option=None, attempts: int = 0):
+        self._add_write(reference, DELETE, attempts=attempts)
+
+    def _send(self):
+        """Applies the buffered writes in one pass over the store, then reports them."""
+        writes, self._buffer = self._buffer[:self._batch_size], self._buffer[self._batch_size:]
+        store = self._client._store
+        applied = []
+        failures = []
+        # Writes are staged with their locks held, like a WriteBatch commit.
+        with store.lock(*[write[0]._path for write in writes]):
+            staged = StagedWrites(store)
+            for write in writes:
+                reference, kind, document_data, merge, _ = write
+                try:
+                    staged.stage(reference, kind, document_data, merge)
+                except Exception as error:
+                    # Any write can fail on its own, e.g. a field path through a non-map value.
+                    failures.append((write, error))
+                else:
+                    applied.append(reference)
+            update_time = staged.apply()
+        self.batches += 1
+
+        self.succeeded += len(applied)
+        if self._on_write_result is not None:
+            for reference in applied:
+                self._on_write_result(reference, WriteResult(update_time), self)
+        for (reference, kind, document_data, merge, attempts), error in failures:
+            failure = BulkWriteFailure(reference, kind, error, attempts)
+            if attempts < self._max_attempts and self._on_write_error(failure, self):
+                self._buffer.append((reference, kind, document_data, merge, attempts + 1))
+            else:
+                self.failed += 1
+
+    def flush(self):
+        """Applies every buffered write, including the retries they lead to."""
+        while self._buffer:
+            self._send()
+
+    def close(self):
+        self.flush()
+        self._closed = True
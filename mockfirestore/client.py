@@ -1,62 +1,265 @@
-from typing import Iterable, Sequence
+import json
+import weakref
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple, Union, IO
+from mockfirestore._helpers import Checkpoint, Document, Store
+from mockfirestore._indexes import ASCENDING, CONTAINS
+from mockfirestore._loader import as_text, iter_json_documents, iter_ndjson_documents
+from mockfirestore._snapshot_file import open_snapshot_file, write_snapshot_file
+from mockfirestore._wal import DEFAULT_SYNC_INTERVAL, WriteAheadLog
+from mockfirestore.batch import MAX_BATCH_SIZE, WriteBatch
+from mockfirestore.bulk_writer import MAX_ATTEMPTS, BulkWriter
 from mockfirestore.collection import CollectionReference
 from mockfirestore.document import DocumentReference, DocumentSnapshot
+from mockfirestore.query import Query
 from mockfirestore.transaction import Transaction
 
+# Documents written to the store at a time by `load`.
+_LOAD_CHUNK_SIZE = 10000
+# References kept by `document` and `collection`, which start over once there are this many.
+_INTERNED_REFERENCES = 10000
+_DOCUMENT_READERS = {
+    'ndjson': iter_ndjson_documents,
+    'json': iter_json_documents,
+}
+
+
+def _is_nested_collection(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(isinstance(document, dict) for document in value.values())
+
+
+def _nested_writes(path: Tuple[str, ...], documents: Dict[str, Document],
+                   writes: Dict[Tuple[str, ...], Document]):
+    """Adds the documents of a collection of `_data`, and of their nested subcollections, to `writes`."""
+    for doc_id, fields in documents.items():
+        subcollections = {key: value for key, value in fields.items() if _is_nested_collection(value)}
+        if subcollections:
+            fields = {key: value for key, value in fields.items() if key not in subcollections}
+        writes[path + (doc_id,)] = fields
+        for name, nested in subcollections.items():
+            _nested_writes(path + (doc_id, name), nested, writes)
+
 
 class MockFirestore:
 
-    def __init__(self) -> None:
-        self._data = {}
+    def __init__(self, read_only_snapshots: bool = False, require_indexes: bool = False,
+                 data_dir: Optional[str] = None, sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 nested_collections: bool = False) -> None:
+        """
+        :param nested_collections: fixtures assigned to `_data` nest the
+            subcollections of a document in its fields, as in earlier versions:
+            every field holding a non-empty dict of dicts is loaded as a
+            subcollection keyed by document id, instead of as a map field.
+        :param data_dir: makes the documents durable: every change is appended to
+            a write-ahead log in this directory, and the documents found there are
+            recovered on creation. Call `close` when done.
+        :param sync_interval: at most how many seconds of changes can be lost if
+            the machine goes down, 0 to sync every write to disk.
+        """
+        self._store = Store(read_only_snapshots=read_only_snapshots, require_indexes=require_indexes)
+        self._nested_collections = nested_collections
+        if data_dir is not None:
+            log = WriteAheadLog(self._store, data_dir, sync_interval=sync_interval)
+            weakref.finalize(self, log.close)
+        # References handed out by path, so that looking up the same path again doesn't build new ones.
+        self._references = {}  # type: Dict[str, Union[DocumentReference, CollectionReference]]
 
-    def _ensure_path(self, path):
-        current_position = self
+    @property
+    def _data(self) -> Mapping[str, Mapping[str, Document]]:
+        """
+        Top-level collections as a read-only view of collection -> document id
+        -> fields, built on each access. Adding or replacing documents through
+        it raises TypeError: assign `_data` or use the API to change them.
+        """
+        return MappingProxyType({
+            name: MappingProxyType({doc_id: node.fields for doc_id, node in collection.documents.items()
+                                    if node.exists})
+            for name, collection in self._store.collections.items()})
 
-        for el in path[:-1]:
-            if type(current_position) in (MockFirestore, DocumentReference):
-                current_position = current_position.collection(el)
-            else:
-                current_position = current_position.document(el)
+    @_data.setter
+    def _data(self, data: Dict[str, Dict[str, Document]]):
+        """
+        Replaces every document. Dict values are map fields, unless the client
+        was created with `nested_collections=True`.
+        """
+        self.reset()
+        for name in data:
+            with self._store.lock([name]):
+                self._store.get_collection([name], create=True)
+        if self._nested_collections:
+            writes = {}  # type: Dict[Tuple[str, ...], Document]
+            for name, documents in data.items():
+                _nested_writes((name,), documents, writes)
+        else:
+            writes = {(name, doc_id): fields
+                      for name, documents in data.items() for doc_id, fields in documents.items()}
+        self._store.write_many(writes)
 
-        return current_position
+    def _intern(self, path: str, reference: Union[DocumentReference, CollectionReference]):
+        if len(self._references) >= _INTERNED_REFERENCES:
+            self._references.clear()
+        self._references[path] = reference
+        return reference
 
     def document(self, path: str) -> DocumentReference:
-        path = path.split("/")
+        reference = self._references.get(path)
+        if reference is not None:
+            return reference
+        segments = path.split("/")
 
-        if len(path) % 2 != 0:
-            raise Exception("Cannot create document at path {}".format(path))
-        current_position = self._ensure_path(path)
+        if len(segments) % 2 != 0:
+            raise Exception("Cannot create document at path {}".format(segments))
+        parent = self.collection("/".join(segments[:-1]))
 
-        return current_position.document(path[-1])
+        return self._intern(path, parent.document(segments[-1]))
 
     def collection(self, path: str) -> CollectionReference:
-        path = path.split("/")
+        reference = self._references.get(path)
+        if reference is not None:
+            return reference
+        segments = path.split("/")
 
-        if len(path) % 2 != 1:
-            raise Exception("Cannot create collection at path {}".format(path))
+        if len(segments) % 2 != 1:
+            raise Exception("Cannot create collection at path {}".format(segments))
 
-        name = path[-1]
-        if len(path) > 1:
-            current_position = self._ensure_path(path)
-            return current_position.collection(name)
+        name = segments[-1]
+        if len(segments) > 1:
+            reference = self.document("/".join(segments[:-1])).collection(name)
         else:
-            if name not in self._data:
-                self._data[name] = {}
-            return CollectionReference(self._data, [name])
+            reference = CollectionReference(self._store, [name])
+        return self._intern(path, reference)
+
+    def collection_group(self, collection_id: str) -> Query:
+        """Queries the collections with the given id at any depth of the tree."""
+        if '/' in collection_id:
+            raise ValueError('Collection ID {} must not contain "/"'.format(collection_id))
+        return Query(CollectionReference(self._store, [collection_id]), all_descendants=True)
 
     def collections(self) -> Sequence[CollectionReference]:
-        return [CollectionReference(self._data, [collection_name]) for collection_name in self._data]
+        return [CollectionReference(self._store, [collection_name])
+                for collection_name in self._store.collections]
 
     def reset(self):
-        self._data = {}
+        self._store.clear()
+
+    def checkpoint(self) -> Checkpoint:
+        """
+        Captures the current documents. The checkpoint shares the stored data
+        instead of copying it, and can be restored any number of times.
+        """
+        return self._store.checkpoint()
+
+    def restore(self, checkpoint: Checkpoint):
+        """Puts back the documents of a checkpoint. Existing references stay valid."""
+        self._store.restore(checkpoint)
+
+    def compact(self):
+        """Folds the write-ahead log into a snapshot of the data directory."""
+        if self._store.log is not None:
+            self._store.log.compact()
+
+    def close(self):
+        """Syncs and closes the write-ahead log, if any."""
+        if self._store.log is not None:
+            self._store.log.close()
+
+    def save_snapshot(self, path: str):
+        """Writes the documents to a binary snapshot file, see `load_snapshot`."""
+        with self._store.lock_all():
+            write_snapshot_file(self._store, path)
+
+    def load_snapshot(self, path: str) -> Checkpoint:
+        """
+        Replaces the documents with those of a snapshot file. The file is
+        memory-mapped read-only, so processes loading the same file share it,
+        and documents are only decoded when first accessed. Writes are kept in
+        memory and never change the file.
+
+        :returns: a checkpoint that restores the documents of the file.
+        """
+        checkpoint = open_snapshot_file(path, self._store)
+        self._store.restore(checkpoint)
+        return checkpoint
+
+    def add_index(self, collection_id: str, fields: Sequence[Tuple[str, str]]):
+        """
+        Declares a composite index, e.g.
+        add_index('cities', [('state', 'ASCENDING'), ('population', 'DESCENDING')]).
+        Use 'CONTAINS' as the direction of an array field.
+        """
+        definitions = self._store.index_definitions.setdefault(collection_id, [])
+        fields = tuple((field, direction) for field, direction in fields)
+        if fields not in definitions:
+            definitions.append(fields)
+
+    def load_indexes(self, path_or_file: Union[str, IO]):
+        """Declares the composite indexes listed in a firestore.indexes.json file."""
+        if isinstance(path_or_file, str):
+            with open(path_or_file) as f:
+                config = json.load(f)
+        else:
+            config = json.load(path_or_file)
+
+        for index in config.get('indexes', []):
+            fields = [(field['fieldPath'], CONTAINS if 'arrayConfig' in field else field.get('order', ASCENDING))
+                      for field in index['fields']]
+            self.add_index(index['collectionGroup'], fields)
+
+    def load(self, path_or_file: Union[str, IO], format: str = 'ndjson', chunk_size: int = _LOAD_CHUNK_SIZE) -> int:
+        """
+        Loads documents by full path, including those of nested subcollections,
+        straight into the store. With 'ndjson' each line is an object like
+        {"path": "users/alovelace", "data": {"born": 1815}}; with 'json' the file
+        is a single object mapping paths to data. Files are streamed, so their
+        size is only limited by the store itself.
+
+        :returns: the number of documents loaded.
+        """
+        if format not in _DOCUMENT_READERS:
+            raise ValueError('Unsupported format {!r}, expected one of {}'.format(format, list(_DOCUMENT_READERS)))
+        if isinstance(path_or_file, str):
+            with open(path_or_file, encoding='utf-8') as f:
+                return self._load(_DOCUMENT_READERS[format](f), chunk_size)
+        return self._load(_DOCUMENT_READERS[format](as_text(path_or_file)), chunk_size)
+
+    def _load(self, documents: Iterable[Tuple[str, Document]], chunk_size: int) -> int:
+        count = 0
+        chunk = {}
+        for path, data in documents:
+            segments = tuple(path.strip('/').split('/'))
+            if len(segments) % 2 != 0 or not isinstance(data, dict):
+                raise ValueError('Cannot load a document at path {}'.format(path))
+            chunk[segments] = data
+            count += 1
+            if len(chunk) >= chunk_size:
+                self._store.write_many(chunk)
+                chunk = {}
+        if chunk:
+            self._store.write_many(chunk)
+        return count
 
     def get_all(self, references: Iterable[DocumentReference],
                 field_paths=None,
                 transaction=None) -> Iterable[DocumentSnapshot]:
-        for doc_ref in set(references):
-            yield doc_ref.get()
+        # Duplicates are only read once, in the order they were first given.
+        snapshots = (doc_ref.get(field_paths) for doc_ref in dict.fromkeys(references))
+        return snapshots if transaction is None else transaction._read(snapshots)
 
     def transaction(self, **kwargs) -> Transaction:
         return Transaction(self, **kwargs)
 
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def bulk_writer(self, options=None, batch_size: int = MAX_BATCH_SIZE,
+                    max_attempts: int = MAX_ATTEMPTS) -> BulkWriter:
+        """
+        :param options: `BulkWriterOptions` are not supported: writes are
+            applied as soon as a chunk is full, without rate limits or delays
+            between retries, so passing any raises ValueError.
+        """
+        if options is not None:
+            raise ValueError('BulkWriter options are not supported by the mock: {!r}'.format(options))
+        return BulkWriter(self, batch_size=batch_size, max_attempts=max_attempts)
+
 
@@ -1,8 +1,9 @@
 import warnings
-from typing import Any, List, Optional, Iterable, Dict, Tuple, Sequence, Union
+from typing import Any, Callable, List, Optional, Iterable, Dict, Tuple, Sequence, Union
 
 from mockfirestore import AlreadyExists
-from mockfirestore._helpers import generate_random_string, Store, get_by_path, set_by_path, Timestamp
+from mockfirestore._helpers import generate_random_string, Store, DocumentNode, ResolvedCollection, Timestamp
+from mockfirestore.aggregation import AggregationQuery
 from mockfirestore.query import Query
 from mockfirestore.document import DocumentReference, DocumentSnapshot
 
@@ -13,14 +14,12 @@ class CollectionReference:
         self._data = data
         self._path = path
         self.parent = parent
+        self._resolved = ResolvedCollection(path)
 
     def document(self, document_id: Optional[str] = None) -> DocumentReference:
-        collection = get_by_path(self._data, self._path)
         if document_id is None:
             document_id = generate_random_string()
         new_path = self._path + [document_id]
-        if document_id not in collection:
-            set_by_path(self._data, new_path, {})
         return DocumentReference(self._data, new_path, parent=self)
 
     def get(self) -> Iterable[DocumentSnapshot]:
@@ -32,15 +31,19 @@ class CollectionReference:
             -> Tuple[Timestamp, DocumentReference]:
         if document_id is None:
             document_id = document_data.get('id', generate_random_string())
-        collection = get_by_path(self._data, self._path)
         new_path = self._path + [document_id]
-        if document_id in collection:
-            raise AlreadyExists('Document already exists: {}'.format(new_path))
         doc_ref = DocumentReference(self._data, new_path, parent=self)
-        doc_ref.set(document_data)
+        with self._data.lock(self._path):
+            if doc_ref.get().exists:
+                raise AlreadyExists('Document already exists: {}'.format(new_path))
+            doc_ref.set(document_data)
         timestamp = Timestamp.from_now()
         return timestamp, doc_ref
 
+    def select(self, field_paths: Iterable[str]) -> Query:
+        query = Query(self, projection=list(field_paths))
+        return query
+
     def where(self, field: str, op: str, value: Any) -> Query:
         query = Query(self, field_filters=[(field, op, value)])
         return query
@@ -73,13 +76,41 @@ class CollectionReference:
         query = Query(self, end_at=(document_fields_or_snapshot, False))
         return query
 
+    def count(self, alias: Optional[str] = None) -> AggregationQuery:
+        return Query(self).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> AggregationQuery:
+        return Query(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> AggregationQuery:
+        return Query(self).avg(field_ref, alias)
+
+    def on_snapshot(self, callback: Callable[[List[DocumentSnapshot], List['DocumentChange'], Timestamp], None]) \
+            -> 'Watch':
+        return Query(self).on_snapshot(callback)
+
     def list_documents(self, page_size: Optional[int] = None) -> Sequence[DocumentReference]:
-        docs = []
-        for key in get_by_path(self._data, self._path):
-            docs.append(self.document(key))
-        return docs
+        collection = self._data.resolve_collection(self._resolved)
+        if collection is None:
+            return []
+        # The ids are copied while no write is changing the documents.
+        doc_ids = collection.read(lambda: list(collection.documents))
+        return [self.document(doc_id) for doc_id in doc_ids]
 
     def stream(self, transaction=None) -> Iterable[DocumentSnapshot]:
-        for key in sorted(get_by_path(self._data, self._path)):
-            doc_snapshot = self.document(key).get()
-            yield doc_snapshot
+        if transaction is not None:
+            yield from transaction._read(self.stream())
+            return
+        collection = self._data.resolve_collection(self._resolved)
+        if collection is None:
+            return
+        for key in collection.sorted_ids():
+            node = collection.documents.get(key)
+            if node is not None and node.exists:
+                yield self._document_snapshot(key, node)
+
+    def _document_snapshot(self, document_id: str, node: DocumentNode,
+                           field_paths: Optional[Iterable[str]] = None) -> DocumentSnapshot:
+        """Snapshot of a document of this collection whose node was already looked up."""
+        reference = DocumentReference(self._data, self._path + [document_id], parent=self)
+        return reference._snapshot(node, field_paths)
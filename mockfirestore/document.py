@@ -1,18 +1,35 @@
 from copy import deepcopy
 from functools import reduce
 import operator
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Optional
 from mockfirestore import NotFound
 from mockfirestore._helpers import (
-    Timestamp, Document, Store, get_by_path, set_by_path, delete_by_path
+    Timestamp, Document, Store, DocumentNode, ResolvedCollection, get_by_field_path, mask_document
 )
 from mockfirestore._transformations import apply_transformations
 
 
 class DocumentSnapshot:
-    def __init__(self, reference: 'DocumentReference', data: Document) -> None:
+    """
+    Shares the stored document rather than copying it: writes replace stored
+    documents instead of mutating them, so the data stays as it was at read time.
+    `to_dict()` makes a private copy on first use, unless the snapshot is read-only.
+    A snapshot masked by a field projection only holds, and copies, the selected
+    fields.
+    """
+
+    def __init__(self, reference: 'DocumentReference', data: Document,
+                 read_only: bool = False, create_time: Optional[Timestamp] = None,
+                 update_time: Optional[Timestamp] = None, exists: bool = True) -> None:
         self.reference = reference
-        self._doc = deepcopy(data)
+        self._exists = exists
+        self._data = data
+        # The stored fields the snapshot was taken from, before any mask.
+        self._stored = data
+        self._read_only = read_only
+        self._doc = data if read_only else None
+        self._create_time = create_time
+        self._update_time = update_time
 
     @property
     def id(self):
@@ -20,18 +37,31 @@ class DocumentSnapshot:
 
     @property
     def exists(self) -> bool:
-        return self._doc != {}
+        return self._exists
+
+    def _mask(self, field_paths: Iterable[str]) -> 'DocumentSnapshot':
+        """Keeps only the given fields, as selected by a projection."""
+        self._data = mask_document(self._stored, field_paths)
+        if self._read_only:
+            self._doc = self._data
+        return self
 
     def to_dict(self) -> Document:
+        if self._doc is None:
+            self._doc = deepcopy(self._data)
         return self._doc
 
     @property
     def create_time(self) -> Timestamp:
+        if self._create_time is not None:
+            return self._create_time
         timestamp = Timestamp.from_now()
         return timestamp
 
     @property
     def update_time(self) -> Timestamp:
+        if self._update_time is not None:
+            return self._update_time
         return self.create_time
 
     @property
@@ -42,14 +72,15 @@ class DocumentSnapshot:
     def get(self, field_path: str) -> Any:
         if not self.exists:
             return None
-        else:
+        elif self._doc is not None:
             return reduce(operator.getitem, field_path.split('.'), self._doc)
+        else:
+            return deepcopy(reduce(operator.getitem, field_path.split('.'), self._data))
 
-    def _get_by_field_path(self, field_path: str) -> Any:
-        try:
-            return self.get(field_path)
-        except KeyError:
-            return None
+    def _get_by_field_path(self, field_path: str, default: Any = None) -> Any:
+        # Internal lookup for comparisons, so the value is not copied.
+        doc = self._data if self._doc is None else self._doc
+        return get_by_field_path(doc, field_path.split('.'), default)
 
 
 class DocumentReference:
@@ -58,37 +89,75 @@ class DocumentReference:
         self._data = data
         self._path = path
         self.parent = parent
+        self._resolved = ResolvedCollection(path[:-1]) if parent is None else parent._resolved
 
     @property
     def id(self):
         return self._path[-1]
 
-    def get(self) -> DocumentSnapshot:
-        return DocumentSnapshot(self, get_by_path(self._data, self._path))
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and self._data is other._data and self._path == other._path
+
+    def __hash__(self):
+        return hash(tuple(self._path))
+
+    def __deepcopy__(self, memo):
+        # References stored in documents point at the same store, which is never copied.
+        return self
+
+    def get(self, field_paths: Optional[Iterable[str]] = None) -> DocumentSnapshot:
+        collection = self._data.resolve_collection(self._resolved)
+        node = None if collection is None else collection.documents.get(self.id)
+        return self._snapshot(node, field_paths)
+
+    def _snapshot(self, node: Optional[DocumentNode],
+                  field_paths: Optional[Iterable[str]] = None) -> DocumentSnapshot:
+        if node is None or not node.exists:
+            return DocumentSnapshot(self, {}, exists=False)
+        snapshot = DocumentSnapshot(self, node.fields, read_only=self._data.read_only_snapshots,
+                                    create_time=node.create_time, update_time=node.update_time)
+        return snapshot if field_paths is None else snapshot._mask(field_paths)
 
     def delete(self):
-        delete_by_path(self._data, self._path)
+        self._data.remove_document(self._path)
 
     def set(self, data: Dict, merge=False):
         if merge:
-            try:
-                self.update(deepcopy(data))
-            except NotFound:
-                self.set(data)
+            with self._data.lock(self._path):
+                try:
+                    self.update(deepcopy(data))
+                except NotFound:
+                    self.set(data)
         else:
-            set_by_path(self._data, self._path, deepcopy(data))
+            data = deepcopy(data)
+            with self._data.lock(self._path):
+                node = self._data.resolve_collection(self._resolved, create=True, write=True).write(self.id, data)
+                self._data.log_write(self._path, node)
 
     def update(self, data: Dict[str, Any]):
-        document = get_by_path(self._data, self._path)
-        if document == {}:
-            raise NotFound('No document to update: {}'.format(self._path))
-
-        apply_transformations(document, deepcopy(data))
+        data = deepcopy(data)
+        with self._data.lock(self._path):
+            collection = self._data.resolve_collection(self._resolved)
+            node = None if collection is None else collection.documents.get(self.id)
+            if node is None or not node.exists:
+                raise NotFound('No document to update: {}'.format(self._path))
+
+            # Copy on write: snapshots may still be sharing the current fields.
+            document = deepcopy(node.fields)
+            apply_transformations(document, data)
+            node = self._data.resolve_collection(self._resolved, write=True).write(self.id, document)
+            self._data.log_write(self._path, node)
+
+    def on_snapshot(self, callback: Callable[[List[DocumentSnapshot], List['DocumentChange'], Timestamp], None]) \
+            -> 'Watch':
+        """
+        Calls `callback(docs, changes, read_time)` from a background thread with
+        the document, then again whenever it changes. `docs` is empty while the
+        document doesn't exist.
+        """
+        from mockfirestore.watch import Watch
+        return Watch.for_document(self, callback)
 
     def collection(self, name) -> 'CollectionReference':
         from mockfirestore.collection import CollectionReference
-        document = get_by_path(self._data, self._path)
-        new_path = self._path + [name]
-        if name not in document:
-            set_by_path(self._data, new_path, {})
-        return CollectionReference(self._data, new_path, parent=self)
+        return CollectionReference(self._data, self._path + [name], parent=self)
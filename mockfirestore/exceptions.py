@@ -19,3 +19,11 @@ class NotFound(ClientError):
 
 class AlreadyExists(Conflict):
     pass
+
+
+class Aborted(Conflict):
+    pass
+
+
+class FailedPrecondition(ClientError):
+    code = 400
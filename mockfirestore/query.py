@@ -1,9 +1,60 @@
+import heapq
+import time
 import warnings
+from bisect import bisect_left, bisect_right
 from itertools import islice, tee
-from typing import Iterator, Any, Optional, List, Callable, Union
+from operator import itemgetter
+from typing import Iterable, Iterator, Any, Optional, List, Callable, Union, Set, Tuple, Sequence, Dict
 
+from mockfirestore import FailedPrecondition
+from mockfirestore.aggregation import AggregationQuery
 from mockfirestore.document import DocumentSnapshot
-from mockfirestore._helpers import T
+from mockfirestore._helpers import Document, CollectionNode, DocumentNode, get_by_field_path
+from mockfirestore._indexes import (
+    INDEXED_OPERATORS, ASCENDING, DESCENDING, Descending, find_scan_index, needs_composite_index, satisfies,
+    value_key, bisect_entries, compile_index_filter
+)
+
+_MISSING = object()
+
+# (order values, document id or path or None, inclusive, is start cursor)
+Cursor = Tuple[List[Any], Any, bool, bool]
+Predicate = Callable[[Document], bool]
+
+
+def _field_getter(field: str) -> Callable[[Document], Any]:
+    path = field.split('.')
+    if len(path) == 1:
+        name = path[0]
+        return lambda fields: fields.get(name)
+    return lambda fields: get_by_field_path(fields, path)
+
+
+def _compile_filter(field: str, op: str, value: Any) -> Predicate:
+    """
+    Compiles a where() filter into a predicate on the stored fields of a
+    document, with the field path split and the operand prepared once.
+    Indexed operators match the way the indexes do, see `compile_index_filter`.
+    """
+    if op in INDEXED_OPERATORS:
+        return compile_index_filter(field, op, value)
+    if op == '!=':
+        get = _field_getter(field)
+        return lambda fields: get(fields) != value
+    raise ValueError('Unsupported filter operator: {}'.format(op))
+
+
+def _conjunction(predicates: List[Predicate]) -> Optional[Predicate]:
+    """Fuses the predicates into one, or None when there is nothing to check."""
+    if not predicates:
+        return None
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda fields: first(fields) and second(fields)
+    predicates = tuple(predicates)
+    return lambda fields: all(predicate(fields) for predicate in predicates)
 
 
 class Query:
@@ -25,24 +76,33 @@ class Query:
                 self._add_field_filter(*field_filter)
 
     def stream(self, transaction=None) -> Iterator[DocumentSnapshot]:
-        doc_snapshots = self.parent.stream()
+        """
+        Runs the query as a generator pipeline: document ids come from the indexes
+        (or the collection), the remaining filters are checked on the stored
+        fields in one pass, and snapshots are only built for matching documents.
+        Without ordering, a limit stops the pipeline as soon as it is reached.
+        Cursors are located by bisecting on the order values.
+        """
+        if transaction is not None:
+            return transaction._read(self.stream())
+        self._check_index()
+        cursors = self._cursors()
+        if self.all_descendants:
+            references = {}
+            doc_snapshots = (self._group_snapshot(path, node, references)
+                             for path, node in self._collection_group_documents(cursors))
+        else:
+            doc_snapshots = (self.parent._document_snapshot(doc_id, node, self.projection)
+                             for doc_id, node in self._collection_documents(cursors))
 
-        for field, compare, value in self._field_filters:
-            doc_snapshots = [doc_snapshot for doc_snapshot in doc_snapshots
-                             if compare(doc_snapshot._get_by_field_path(field), value)]
+        if cursors is None:
+            if self._start_at:
+                document_fields_or_snapshot, before = self._start_at
+                doc_snapshots = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, True)
 
-        if self.orders:
-            for key, direction in self.orders:
-                doc_snapshots = sorted(doc_snapshots,
-                                       key=lambda doc: doc.to_dict()[key],
-                                       reverse=direction == 'DESCENDING')
-        if self._start_at:
-            document_fields_or_snapshot, before = self._start_at
-            doc_snapshots = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, True)
-
-        if self._end_at:
-            document_fields_or_snapshot, before = self._end_at
-            doc_snapshots = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, False)
+            if self._end_at:
+                document_fields_or_snapshot, before = self._end_at
+                doc_snapshots = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, False)
 
         if self._offset:
             doc_snapshots = islice(doc_snapshots, self._offset, None)
@@ -52,14 +112,451 @@ class Query:
 
         return iter(doc_snapshots)
 
+    def count(self, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self).avg(field_ref, alias)
+
+    def _count(self) -> int:
+        """
+        Counts the results without building snapshots. Without cursors the order
+        doesn't matter, so nothing is sorted, and the offset and limit only
+        clamp the count. When the indexes resolve every filter, the count is
+        the number of ids they match.
+        """
+        self._check_index()
+        if self._start_at or self._end_at:
+            return sum(1 for _ in self._result_fields())
+        if self.orders or any(op not in INDEXED_OPERATORS for _, op, _, _ in self._field_filters):
+            total = sum(1 for _ in self._unordered_fields())
+        else:
+            total = 0
+            for path, collection in self._collections():
+                matching_ids = self._indexed_doc_ids(path, collection, self._field_filters)
+                if matching_ids is None:
+                    total += collection.read(lambda: sum(1 for node in collection.documents.values() if node.exists))
+                else:
+                    total += len(matching_ids)
+        total = max(0, total - (self._offset or 0))
+        return min(total, self._limit) if self._limit else total
+
+    def _numbers(self, field_path: str, documents: Optional[Iterable[Document]] = None) -> List[Any]:
+        """
+        :returns: the numeric values of a field in the results, or in `documents`.
+            Over a whole collection they are read from the field's index, if one
+            has been built.
+        """
+        if documents is None:
+            self._check_index()
+            if not (self._field_filters or self.orders or self._start_at or self._end_at or self._offset
+                    or self._limit or self.all_descendants):
+                collection = self.parent._data.resolve_collection(self.parent._resolved)
+                index = None if collection is None else collection.indexes.get(field_path)
+                if index is not None:
+                    return collection.read(index.numbers)
+            documents = self._result_fields()
+        return [value for value in map(_field_getter(field_path), documents)
+                if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+    def _collections(self) -> Iterator[Tuple[Sequence[str], CollectionNode]]:
+        store = self.parent._data
+        if not self.all_descendants:
+            collection = store.resolve_collection(self.parent._resolved)
+            if collection is not None:
+                yield self.parent._path, collection
+            return
+        for path in store.collection_group(self.parent._path[-1]):
+            collection = store.get_collection(path)
+            if collection is not None:
+                yield path, collection
+
+    def _unordered_fields(self) -> Iterator[Document]:
+        """
+        :returns: the stored fields of the documents matching the filters and
+            having every order field, in no particular order.
+        """
+        order_paths = [key.split('.') for key, _ in self.orders]
+        filtered = any(op not in INDEXED_OPERATORS for _, op, _, _ in self._field_filters)
+        for path, collection in self._collections():
+            matching_ids = self._indexed_doc_ids(path, collection, self._field_filters)
+            if matching_ids is None and not filtered:
+                nodes = collection.read(lambda: list(collection.documents.values()))
+            else:
+                doc_ids = list(collection.documents) if matching_ids is None else matching_ids
+                nodes = (node for _, node in self._matching_documents(collection, doc_ids))
+            for node in nodes:
+                if not node.exists:
+                    continue
+                fields = node.fields
+                if order_paths and any(get_by_field_path(fields, order_path, _MISSING) is _MISSING
+                                       for order_path in order_paths):
+                    continue
+                yield fields
+
+    def _result_fields(self) -> Iterator[Document]:
+        """
+        :returns: the stored fields of the results, without building snapshots.
+            Only a limit, offset or cursors need the documents in order.
+        """
+        if not (self._start_at or self._end_at or self._offset or self._limit):
+            return self._unordered_fields()
+        cursors = self._cursors()
+        if cursors is None:
+            # Cursors that can't be located by their values are applied to snapshots.
+            return (snapshot._stored for snapshot in self.stream() if snapshot.exists)
+        if self.all_descendants:
+            documents = self._collection_group_documents(cursors)
+        else:
+            documents = self._collection_documents(cursors)
+        fields = (node.fields for _, node in documents)
+        return islice(fields, self._offset or 0, (self._offset or 0) + self._limit if self._limit else None)
+
+    def on_snapshot(self, callback: Callable[[List[DocumentSnapshot], List['DocumentChange'], Any], None]) \
+            -> 'Watch':
+        """
+        Calls `callback(docs, changes, read_time)` from a background thread with
+        the results of the query, then again whenever they change.
+        """
+        from mockfirestore.watch import Watch
+        return Watch.for_query(self, callback)
+
+    def _document_matcher(self) -> Predicate:
+        """
+        :returns: a predicate telling whether the fields of a single document belong
+            in the results, deciding like the indexes and the sort do: filters are
+            matched with index semantics and every order field must be present.
+        """
+        predicates = [predicate for _, _, predicate, _ in self._field_filters]
+        for key, _ in self.orders:
+            path = key.split('.')
+            predicates.append(lambda fields, path=path: get_by_field_path(fields, path, _MISSING) is not _MISSING)
+        return _conjunction(predicates) or (lambda fields: True)
+
+    def _collection_documents(self, cursors: Optional[List[Cursor]]) -> Iterator[Tuple[str, DocumentNode]]:
+        collection = self.parent._data.resolve_collection(self.parent._resolved)
+        if collection is None:
+            return iter(())
+
+        scan = self._scan_index(collection, cursors)
+        if scan is not None:
+            return self._matching_documents(collection, self._read_scan(collection, scan))
+
+        matching_ids = self._indexed_doc_ids(self.parent._path, collection, self._field_filters)
+        if self.orders:
+            doc_ids = collection.sorted_ids() if matching_ids is None else matching_ids
+            return self._sorted_documents(self._matching_documents(collection, doc_ids), cursors)
+
+        doc_ids = collection.sorted_ids() if matching_ids is None else sorted(matching_ids)
+        if cursors:
+            # Unordered results are in id order, so only snapshot cursors get here.
+            start, end = self._cursor_range(
+                cursors, lambda values, doc_id, after: (bisect_right if after else bisect_left)(doc_ids, doc_id),
+                0, len(doc_ids), reverse=False)
+            doc_ids = doc_ids[start:end]
+        return self._matching_documents(collection, doc_ids)
+
+    def _collection_group_documents(self, cursors: Optional[List[Cursor]]) \
+            -> Iterator[Tuple[Tuple[str, ...], DocumentNode]]:
+        """
+        Matches the documents of every collection with the query's collection id,
+        found through the store's registry of collection paths rather than by
+        walking the tree. Documents are keyed by their full path, which also
+        orders them and breaks ties between order values.
+        """
+        store = self.parent._data
+
+        def matching() -> Iterator[Tuple[Tuple[str, ...], DocumentNode]]:
+            for path in store.collection_group(self.parent._path[-1]):
+                collection = store.get_collection(path)
+                matching_ids = self._indexed_doc_ids(path, collection, self._field_filters)
+                doc_ids = list(collection.documents) if matching_ids is None else matching_ids
+                for doc_id, node in self._matching_documents(collection, doc_ids):
+                    yield path + (doc_id,), node
+
+        if self.orders:
+            return self._sorted_documents(matching(), cursors)
+
+        documents = sorted(matching(), key=itemgetter(0))
+        if cursors:
+            paths = [path for path, _ in documents]
+            start, end = self._cursor_range(
+                cursors, lambda values, path, after: (bisect_right if after else bisect_left)(paths, path),
+                0, len(paths), reverse=False)
+            documents = documents[start:end]
+        return iter(documents)
+
+    def _group_snapshot(self, path: Tuple[str, ...], node: DocumentNode,
+                        references: Dict[Tuple[str, ...], 'CollectionReference']) -> DocumentSnapshot:
+        collection_path = path[:-1]
+        parent = references.get(collection_path)
+        if parent is None:
+            parent = references[collection_path] = self._collection_reference(collection_path)
+        return parent._document_snapshot(path[-1], node, self.projection)
+
+    def _collection_reference(self, path: Sequence[str]) -> 'CollectionReference':
+        """Builds the references down to a collection without creating any nodes."""
+        from mockfirestore.collection import CollectionReference
+        from mockfirestore.document import DocumentReference
+        reference = None
+        for depth in range(1, len(path) + 1):
+            reference_class = CollectionReference if depth % 2 else DocumentReference
+            reference = reference_class(self.parent._data, list(path[:depth]), parent=reference)
+        return reference
+
     def get(self) -> Iterator[DocumentSnapshot]:
         warnings.warn('Query.get is deprecated, please use Query.stream',
                       category=DeprecationWarning)
         return self.stream()
 
+    def _orders(self) -> List[Tuple[str, str]]:
+        return [(key, direction or ASCENDING) for key, direction in self.orders]
+
+    def _order_keys(self) -> Tuple[Callable[[Sequence[Any]], Tuple], Callable[[str], Any], bool]:
+        """
+        :returns: functions giving the key of the order_by values of a document
+            and the key of its id, and whether the keys are read in reverse. Ids
+            break ties in the direction of the last order, as in Firestore. Mixed
+            directions are handled by inverting the descending values.
+        """
+        descending = [direction == DESCENDING for _, direction in self._orders()]
+        reverse = all(descending)
+        mixed = not reverse and any(descending)
+
+        def values_key(values: Sequence[Any]) -> Tuple:
+            if not mixed:
+                return tuple(value_key(value) for value in values)
+            return tuple(Descending(value_key(value)) if desc else value_key(value)
+                         for value, desc in zip(values, descending))
+
+        def id_key(doc_id: str) -> Any:
+            return Descending(doc_id) if mixed and descending[-1] else doc_id
+
+        return values_key, id_key, reverse
+
+    def _sorted_documents(self, documents: Iterable[Tuple[str, DocumentNode]],
+                          cursors: Optional[List[Cursor]]) -> Iterator[Tuple[str, DocumentNode]]:
+        """
+        Orders the documents on keys computed once per document, so the sort
+        compares plain tuples. With a limit and no cursors only the top
+        offset + limit documents are selected, in O(N log k). Documents missing
+        an order field are left out, as in Firestore.
+        """
+        values_key, id_key, reverse = self._order_keys()
+        paths = [key.split('.') for key, _ in self.orders]
+
+        def keyed() -> Iterator[Tuple[Tuple, Any, str, DocumentNode]]:
+            for doc_id, node in documents:
+                values = [get_by_field_path(node.fields, path, _MISSING) for path in paths]
+                if not any(value is _MISSING for value in values):
+                    yield values_key(values), id_key(doc_id), doc_id, node
+
+        if self._limit and not (self._start_at or self._end_at):
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            keyed_documents = select((self._offset or 0) + self._limit, keyed())
+        else:
+            keyed_documents = sorted(keyed())
+            start, end = 0, len(keyed_documents)
+            if cursors:
+                start, end = self._cursor_range(
+                    cursors,
+                    lambda values, doc_id, after: bisect_entries(
+                        keyed_documents, values_key(values), None if doc_id is None else id_key(doc_id), after),
+                    start, end, reverse)
+            keyed_documents = keyed_documents[start:end]
+            if reverse:
+                keyed_documents.reverse()
+        return ((doc_id, node) for _, _, doc_id, node in keyed_documents)
+
+    def _cursors(self) -> Optional[List[Cursor]]:
+        """
+        :returns: the cursors as (order values, document id, inclusive, is start),
+            or None when one can't be located by its values: a dict without all
+            the order fields, or a dict on an unordered query. The document id is
+            only known for snapshot cursors, and is the full path of the document
+            in collection group queries.
+        """
+        orders = [key for key, _ in self.orders]
+        cursors = []
+        for cursor, is_start in ((self._start_at, True), (self._end_at, False)):
+            if not cursor:
+                continue
+            document_fields_or_snapshot, inclusive = cursor
+            if isinstance(document_fields_or_snapshot, DocumentSnapshot):
+                values = [document_fields_or_snapshot._get_by_field_path(key, _MISSING) for key in orders]
+                if self.all_descendants:
+                    doc_id = tuple(document_fields_or_snapshot.reference._path)
+                else:
+                    doc_id = document_fields_or_snapshot.id
+            elif orders:
+                values = [document_fields_or_snapshot[key] if key in document_fields_or_snapshot
+                          else get_by_field_path(document_fields_or_snapshot, key.split('.'), _MISSING)
+                          for key in orders]
+                doc_id = None
+            else:
+                return None
+            if any(value is _MISSING for value in values):
+                return None
+            cursors.append((values, doc_id, inclusive, is_start))
+        return cursors
+
+    @staticmethod
+    def _cursor_range(cursors: List[Cursor], position: Callable[[Sequence[Any], Any, bool], int],
+                      start: int, end: int, reverse: bool) -> Tuple[int, int]:
+        """
+        Narrows the positions [start, end) of ascending entries to those between
+        the cursors, where `position(values, doc_id, after)` bisects the entries.
+        When the entries are read in reverse, the start cursor bounds the end.
+        """
+        for values, doc_id, inclusive, is_start in cursors:
+            if is_start != reverse:
+                start = max(start, position(values, doc_id, not inclusive))
+            else:
+                end = min(end, position(values, doc_id, inclusive))
+        return start, max(start, end)
+
+    def _check_index(self):
+        store = self.parent._data
+        if not store.require_indexes:
+            return
+
+        filters = [(field, op) for field, op, _, _ in self._field_filters]
+        orders = self._orders()
+        if not needs_composite_index(filters, orders):
+            return
+        collection_id = self.parent._path[-1]
+        if any(satisfies(definition, filters, orders)
+               for definition in store.index_definitions.get(collection_id, [])):
+            return
+        raise FailedPrecondition('The query requires an index on {} (filters: {}, orders: {})'.format(
+            collection_id, filters, orders))
+
+    def _scan_index(self, collection: CollectionNode,
+                    cursors: Optional[List[Cursor]]) -> Optional[Callable[[], Iterator[str]]]:
+        """
+        Reads ordered queries straight from an index that is already sorted the
+        requested way, so nothing has to be sorted, cursors are found by bisection
+        and a limit ends the scan early. A declared composite index is used when
+        its leading fields match the equality filters; otherwise a single order
+        without indexed filters is read from the field index.
+
+        :returns: a function reading the ids of the documents matching the
+            indexed filters, in order, or None when no index gives the requested
+            order.
+        """
+        if not self.orders or cursors is None or self.all_descendants:
+            return None
+
+        store = self.parent._data
+        orders = self._orders()
+        equalities = {field: value for field, op, _, value in self._field_filters if op == '=='}
+        definitions = store.index_definitions.get(self.parent._path[-1], [])
+        found = find_scan_index(definitions, set(equalities), orders)
+        if found is not None:
+            definition, reverse = found
+            prefix = [equalities[field] for field, _ in definition[:len(equalities)]]
+            index = store.index(self.parent._path, collection, definition)
+            remaining_filters = [field_filter for field_filter in self._field_filters
+                                 if field_filter[1] != '==' or field_filter[3] is not equalities[field_filter[0]]]
+        elif len(orders) == 1 and not any(op in INDEXED_OPERATORS for _, op, _, _ in self._field_filters):
+            # With indexed filters, selecting from the matching ids is cheaper
+            # than walking the whole field index.
+            field, direction = orders[0]
+            prefix = []
+            index = store.index(self.parent._path, collection, field)
+            reverse = direction == DESCENDING
+            remaining_filters = []
+        else:
+            return None
+
+        def scan() -> Iterator[str]:
+            start, end = index.position(prefix), index.position(prefix, after=True)
+            if cursors:
+                start, end = self._cursor_range(
+                    cursors, lambda values, doc_id, after: index.position(prefix + values, doc_id, after),
+                    start, end, reverse)
+            doc_ids = index.scan(start, end, reverse)
+            matching_ids = self._indexed_doc_ids(self.parent._path, collection, remaining_filters)
+            if matching_ids is None:
+                return doc_ids
+            return (doc_id for doc_id in doc_ids if doc_id in matching_ids)
+
+        return scan
+
+    @staticmethod
+    def _read_scan(collection: CollectionNode, scan: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Reads the ids of an index scan lazily without locking. Positions in the
+        index are only valid until the next write to the collection: if one
+        happens, the scan starts over and skips the ids already read.
+        """
+        read_ids = set()
+        while True:
+            sequence = collection.sequence
+            if sequence & 1:
+                # Let the writer finish.
+                time.sleep(0)
+                continue
+            try:
+                for doc_id in scan():
+                    if collection.sequence != sequence:
+                        break
+                    if doc_id not in read_ids:
+                        read_ids.add(doc_id)
+                        yield doc_id
+                else:
+                    return
+            except Exception:
+                if collection.sequence == sequence:
+                    raise
+
+    def _matching_documents(self, collection: CollectionNode,
+                            doc_ids: Iterable[str]) -> Iterator[Tuple[str, DocumentNode]]:
+        """Checks the filters the indexes did not resolve against the stored fields."""
+        matches = _conjunction([predicate for _, op, predicate, _ in self._field_filters
+                                if op not in INDEXED_OPERATORS])
+        documents = collection.documents
+        for doc_id in doc_ids:
+            node = documents.get(doc_id)
+            if node is not None and node.exists and (matches is None or matches(node.fields)):
+                yield doc_id, node
+
+    def _indexed_doc_ids(self, path: Sequence[str], collection: CollectionNode,
+                         field_filters) -> Optional[Set[str]]:
+        """
+        Resolves the indexable filters to the ids of the matching documents,
+        without building any snapshots.
+        """
+        indexed_filters = [(field, op, value) for field, op, _, value in field_filters
+                           if op in INDEXED_OPERATORS]
+        if not indexed_filters:
+            return None
+
+        indexes = [(self.parent._data.index(path, collection, field), op, value)
+                   for field, op, value in indexed_filters]
+
+        def lookup() -> Set[str]:
+            doc_ids = None
+            for index, op, value in indexes:
+                matches = index.lookup(op, value)
+                doc_ids = matches if doc_ids is None else doc_ids & matches
+                if not doc_ids:
+                    break
+            return doc_ids
+
+        return collection.read(lookup)
+
     def _add_field_filter(self, field: str, op: str, value: Any):
-        compare = self._compare_func(op)
-        self._field_filters.append((field, compare, value))
+        predicate = _compile_filter(field, op, value)
+        self._field_filters.append((field, op, predicate, value))
+
+    def select(self, field_paths: Iterable[str]) -> 'Query':
+        """Only returns the given fields of the documents, which are the only ones snapshots copy."""
+        self.projection = list(field_paths)
+        return self
 
     def where(self, field: str, op: str, value: Any) -> 'Query':
         self._add_field_filter(field, op, value)
@@ -117,23 +614,3 @@ class Query:
                     return islice(docs, 0, index + 1, None)
                 elif not before and not start:
                     return islice(docs, 0, index, None)
-
-    def _compare_func(self, op: str) -> Callable[[T, T], bool]:
-        if op == '==':
-            return lambda x, y: x == y
-        elif op == '!=':
-            return lambda x, y: x != y
-        elif op == '<':
-            return lambda x, y: x < y
-        elif op == '<=':
-            return lambda x, y: x <= y
-        elif op == '>':
-            return lambda x, y: x > y
-        elif op == '>=':
-            return lambda x, y: x >= y
-        elif op == 'in':
-            return lambda x, y: x in y
-        elif op == 'array_contains':
-            return lambda x, y: y in x
-        elif op == 'array_contains_any':
-            return lambda x, y: any([val in y for val in x])
@@ -1,7 +1,8 @@
-from functools import partial
-import random
-from typing import Iterable, Callable
-from mockfirestore._helpers import generate_random_string, Timestamp
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from mockfirestore import Aborted
+from mockfirestore._helpers import generate_random_string
+from mockfirestore.batch import CREATE, SET, UPDATE, DELETE, StagedWrites, WriteResult
 from mockfirestore.document import DocumentReference, DocumentSnapshot
 from mockfirestore.query import Query
 
@@ -10,17 +11,22 @@ _MISSING_ID_TEMPLATE = "The transaction has no transaction ID, so it cannot be {
 _CANT_BEGIN = "The transaction has already begun. Current transaction ID: {!r}."
 _CANT_ROLLBACK = _MISSING_ID_TEMPLATE.format("rolled back")
 _CANT_COMMIT = _MISSING_ID_TEMPLATE.format("committed")
-
-
-class WriteResult:
-    def __init__(self):
-        self.update_time = Timestamp.from_now()
+_EXCEED_ATTEMPTS_TEMPLATE = "Failed to commit transaction in {:d} attempts."
+# Recorded for a document whose snapshot may be older than its version, so the commit always fails.
+_STALE = -1
 
 
 class Transaction:
     """
     This mostly follows the model from
     https://googleapis.dev/python/firestore/latest/transaction.html
+
+    Concurrency is optimistic: the version of every document read through the
+    transaction is recorded, and the commit raises `Aborted` if any of them
+    changed since. Checking the versions and applying the writes happen as one
+    step, holding the locks of the documents involved, so concurrent
+    transactions behave as if run one after the other. Use `transactional` to
+    retry on conflicts.
     """
     def __init__(self, client,
                  max_attempts=MAX_ATTEMPTS, read_only=False):
@@ -28,8 +34,10 @@ class Transaction:
         self._max_attempts = max_attempts
         self._read_only = read_only
         self._id = None
-        self._write_ops = []
+        self._write_ops = []  # type: List[Tuple[DocumentReference, str, Optional[Dict[str, Any]], bool]]
+        self._read_versions = {}  # type: Dict[Tuple[str, ...], int]
         self.write_results = None
+        self.commit_time = None
 
     @property
     def in_progress(self):
@@ -40,11 +48,14 @@ class Transaction:
         return self._id
 
     def _begin(self, retry_id=None):
+        if self.in_progress:
+            raise ValueError(_CANT_BEGIN.format(self._id))
         # generate a random ID to set the transaction as in_progress
         self._id = generate_random_string()
 
     def _clean_up(self):
         self._write_ops.clear()
+        self._read_versions.clear()
         self._id = None
 
     def _rollback(self):
@@ -57,23 +68,50 @@ class Transaction:
         if not self.in_progress:
             raise ValueError(_CANT_COMMIT)
 
-        results = []
-        for write_op in self._write_ops:
-            write_op()
-            results.append(WriteResult())
+        store = self._client._store
+        paths = list(self._read_versions) + [reference._path for reference, _, _, _ in self._write_ops]
+        with store.lock(*paths):
+            for path, version in self._read_versions.items():
+                if store.document_version(path) != version:
+                    raise Aborted('Transaction {} read {}, which was changed by a concurrent write'.format(
+                        self._id, list(path)))
+            staged = StagedWrites(store)
+            for reference, kind, document_data, merge in self._write_ops:
+                staged.stage(reference, kind, document_data, merge)
+            self.commit_time = staged.apply()
+        results = [WriteResult(self.commit_time) for _ in self._write_ops]
         self.write_results = results
         self._clean_up()
         return results
 
+    def _read(self, snapshots: Iterable[DocumentSnapshot]) -> Iterator[DocumentSnapshot]:
+        """Records the version of each document read, as it was when its snapshot was taken."""
+        store = self._client._store
+        for snapshot in snapshots:
+            path = tuple(snapshot.reference._path)
+            node = store.get_document(path)
+            # The version is read before the fields: writes replace the fields
+            # first, so matching fields mean the version is not newer than the snapshot.
+            version = 0 if node is None else node.version
+            if node is None:
+                matches = not snapshot.exists
+            else:
+                matches = node.fields is snapshot._stored or not (snapshot.exists or node.exists)
+            if not matches:
+                version = _STALE
+            if self._read_versions.setdefault(path, version) != version:
+                self._read_versions[path] = _STALE
+            yield snapshot
+
     def get_all(self,
                 references: Iterable[DocumentReference]) -> Iterable[DocumentSnapshot]:
-        return self._client.get_all(references)
+        return self._read(self._client.get_all(references))
 
     def get(self, ref_or_query) -> Iterable[DocumentSnapshot]:
         if isinstance(ref_or_query, DocumentReference):
-            return self._client.get_all([ref_or_query])
+            return self._read(self._client.get_all([ref_or_query]))
         elif isinstance(ref_or_query, Query):
-            return ref_or_query.stream()
+            return self._read(ref_or_query.stream())
         else:
             raise ValueError(
                 'Value for argument "ref_or_query" must be a DocumentReference or a Query.'
@@ -82,31 +120,27 @@ class Transaction:
     # methods from
     # https://googleapis.dev/python/firestore/latest/batch.html#google.cloud.firestore_v1.batch.WriteBatch
 
-    def _add_write_op(self, write_op: Callable):
+    def _add_write_op(self, reference: DocumentReference, kind: str,
+                      document_data: Optional[Dict[str, Any]] = None, merge: bool = False):
         if self._read_only:
             raise ValueError(
                 "Cannot perform write operation in read-only transaction."
             )
-        self._write_ops.append(write_op)
+        self._write_ops.append((reference, kind, document_data, merge))
 
     def create(self, reference: DocumentReference, document_data):
-        # this is a no-op, because if we have a DocumentReference
-        # it's already in the MockFirestore
-        ...
+        self._add_write_op(reference, CREATE, document_data)
 
     def set(self, reference: DocumentReference, document_data: dict,
             merge=False):
-        write_op = partial(reference.set, document_data, merge=merge)
-        self._add_write_op(write_op)
+        self._add_write_op(reference, SET, document_data, merge)
 
     def update(self, reference: DocumentReference,
                field_updates: dict, option=None):
-        write_op = partial(reference.update, field_updates)
-        self._add_write_op(write_op)
+        self._add_write_op(reference, UPDATE, field_updates)
 
     def delete(self, reference: DocumentReference, option=None):
-        write_op = reference.delete
-        self._add_write_op(write_op)
+        self._add_write_op(reference, DELETE)
 
     def commit(self):
         return self._commit()
@@ -117,3 +151,38 @@ class Transaction:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is None:
             self.commit()
+
+
+def transactional(to_wrap: Callable) -> Callable:
+    """
+    Decorates a function taking a transaction as its first argument, running it
+    in that transaction and committing, e.g.
+
+        @transactional
+        def transfer(transaction, source, target, amount): ...
+
+        transfer(client.transaction(), source, target, 10)
+
+    Conflicting commits are retried up to the transaction's `max_attempts`.
+    Any other error rolls the transaction back and is raised.
+    """
+    @wraps(to_wrap)
+    def wrapper(transaction: Transaction, *args, **kwargs):
+        for _ in range(transaction._max_attempts):
+            transaction._begin()
+            try:
+                result = to_wrap(transaction, *args, **kwargs)
+            except BaseException:
+                transaction._rollback()
+                raise
+            try:
+                transaction._commit()
+            except Aborted:
+                transaction._rollback()
+                continue
+            except BaseException:
+                transaction._rollback()
+                raise
+            return result
+        raise ValueError(_EXCEED_ATTEMPTS_TEMPLATE.format(transaction._max_attempts))
+    return wrapper
@@ -0,0 +1,425 @@
+"""
+Real-time listeners, as registered by `on_snapshot`. Writers pass every change
+to the `Listeners` of the store, which keeps the latest state of each document
+some watch is interested in. A background thread hands those to the watches in
+batches, so a burst of writes is delivered as one call of each callback.
+
+Watches keep their results up to date from the changes alone: each changed
+document is checked against the query on its own and moved within the sorted
+results, so the query is never run again. Limits, offsets and cursors select a
+window of the sorted results, which is compared before and after the changes.
+Only a clear or restore of the whole store makes watches scan their documents
+again.
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from mockfirestore._helpers import Document, DocumentNode, Store, Timestamp, get_by_field_path
+from mockfirestore._indexes import bisect_entries
+from mockfirestore.document import DocumentReference, DocumentSnapshot
+
+# Changes made within this many seconds of the first one are delivered together.
+COALESCE_INTERVAL = 0.01
+
+Path = Tuple[str, ...]
+# Fields, create time and update time of a stored document.
+State = Tuple[Document, Timestamp, Timestamp]
+# Sort keys of the order values, sort key of the document id, path.
+Entry = Tuple[Tuple, Any, Path]
+Callback = Callable[[List[DocumentSnapshot], List['DocumentChange'], Timestamp], None]
+
+_DOCUMENT, _COLLECTION, _GROUP = range(3)
+
+
+def _state(node: Optional[DocumentNode]) -> Optional[State]:
+    if node is None or not node.exists:
+        return None
+    return node.fields, node.create_time, node.update_time
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    """
+    A change to the results of a watch. Indexes are positions in the results as
+    the changes of a snapshot are applied one by one: removals first, then
+    additions, then modifications. They are -1 where the document is absent.
+    """
+
+    def __init__(self, type: ChangeType, document: DocumentSnapshot, old_index: int, new_index: int) -> None:
+        self.type = type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class Listeners:
+    """
+    Collects the changes to the documents of a store for its watches. `notify`
+    is called by writers with the locks of the changed paths held, so the
+    changes of a document arrive in order.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._watches = []  # type: List[Watch]
+        # Number of watches on each document path, collection path and collection id.
+        self._scopes = ({}, {}, {})  # type: Tuple[Dict[Any, int], Dict[Any, int], Dict[Any, int]]
+        # Latest state of each changed document, with the number of the change.
+        self._pending = {}  # type: Dict[Path, Tuple[int, Optional[State]]]
+        self._sequence = 0
+        self._reset = False
+        self._started = []  # type: List[Watch]
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def notify(self, changes: Iterable[Tuple[Path, Optional[DocumentNode]]]):
+        documents, collections, groups = self._scopes
+        with self._condition:
+            for path, node in changes:
+                if path in documents or path[:-1] in collections or path[-2] in groups:
+                    self._sequence += 1
+                    self._pending[path] = self._sequence, _state(node)
+            if self._pending:
+                self._condition.notify()
+
+    def reset(self):
+        """Notes that the whole store changed, so every watch has to scan its documents again."""
+        with self._condition:
+            self._pending = {}
+            self._reset = True
+            self._condition.notify()
+
+    def add(self, watch: 'Watch'):
+        """
+        Starts passing changes to a watch. The caller holds the locks of the
+        watched paths, so the watch has seen every change made so far.
+        """
+        with self._condition:
+            kind, scope = watch._scope
+            self._scopes[kind][scope] = self._scopes[kind].get(scope, 0) + 1
+            watch._since = self._sequence
+            self._watches.append(watch)
+            self._started.append(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name='mockfirestore-watch', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, watch: 'Watch'):
+        with self._condition:
+            if watch not in self._watches:
+                return
+            kind, scope = watch._scope
+            self._scopes[kind][scope] -= 1
+            if not self._scopes[kind][scope]:
+                del self._scopes[kind][scope]
+            self._watches.remove(watch)
+            if watch in self._started:
+                self._started.remove(watch)
+            if not self._watches:
+                # Wakes the dispatcher so that it stops.
+                self._condition.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not (self._pending or self._reset or self._started):
+                    if not self._watches:
+                        self._thread = None
+                        return
+                    self._condition.wait()
+            time.sleep(COALESCE_INTERVAL)
+            with self._condition:
+                pending, self._pending = self._pending, {}
+                reset, self._reset = self._reset, False
+                started, self._started = self._started, []
+                watches = list(self._watches)
+            for watch in started:
+                watch._deliver(watch._initial_changes)
+                watch._initial_changes = None
+            for watch in watches:
+                if reset:
+                    # Changes from before the reset are stale, and later ones are seen by the scan.
+                    changes = watch._update(watch._scan())
+                else:
+                    changes = watch._update({path: state for path, (sequence, state) in pending.items()
+                                             if sequence > watch._since and watch._watches(path)})
+                if changes:
+                    watch._deliver(changes)
+
+
+def _listeners(store: Store) -> Listeners:
+    with store._root_lock:
+        if store.listeners is None:
+            store.listeners = Listeners()
+        return store.listeners
+
+
+class Watch:
+    """
+    A listener registered by `on_snapshot`, which calls
+    `callback(docs, changes, read_time)` from a background thread: once with the
+    current results, then whenever they change. This mostly follows the model from
+    https://googleapis.dev/python/firestore/latest/watch.html
+    """
+
+    def __init__(self, store: Store, callback: Callback, scope: Tuple[int, Any]) -> None:
+        self._store = store
+        self._callback = callback
+        self._scope = scope
+        self._listeners = _listeners(store)
+        self._since = 0
+        self._initial_changes = None  # type: Optional[List[DocumentChange]]
+        self._closed = False
+
+    @classmethod
+    def for_document(cls, reference: DocumentReference, callback: Callback) -> 'Watch':
+        return cls._start(_DocumentWatch(reference, callback), reference._data.lock(reference._path))
+
+    @classmethod
+    def for_query(cls, query: 'Query', callback: Callback) -> 'Watch':
+        store = query.parent._data
+        lock = store.lock_all() if query.all_descendants else store.lock(query.parent._path)
+        return cls._start(_QueryWatch(query, callback), lock)
+
+    @staticmethod
+    def _start(watch: 'Watch', lock) -> 'Watch':
+        with lock:
+            watch._initial_changes = watch._update(watch._scan())
+            watch._listeners.add(watch)
+        return watch
+
+    def unsubscribe(self):
+        self._closed = True
+        self._listeners.remove(self)
+
+    def _deliver(self, changes: List[DocumentChange]):
+        if self._closed:
+            return
+        try:
+            self._callback(self._documents(), changes, Timestamp.from_now())
+        except Exception:
+            # The watch stops, as it would in Firestore, without stopping the others.
+            self.unsubscribe()
+            sys.excepthook(*sys.exc_info())
+
+    def _watches(self, path: Path) -> bool:
+        raise NotImplementedError
+
+    def _scan(self) -> Dict[Path, Optional[State]]:
+        """:returns: the current state of every watched document, and None for those seen before."""
+        raise NotImplementedError
+
+    def _update(self, states: Dict[Path, Optional[State]]) -> List[DocumentChange]:
+        raise NotImplementedError
+
+    def _documents(self) -> List[DocumentSnapshot]:
+        raise NotImplementedError
+
+
+class _DocumentWatch(Watch):
+    def __init__(self, reference: DocumentReference, callback: Callback) -> None:
+        self._path = tuple(reference._path)
+        super().__init__(reference._data, callback, (_DOCUMENT, self._path))
+        self._reference = reference
+        self._state = None  # type: Optional[State]
+        self._snapshot = None  # type: Optional[DocumentSnapshot]
+
+    def _watches(self, path: Path) -> bool:
+        return path == self._path
+
+    def _scan(self) -> Dict[Path, Optional[State]]:
+        return {self._path: _state(self._store.get_document(self._path))}
+
+    def _update(self, states: Dict[Path, Optional[State]]) -> List[DocumentChange]:
+        if self._path not in states:
+            return []
+        state, old_snapshot = states[self._path], self._snapshot
+        if state is None and old_snapshot is None or \
+                state is not None and old_snapshot is not None and state[0] is self._state[0]:
+            return []
+        self._state = state
+        if state is None:
+            self._snapshot = None
+            return [DocumentChange(ChangeType.REMOVED, old_snapshot, 0, -1)]
+        fields, create_time, update_time = state
+        self._snapshot = DocumentSnapshot(self._reference, fields, read_only=self._store.read_only_snapshots,
+                                          create_time=create_time, update_time=update_time)
+        if old_snapshot is None:
+            return [DocumentChange(ChangeType.ADDED, self._snapshot, -1, 0)]
+        return [DocumentChange(ChangeType.MODIFIED, self._snapshot, 0, 0)]
+
+    def _documents(self) -> List[DocumentSnapshot]:
+        return [] if self._snapshot is None else [self._snapshot]
+
+
+class _QueryWatch(Watch):
+    """
+    Keeps the sorted entries of every document matching the filters of a query,
+    and the snapshots of those in the results.
+    """
+
+    def __init__(self, query: 'Query', callback: Callback) -> None:
+        parent_path = tuple(query.parent._path)
+        scope = (_GROUP, parent_path[-1]) if query.all_descendants else (_COLLECTION, parent_path)
+        super().__init__(query.parent._data, callback, scope)
+        self._query = query
+        self._parent_path = parent_path
+        self._matches = query._document_matcher()
+        self._order_paths = [key.split('.') for key, _ in query.orders]
+        self._values_key, self._id_key, reverse = query._order_keys()
+        # Unordered results are in ascending id order.
+        self._reverse = reverse and bool(query.orders)
+        self._cursors = query._cursors()
+        self._windowed = bool(query._limit or query._offset or query._start_at or query._end_at)
+        self._states = {}  # type: Dict[Path, State]
+        self._entries = []  # type: List[Entry]
+        self._entry_of = {}  # type: Dict[Path, Entry]
+        # Entries of the results, which are all the entries unless the query selects a window.
+        self._results = [] if self._windowed else self._entries  # type: List[Entry]
+        self._snapshots = {}  # type: Dict[Path, DocumentSnapshot]
+        self._collection_references = {}  # type: Dict[Path, 'CollectionReference']
+
+    def _watches(self, path: Path) -> bool:
+        if self._query.all_descendants:
+            return path[-2] == self._parent_path[-1]
+        return path[:-1] == self._parent_path
+
+    def _scan(self) -> Dict[Path, Optional[State]]:
+        if self._query.all_descendants:
+            collection_paths = self._store.collection_group(self._parent_path[-1])
+        else:
+            collection_paths = [self._parent_path]
+        states = dict.fromkeys(self._states)  # type: Dict[Path, Optional[State]]
+        for collection_path in collection_paths:
+            collection = self._store.get_collection(collection_path)
+            if collection is None:
+                continue
+            for doc_id, node in collection.read(lambda: list(collection.documents.items())):
+                states[collection_path + (doc_id,)] = _state(node)
+        return states
+
+    def _entry(self, path: Path, fields: Document) -> Entry:
+        values = [get_by_field_path(fields, order_path) for order_path in self._order_paths]
+        doc_id = path if self._query.all_descendants else path[-1]
+        return self._values_key(values), self._id_key(doc_id), path
+
+    def _update(self, states: Dict[Path, Optional[State]]) -> List[DocumentChange]:
+        removed, added, modified = [], [], []  # type: List[Entry], List[Entry], List[Tuple[Entry, Entry]]
+        for path, state in states.items():
+            if state is not None and not self._matches(state[0]):
+                state = None
+            old_state = self._states.get(path)
+            if state is None:
+                if old_state is not None:
+                    del self._states[path]
+                    removed.append(self._entry_of.pop(path))
+            elif old_state is None or state[0] is not old_state[0]:
+                old_entry = self._entry_of.get(path)
+                self._states[path] = state
+                entry = self._entry_of[path] = self._entry(path, state[0])
+                if old_entry is None:
+                    added.append(entry)
+                else:
+                    modified.append((old_entry, entry))
+        if not (removed or added or modified):
+            return []
+        if not self._windowed:
+            return self._move(removed, added, modified)
+
+        for entry in removed:
+            _remove(self._entries, entry)
+        for old_entry, entry in modified:
+            _remove(self._entries, old_entry)
+            insort(self._entries, entry)
+        for entry in added:
+            insort(self._entries, entry)
+        window = self._window()
+        in_window = {entry[2] for entry in window}
+        in_results = {entry[2]: entry for entry in self._results}
+        changed = {entry[2] for _, entry in modified}
+        return self._move([entry for entry in self._results if entry[2] not in in_window],
+                          [entry for entry in window if entry[2] not in in_results],
+                          [(in_results[entry[2]], entry) for entry in window
+                           if entry[2] in in_results and entry[2] in changed])
+
+    def _window(self) -> List[Entry]:
+        """:returns: the entries selected by the cursors, offset and limit of the query."""
+        entries, query = self._entries, self._query
+        if self._cursors is None:
+            # A cursor that can't be located by its values: the query is run instead.
+            paths = (tuple(snapshot.reference._path) for snapshot in query.stream())
+            return sorted(self._entry_of[path] for path in paths if path in self._entry_of)
+        start, end = 0, len(entries)
+        if self._cursors:
+            start, end = query._cursor_range(
+                self._cursors,
+                lambda values, doc_id, after: bisect_entries(
+                    entries, self._values_key(values), None if doc_id is None else self._id_key(doc_id), after),
+                start, end, self._reverse)
+        offset = query._offset or 0
+        if self._reverse:
+            end = max(start, end - offset)
+            if query._limit:
+                start = max(start, end - query._limit)
+        else:
+            start = min(end, start + offset)
+            if query._limit:
+                end = min(end, start + query._limit)
+        return entries[start:end]
+
+    def _move(self, removed: List[Entry], added: List[Entry],
+              modified: List[Tuple[Entry, Entry]]) -> List[DocumentChange]:
+        """Applies changes to the entries of the results, in the order `DocumentChange` describes."""
+        results, changes = self._results, []
+        for entry in sorted(removed, reverse=self._reverse):
+            index = self._index(_remove(results, entry), len(results) + 1)
+            changes.append(DocumentChange(ChangeType.REMOVED, self._snapshots.pop(entry[2]), index, -1))
+        for entry in sorted(added, reverse=self._reverse):
+            insort(results, entry)
+            index = self._index(bisect_left(results, entry), len(results))
+            changes.append(DocumentChange(ChangeType.ADDED, self._snapshot(entry[2]), -1, index))
+        for old_entry, entry in sorted(modified, key=lambda entries: entries[1], reverse=self._reverse):
+            old_index = self._index(_remove(results, old_entry), len(results) + 1)
+            insort(results, entry)
+            index = self._index(bisect_left(results, entry), len(results))
+            changes.append(DocumentChange(ChangeType.MODIFIED, self._snapshot(entry[2]), old_index, index))
+        return changes
+
+    def _index(self, position: int, length: int) -> int:
+        return length - 1 - position if self._reverse else position
+
+    def _snapshot(self, path: Path) -> DocumentSnapshot:
+        fields, create_time, update_time = self._states[path]
+        collection_path = path[:-1]
+        parent = self._collection_references.get(collection_path)
+        if parent is None:
+            parent = self._collection_references[collection_path] = \
+                self._query.parent if collection_path == self._parent_path \
+                else self._query._collection_reference(collection_path)
+        reference = DocumentReference(self._store, list(path), parent=parent)
+        snapshot = DocumentSnapshot(reference, fields, read_only=self._store.read_only_snapshots,
+                                    create_time=create_time, update_time=update_time)
+        if self._query.projection is not None:
+            snapshot._mask(self._query.projection)
+        self._snapshots[path] = snapshot
+        return snapshot
+
+    def _documents(self) -> List[DocumentSnapshot]:
+        entries = reversed(self._results) if self._reverse else self._results
+        return [self._snapshots[entry[2]] for entry in entries]
+
+
+def _remove(entries: List[Entry], entry: Entry) -> int:
+    """Removes an entry from sorted entries, and returns where it was."""
+    position = bisect_left(entries, entry)
+    del entries[position]
+    return position
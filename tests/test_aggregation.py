@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from mockfirestore import MockFirestore
+
+
+class TestAggregationQuery(TestCase):
+    def setUp(self) -> None:
+        self.fs = MockFirestore()
+        self.fs._data = {'users': {
+            'alovelace': {'born': 1815, 'score': 3},
+            'cbabbage': {'born': 1791, 'score': 4.5},
+            'mfaraday': {'born': 1791, 'score': 'high'},
+            'ghopper': {'born': 1906},
+        }}
+
+    @staticmethod
+    def values(aggregation_query, transaction=None):
+        [results] = aggregation_query.get(transaction)
+        return {result.alias: result.value for result in results}
+
+    def test_count(self):
+        users = self.fs.collection('users')
+        self.assertEqual({'field_1': 4}, self.values(users.count()))
+        self.assertEqual({'all': 2}, self.values(users.where('born', '==', 1791).count(alias='all')))
+        self.assertEqual({'field_1': 1}, self.values(users.where('born', '!=', 1791).where('born', '<', 1900).count()))
+        self.assertEqual({'field_1': 3}, self.values(users.order_by('score').count()))
+
+    def test_count_limitAndOffset(self):
+        users = self.fs.collection('users')
+        self.assertEqual({'field_1': 2}, self.values(users.limit(2).count()))
+        self.assertEqual({'field_1': 1}, self.values(users.offset(3).count()))
+        self.assertEqual({'field_1': 2}, self.values(users.order_by('born').start_after({'born': 1791}).count()))
+
+    def test_sumAndAvg_ignoreNonNumericValues(self):
+        users = self.fs.collection('users')
+        self.assertEqual({'total': 7.5, 'mean': 3.75},
+                         self.values(users.sum('score', alias='total').avg('score', alias='mean')))
+        self.assertEqual({'field_1': 0, 'field_2': None},
+                         self.values(users.where('born', '>', 1900).sum('score').avg('score')))
+
+    def test_sumAndAvg_useExistingIndex(self):
+        users = self.fs.collection('users')
+        list(users.where('score', '>', 0).stream())
+        self.assertEqual({'field_1': 7.5, 'field_2': 4}, self.values(users.sum('score').count()))
+        users.document('ghopper').update({'score': 2.5})
+        self.assertEqual({'field_1': 10.0}, self.values(users.sum('score')))
+
+    def test_sum_withLimitUsesOrder(self):
+        users = self.fs.collection('users')
+        self.assertEqual({'field_1': 3}, self.values(users.order_by('born', direction='DESCENDING').limit(2)
+                                                     .sum('score')))
+
+    def test_count_collectionGroup(self):
+        self.fs.collection('users/alovelace/friends').document('cbabbage').set({'born': 1791})
+        self.fs.collection('users/ghopper/friends').document('cbabbage').set({'born': 1791})
+        self.assertEqual({'field_1': 2}, self.values(self.fs.collection_group('friends').count()))
+
+    def test_count_inTransaction(self):
+        transaction = self.fs.transaction()
+        transaction._begin()
+        self.assertEqual({'field_1': 2},
+                         self.values(self.fs.collection('users').where('born', '==', 1791).count(), transaction))
+        self.assertEqual(2, len(transaction._read_versions))
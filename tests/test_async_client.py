@@ -0,0 +1,128 @@
+import asyncio
+import functools
+from unittest import TestCase
+
+from google.cloud import firestore
+
+from mockfirestore import (
+    AsyncMockFirestore, AsyncDocumentReference, Aborted, AlreadyExists, NotFound, async_transactional
+)
+
+
+def run_async(test):
+    """Runs an async test on its own event loop, as IsolatedAsyncioTestCase only exists from Python 3.8."""
+    @functools.wraps(test)
+    def wrapper(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(test(self))
+        finally:
+            loop.close()
+    return wrapper
+
+
+class TestAsyncMockFirestore(TestCase):
+    def setUp(self) -> None:
+        self.fs = AsyncMockFirestore()
+        self.fs._data = {'users': {
+            'alovelace': {'first': 'Ada', 'born': 1815},
+            'cbabbage': {'first': 'Charles', 'born': 1791},
+        }}
+
+    @run_async
+    async def test_asyncDocument_getSetUpdateDelete(self):
+        doc = self.fs.collection('users').document('alovelace')
+        snapshot = await doc.get()
+        self.assertEqual({'first': 'Ada', 'born': 1815}, snapshot.to_dict())
+        self.assertIsInstance(snapshot.reference, AsyncDocumentReference)
+
+        await doc.update({'born': firestore.Increment(1)})
+        await doc.set({'last': 'Lovelace'}, merge=True)
+        self.assertEqual({'first': 'Ada', 'born': 1816, 'last': 'Lovelace'}, (await doc.get()).to_dict())
+
+        await doc.delete()
+        self.assertFalse((await doc.get()).exists)
+        with self.assertRaises(NotFound):
+            await doc.update({'born': 1815})
+
+    @run_async
+    async def test_asyncDocument_create(self):
+        await self.fs.collection('users').document('mfaraday').create({'born': 1791})
+        self.assertEqual({'born': 1791}, (await self.fs.document('users/mfaraday').get()).to_dict())
+        with self.assertRaises(AlreadyExists):
+            await self.fs.collection('users').document('alovelace').create({'born': 1815})
+
+    @run_async
+    async def test_asyncQuery_stream(self):
+        query = self.fs.collection('users').where('born', '>', 1800).order_by('born')
+        self.assertEqual(['alovelace'], [doc.id async for doc in query.stream()])
+        docs = await self.fs.collection('users').order_by('born', direction='DESCENDING').get()
+        self.assertEqual(['alovelace', 'cbabbage'], [doc.id for doc in docs])
+
+    @run_async
+    async def test_asyncQuery_streamYieldsToEventLoop(self):
+        self.fs._data = {'numbers': {str(i): {'n': i} for i in range(1000)}}
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0)
+        ticks.clear()
+        count = len([doc async for doc in self.fs.collection('numbers').order_by('n').stream()])
+        task.cancel()
+        self.assertEqual(1000, count)
+        self.assertGreaterEqual(len(ticks), 9)
+
+    @run_async
+    async def test_asyncCollection_addAndListDocuments(self):
+        _, doc = await self.fs.collection('users').add({'first': 'Michael'}, 'mfaraday')
+        self.assertEqual({'first': 'Michael'}, (await doc.get()).to_dict())
+        ids = [reference.id async for reference in self.fs.collection('users').list_documents()]
+        self.assertEqual({'alovelace', 'cbabbage', 'mfaraday'}, set(ids))
+        self.assertEqual(['users'], [collection.id async for collection in self.fs.collections()])
+
+    @run_async
+    async def test_asyncClient_getAll(self):
+        references = [self.fs.document('users/alovelace'), self.fs.document('users/cbabbage')]
+        docs = [doc async for doc in self.fs.get_all(references)]
+        self.assertEqual({'alovelace', 'cbabbage'}, {doc.id for doc in docs})
+
+    @run_async
+    async def test_asyncBatch_commit(self):
+        async with self.fs.batch() as batch:
+            batch.set(self.fs.document('users/mfaraday'), {'born': 1791})
+            batch.delete(self.fs.document('users/cbabbage'))
+        self.assertTrue((await self.fs.document('users/mfaraday').get()).exists)
+        self.assertFalse((await self.fs.document('users/cbabbage').get()).exists)
+
+    @run_async
+    async def test_asyncTransactional_retriesConflicts(self):
+        doc = self.fs.document('users/alovelace')
+        attempts = []
+
+        @async_transactional
+        async def increment(transaction, reference):
+            snapshot = [snapshot async for snapshot in await transaction.get(reference)][0]
+            if not attempts:
+                await reference.update({'born': 1900})
+            attempts.append(snapshot.get('born'))
+            transaction.update(reference, {'born': snapshot.get('born') + 1})
+
+        await increment(self.fs.transaction(), doc)
+        self.assertEqual([1815, 1900], attempts)
+        self.assertEqual(1901, (await doc.get()).get('born'))
+
+    @run_async
+    async def test_asyncTransaction_queryReadsAreTracked(self):
+        transaction = self.fs.transaction()
+        await transaction._begin()
+        query = self.fs.collection('users').where('born', '==', 1815)
+        self.assertEqual(['alovelace'], [doc.id async for doc in await transaction.get(query)])
+        await self.fs.document('users/alovelace').update({'born': 1816})
+        transaction.set(self.fs.document('users/mfaraday'), {'born': 1791})
+        with self.assertRaises(Aborted):
+            await transaction.commit()
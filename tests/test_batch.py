@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from mockfirestore import MockFirestore, NotFound, AlreadyExists
+
+
+class TestWriteBatch(TestCase):
+    def setUp(self) -> None:
+        self.fs = MockFirestore()
+        self.fs._data = {'foo': {
+            'first': {'id': 1},
+            'second': {'id': 2}
+        }}
+
+    def test_batch_commit(self):
+        batch = self.fs.batch()
+        batch.set(self.fs.collection('foo').document('third'), {'id': 3})
+        batch.update(self.fs.collection('foo').document('first'), {'name': 'one'})
+        batch.delete(self.fs.collection('foo').document('second'))
+        batch.create(self.fs.collection('bar').document('first'), {'id': 4})
+        self.assertFalse(self.fs.collection('foo').document('third').get().exists)
+
+        results = batch.commit()
+        self.assertEqual(4, len(results))
+        self.assertEqual({'first': {'id': 1, 'name': 'one'}, 'third': {'id': 3}}, self.fs._data['foo'])
+        self.assertEqual({'id': 4}, self.fs.collection('bar').document('first').get().to_dict())
+        self.assertEqual(results[0].update_time, self.fs.collection('foo').document('third').get().update_time)
+
+    def test_batch_sameDocumentTwice(self):
+        doc = self.fs.collection('foo').document('first')
+        snapshot = doc.get()
+        with self.fs.batch() as batch:
+            batch.update(doc, {'name': 'one'})
+            batch.set(doc, {'other': True}, merge=True)
+        self.assertEqual({'id': 1, 'name': 'one', 'other': True}, doc.get().to_dict())
+        self.assertEqual({'id': 1}, snapshot.to_dict())
+
+    def test_batch_failedWriteAppliesNothing(self):
+        batch = self.fs.batch()
+        batch.set(self.fs.collection('foo').document('third'), {'id': 3})
+        batch.update(self.fs.collection('foo').document('missing'), {'id': 4})
+        with self.assertRaises(NotFound):
+            batch.commit()
+        self.assertFalse(self.fs.collection('foo').document('third').get().exists)
+
+    def test_batch_createExisting(self):
+        batch = self.fs.batch()
+        batch.create(self.fs.collection('foo').document('first'), {'id': 3})
+        with self.assertRaises(AlreadyExists):
+            batch.commit()
+
+    def test_batch_writeLimit(self):
+        batch = self.fs.batch()
+        for i in range(500):
+            batch.set(self.fs.collection('foo').document(str(i)), {'id': i})
+        with self.assertRaises(ValueError):
+            batch.set(self.fs.collection('foo').document('500'), {'id': 500})
+
+    def test_batch_updatesIndexes(self):
+        query = self.fs.collection('foo').where('id', '>=', 2).order_by('id')
+        self.assertEqual(['second'], [doc.id for doc in query.stream()])
+        with self.fs.batch() as batch:
+            for i in range(3, 203):
+                batch.set(self.fs.collection('foo').document('doc{}'.format(i)), {'id': i})
+            batch.delete(self.fs.collection('foo').document('second'))
+            batch.update(self.fs.collection('foo').document('first'), {'id': 500})
+        docs = list(query.stream())
+        self.assertEqual(201, len(docs))
+        self.assertEqual([3, 4], [doc.get('id') for doc in docs[:2]])
+        self.assertEqual('first', docs[-1].id)
+
+    def test_batch_deleteRemovesSubcollectionsFromGroups(self):
+        self.fs.collection('foo').document('first').collection('bar').document('a').set({'id': 1})
+        with self.fs.batch() as batch:
+            batch.delete(self.fs.collection('foo').document('first'))
+        self.assertEqual([], list(self.fs.collection_group('bar').stream()))
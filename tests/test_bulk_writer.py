@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from mockfirestore import MockFirestore, NotFound
+
+
+class TestBulkWriter(TestCase):
+    def setUp(self) -> None:
+        self.fs = MockFirestore()
+        self.fs._data = {'foo': {
+            'first': {'id': 1}
+        }}
+
+    def test_bulkWriter_appliesInChunks(self):
+        writer = self.fs.bulk_writer(batch_size=10)
+        results = []
+        writer.on_write_result(lambda reference, result, bulk_writer: results.append(reference.id))
+        for i in range(25):
+            writer.set(self.fs.collection('foo').document('doc{}'.format(i)), {'id': i})
+        self.assertEqual(2, writer.batches)
+        self.assertEqual(5, writer.pending)
+        self.assertFalse(self.fs.collection('foo').document('doc24').get().exists)
+
+        writer.close()
+        self.assertEqual(3, writer.batches)
+        self.assertEqual(25, writer.succeeded)
+        self.assertEqual(['doc{}'.format(i) for i in range(25)], results)
+        self.assertEqual({'id': 24}, self.fs.collection('foo').document('doc24').get().to_dict())
+        with self.assertRaises(ValueError):
+            writer.set(self.fs.collection('foo').document('doc25'), {'id': 25})
+
+    def test_bulkWriter_failuresDontStopOtherWrites(self):
+        writer = self.fs.bulk_writer()
+        failures = []
+        writer.on_write_error(lambda failure, bulk_writer: failures.append(failure) and False)
+        writer.update(self.fs.collection('foo').document('missing'), {'id': 2})
+        writer.create(self.fs.collection('foo').document('first'), {'id': 3})
+        writer.update(self.fs.collection('foo').document('first'), {'name': 'one'})
+        writer.delete(self.fs.collection('foo').document('missing'))
+        writer.flush()
+
+        self.assertEqual(2, writer.succeeded)
+        self.assertEqual(2, writer.failed)
+        self.assertIsInstance(failures[0].error, NotFound)
+        self.assertEqual(['update', 'create'], [failure.operation for failure in failures])
+        self.assertEqual({'id': 1, 'name': 'one'}, self.fs.collection('foo').document('first').get().to_dict())
+
+    def test_bulkWriter_retriesFailedWrites(self):
+        writer = self.fs.bulk_writer()
+        doc = self.fs.collection('foo').document('second')
+
+        def retry(failure, bulk_writer):
+            doc.set({'id': 2})
+            return True
+
+        writer.on_write_error(retry)
+        writer.update(doc, {'name': 'two'})
+        writer.flush()
+        self.assertEqual(1, writer.succeeded)
+        self.assertEqual({'id': 2, 'name': 'two'}, doc.get().to_dict())
+
+    def test_bulkWriter_attemptsCountTowardsMaxAttempts(self):
+        writer = self.fs.bulk_writer(max_attempts=3)
+        failures = []
+        writer.on_write_error(lambda failure, bulk_writer: failures.append(failure.attempts) or True)
+        writer.update(self.fs.collection('foo').document('missing'), {'id': 2}, attempts=1)
+        writer.flush()
+        self.assertEqual([2], failures)
+        self.assertEqual(1, writer.failed)
+
+    def test_bulkWriter_optionsAreRejected(self):
+        with self.assertRaises(ValueError):
+            self.fs.bulk_writer(options=object())
+
+    def test_bulkWriter_unexpectedErrorOnlyFailsItsWrite(self):
+        writer = self.fs.bulk_writer()
+        failures = []
+        writer.on_write_error(lambda failure, bulk_writer: failures.append(failure) and False)
+        doc = self.fs.collection('foo').document('second')
+        writer.set(doc, {'a': 'text', 'n': 1})
+        writer.update(doc, {'n': 2, 'a.b': 1})
+        writer.set(self.fs.collection('foo').document('third'), {'id': 3})
+        writer.flush()
+
+        self.assertEqual(2, writer.succeeded)
+        self.assertEqual(1, writer.failed)
+        self.assertIsInstance(failures[0].error, TypeError)
+        self.assertEqual({'a': 'text', 'n': 1}, doc.get().to_dict())
+        self.assertEqual({'id': 3}, self.fs.collection('foo').document('third').get().to_dict())
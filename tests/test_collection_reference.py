@@ -1,6 +1,8 @@
 from unittest import TestCase
 
-from mockfirestore import MockFirestore, DocumentReference, DocumentSnapshot, AlreadyExists
+from google.cloud import firestore
+
+from mockfirestore import MockFirestore, DocumentReference, DocumentSnapshot, AlreadyExists, FailedPrecondition
 
 
 class TestCollectionReference(TestCase):
@@ -21,7 +23,7 @@ class TestCollectionReference(TestCase):
         self.assertEqual([], list(docs))
 
     def test_collection_get_nestedCollection(self):
-        fs = MockFirestore()
+        fs = MockFirestore(nested_collections=True)
         fs._data = {'foo': {
             'first': {
                 'id': 1,
@@ -34,7 +36,7 @@ class TestCollectionReference(TestCase):
         self.assertEqual({'id': 1.1}, docs[0].to_dict())
 
     def test_collection_get_nestedCollection_by_path(self):
-        fs = MockFirestore()
+        fs = MockFirestore(nested_collections=True)
         fs._data = {'foo': {
             'first': {
                 'id': 1,
@@ -46,6 +48,33 @@ class TestCollectionReference(TestCase):
         docs = list(fs.collection('foo/first/bar').stream())
         self.assertEqual({'id': 1.1}, docs[0].to_dict())
 
+    def test_collection_nestedCollection_notInParentDocument(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1}
+        }}
+        fs.document('foo/first/bar/first_nested').set({'id': 1.1})
+        doc = fs.collection('foo').document('first').get()
+        self.assertEqual({'id': 1}, doc.to_dict())
+
+    def test_collection_document_lookupDoesNotStoreAnything(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1}
+        }}
+        self.assertFalse(fs.collection('foo').document('second').get().exists)
+        fs.collection('foo').document('third').collection('bar').document('nested').delete()
+        fs.collection('baz').document('first').get()
+        self.assertEqual({'foo': {'first': {'id': 1}}}, fs._data)
+        self.assertEqual(['first'], [doc.id for doc in fs.collection('foo').stream()])
+
+    def test_collection_stream_skipsParentsOfSubcollections(self):
+        fs = MockFirestore()
+        fs.document('foo/first/bar/nested').set({'id': 1})
+        self.assertEqual([], list(fs.collection('foo').stream()))
+        self.assertEqual(0, fs.collection('foo').count().get()[0][0].value)
+        self.assertEqual(['first'], [doc.id for doc in fs.collection('foo').list_documents()])
+
     def test_collection_get_nestedCollection_collectionDoesNotExist(self):
         fs = MockFirestore()
         fs._data = {'foo': {
@@ -294,6 +323,38 @@ class TestCollectionReference(TestCase):
         self.assertEqual({'id': 4}, docs[2].to_dict())
         self.assertEqual({'id': 5}, docs[3].to_dict())
 
+    def test_collection_doc_snapshot_cursors_withoutOrderBy(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            '1': {'id': 1},
+            '2': {'id': 2},
+            '3': {'id': 3},
+        }}
+        foo = fs.collection('foo')
+        doc = foo.document('2').get()
+
+        self.assertEqual(['2', '3'], [d.id for d in foo.start_at(doc).stream()])
+        self.assertEqual(['3'], [d.id for d in foo.start_after(doc).stream()])
+        self.assertEqual(['1'], [d.id for d in foo.end_before(doc).stream()])
+        self.assertEqual(1, foo.start_after(doc).count().get()[0][0].value)
+
+    def test_collection_whereFilters_matchSingleDocumentsLikeIndexes(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'a': {'n': 1, 'tags': ['x']},
+            'b': {'n': 'one', 'tags': ['y', 'z']},
+            'c': {'tags': 'x'},
+            'd': {},
+        }}
+        foo = fs.collection('foo')
+        filters = [('n', '<', 2), ('n', '>=', 'a'), ('n', '==', 1), ('n', 'in', [1, 'one', {'a': 1}]),
+                   ('tags', 'array_contains', 'x'), ('tags', 'array_contains_any', ['x', 'z']), ('n', '!=', 1)]
+        for field, op, value in filters:
+            query = foo.where(field, op, value)
+            matches = query._document_matcher()
+            self.assertEqual([doc.id for doc in query.stream()],
+                             [doc_id for doc_id, fields in sorted(fs._data['foo'].items()) if matches(fields)])
+
     def test_collection_start_after(self):
         fs = MockFirestore()
         fs._data = {'foo': {
@@ -497,3 +558,246 @@ class TestCollectionReference(TestCase):
         }}
         doc = fs.collection('foo').document(document_id='first').get()
         self.assertEqual({'id': 1}, doc.to_dict())
+
+    def test_collection_where_indexUpdatedByWrites(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'count': 1},
+            'second': {'count': 5}
+        }}
+        docs = list(fs.collection('foo').where('count', '>', 2).stream())
+        self.assertEqual([{'count': 5}], [doc.to_dict() for doc in docs])
+
+        fs.collection('foo').document('first').update({'count': 3})
+        fs.collection('foo').document('second').delete()
+        fs.collection('foo').document('third').set({'count': 4})
+        docs = list(fs.collection('foo').where('count', '>', 2).stream())
+        self.assertEqual([{'count': 3}, {'count': 4}], [doc.to_dict() for doc in docs])
+
+    def test_collection_where_indexUpdatedByTransformations(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'tags': ['a'], 'count': 1}
+        }}
+        self.assertEqual([], list(fs.collection('foo').where('tags', 'array_contains', 'b').stream()))
+
+        fs.collection('foo').document('first').update({
+            'tags': firestore.ArrayUnion(['b']),
+            'count': firestore.Increment(1),
+        })
+        docs = list(fs.collection('foo').where('tags', 'array_contains', 'b').stream())
+        self.assertEqual(1, len(docs))
+        docs = list(fs.collection('foo').where('count', '==', 2).stream())
+        self.assertEqual(1, len(docs))
+
+    def test_collection_whereRange_onlyMatchesSameType(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'value': 1},
+            'second': {'value': 'a'},
+            'third': {'value': None}
+        }}
+        docs = list(fs.collection('foo').where('value', '<', 5).stream())
+        self.assertEqual([{'value': 1}], [doc.to_dict() for doc in docs])
+
+    def test_collection_whereMultipleFilters(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'a': 1, 'b': 1},
+            'second': {'a': 1, 'b': 2},
+            'third': {'a': 2, 'b': 2}
+        }}
+        docs = list(fs.collection('foo').where('a', '==', 1).where('b', '>=', 2).stream())
+        self.assertEqual([{'a': 1, 'b': 2}], [doc.to_dict() for doc in docs])
+
+    def test_collection_whereOrderByLimit_compositeIndex(self):
+        fs = MockFirestore()
+        fs.add_index('foo', [('city', 'ASCENDING'), ('population', 'DESCENDING')])
+        fs._data = {'foo': {
+            'first': {'city': 'a', 'population': 1},
+            'second': {'city': 'b', 'population': 5},
+            'third': {'city': 'a', 'population': 3},
+            'fourth': {'city': 'a', 'population': 2}
+        }}
+        query = fs.collection('foo').where('city', '==', 'a').order_by('population', direction='DESCENDING')
+        docs = list(query.limit(2).stream())
+        self.assertEqual([3, 2], [doc.get('population') for doc in docs])
+
+        fs.collection('foo').document('fifth').set({'city': 'a', 'population': 4})
+        docs = list(query.limit(2).stream())
+        self.assertEqual([4, 3], [doc.get('population') for doc in docs])
+
+    def test_collection_orderBy_compositeIndexReadInReverse(self):
+        fs = MockFirestore()
+        fs.add_index('foo', [('city', 'ASCENDING'), ('population', 'ASCENDING')])
+        fs._data = {'foo': {
+            'first': {'city': 'a', 'population': 1},
+            'second': {'city': 'a', 'population': 3},
+            'third': {'city': 'b', 'population': 2}
+        }}
+        docs = list(fs.collection('foo').where('city', '==', 'a')
+                    .order_by('population', direction='DESCENDING').stream())
+        self.assertEqual([3, 1], [doc.get('population') for doc in docs])
+
+    def test_collection_requireIndexes_missingIndex(self):
+        fs = MockFirestore(require_indexes=True)
+        fs._data = {'foo': {
+            'first': {'city': 'a', 'population': 1}
+        }}
+        with self.assertRaises(FailedPrecondition):
+            list(fs.collection('foo').where('city', '==', 'a').order_by('population').stream())
+
+        fs.add_index('foo', [('city', 'ASCENDING'), ('population', 'ASCENDING')])
+        docs = list(fs.collection('foo').where('city', '==', 'a').order_by('population').stream())
+        self.assertEqual(1, len(docs))
+
+    def test_collection_requireIndexes_singleFieldQueries(self):
+        fs = MockFirestore(require_indexes=True)
+        fs._data = {'foo': {
+            'first': {'city': 'a', 'population': 1}
+        }}
+        self.assertEqual(1, len(list(fs.collection('foo').where('population', '>', 0)
+                                     .order_by('population').stream())))
+        self.assertEqual(1, len(list(fs.collection('foo').where('city', '==', 'a')
+                                     .where('population', '==', 1).stream())))
+
+    def test_collection_whereNotEqualsOffsetLimit(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'a': {'count': 1},
+            'b': {'count': 2},
+            'c': {'count': 1},
+            'd': {'count': 3},
+            'e': {'count': 4}
+        }}
+        docs = list(fs.collection('foo').where('count', '!=', 1).offset(1).limit(2).stream())
+        self.assertEqual([{'count': 3}, {'count': 4}], [doc.to_dict() for doc in docs])
+
+    def test_collection_limit_streamsLazily(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1},
+            'second': {'id': 2}
+        }}
+        docs = fs.collection('foo').limit(1).stream()
+        fs.collection('foo').document('second').delete()
+        self.assertEqual([{'id': 1}], [doc.to_dict() for doc in docs])
+
+    def test_collection_whereOrderByLimit(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'valid': True, 'order': 3},
+            'second': {'valid': False, 'order': 1},
+            'third': {'valid': True, 'order': 1},
+            'fourth': {'valid': True, 'order': 2}
+        }}
+        docs = list(fs.collection('foo').where('valid', '==', True).order_by('order').limit(2).stream())
+        self.assertEqual(['third', 'fourth'], [doc.id for doc in docs])
+
+    def test_collection_orderByMultipleKeysLimit(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'a': {'group': 1, 'order': 1},
+            'b': {'group': 2, 'order': 3},
+            'c': {'group': 2, 'order': 2},
+            'd': {'group': 1, 'order': 2},
+            'e': {'group': 2, 'order': 3}
+        }}
+        docs = list(fs.collection('foo').order_by('group', direction='DESCENDING')
+                    .order_by('order').limit(3).stream())
+        self.assertEqual(['c', 'b', 'e'], [doc.id for doc in docs])
+
+        docs = list(fs.collection('foo').order_by('group', direction='DESCENDING')
+                    .order_by('order', direction='DESCENDING').limit(3).stream())
+        self.assertEqual(['e', 'b', 'c'], [doc.id for doc in docs])
+
+    def test_collection_orderByMultipleKeys_firstKeyTakesPrecedence(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'a': 2, 'b': 1},
+            'second': {'a': 1, 'b': 2},
+            'third': {'a': 1, 'b': 1}
+        }}
+        docs = list(fs.collection('foo').order_by('a').order_by('b', direction='DESCENDING').stream())
+        self.assertEqual(['second', 'third', 'first'], [doc.id for doc in docs])
+
+    def test_collection_orderBy_mixedTypes(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'a': 'text', 'b': 1},
+            'second': {'a': 2, 'b': 1},
+            'third': {'a': None, 'b': 1},
+            'fourth': {'a': True, 'b': 1},
+            'fifth': {'a': 1.5, 'b': 1}
+        }}
+        docs = list(fs.collection('foo').order_by('b').order_by('a').stream())
+        self.assertEqual([None, True, 1.5, 2, 'text'], [doc.get('a') for doc in docs])
+
+    def test_collection_orderBy_nestedFieldAndMissingField(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'nested': {'order': 2}, 'group': 1},
+            'second': {'nested': {'order': 1}, 'group': 1},
+            'third': {'group': 1}
+        }}
+        docs = list(fs.collection('foo').order_by('group').order_by('nested.order').stream())
+        self.assertEqual(['second', 'first'], [doc.id for doc in docs])
+
+    def test_collection_startAfter_descendingOrder(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1},
+            'second': {'id': 2},
+            'third': {'id': 3},
+            'fourth': {'id': 4}
+        }}
+        docs = list(fs.collection('foo').order_by('id', direction='DESCENDING').start_after({'id': 3})
+                    .end_at({'id': 2}).stream())
+        self.assertEqual([2], [doc.get('id') for doc in docs])
+
+    def test_collection_startAt_valueNotInCollection(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1},
+            'second': {'id': 3},
+            'third': {'id': 5}
+        }}
+        docs = list(fs.collection('foo').order_by('id').start_at({'id': 2}).end_before({'id': 5}).stream())
+        self.assertEqual([3], [doc.get('id') for doc in docs])
+
+    def test_collection_startAfter_paginatesBySnapshot(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {str(i): {'group': i % 2, 'order': i} for i in range(10)}}
+        query = fs.collection('foo').order_by('group').order_by('order', direction='DESCENDING').limit(3)
+        pages = []
+        docs = list(query.stream())
+        while docs:
+            pages.append([doc.get('order') for doc in docs])
+            docs = list(query.start_after(docs[-1]).stream())
+        self.assertEqual([[8, 6, 4], [2, 0, 9], [7, 5, 3], [1]], pages)
+
+    def test_collection_whereNotEqual_nestedFieldAndOtherFilters(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'nested': {'a': 1}, 'b': 1, 'c': 'x'},
+            'second': {'nested': {'a': 2}, 'b': 1, 'c': 'x'},
+            'third': {'b': 1, 'c': 'y'},
+            'fourth': {'nested': {'a': 2}, 'b': 2, 'c': 'x'}
+        }}
+        docs = list(fs.collection('foo').where('nested.a', '!=', 1).where('b', '==', 1)
+                    .where('c', '!=', 'y').stream())
+        self.assertEqual(['second'], [doc.id for doc in docs])
+
+    def test_collection_select_onlyReturnsSelectedFields(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'name': 'Ada', 'address': {'city': 'London', 'street': 'St James'}, 'blob': 'x' * 1000},
+            'second': {'blob': 'y'}
+        }}
+        docs = list(fs.collection('foo').select(['name', 'address.city']).order_by('blob').stream())
+        self.assertEqual([{'name': 'Ada', 'address': {'city': 'London'}}, {}], [doc.to_dict() for doc in docs])
+        self.assertTrue(docs[1].exists)
+
+        docs = list(fs.collection('foo').where('name', '==', 'Ada').select(['address', 'address.city']).stream())
+        docs[0].to_dict()['address']['zip'] = 'SW1'
+        self.assertEqual({'city': 'London', 'street': 'St James'}, fs.document('foo/first').get().get('address'))
@@ -0,0 +1,141 @@
+import sys
+import threading
+from unittest import TestCase
+
+from google.cloud import firestore
+
+from mockfirestore import MockFirestore, AlreadyExists
+
+
+class TestConcurrency(TestCase):
+    def setUp(self) -> None:
+        # Switch threads as often as possible, so that races show up.
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.fs = MockFirestore()
+
+    def tearDown(self) -> None:
+        sys.setswitchinterval(self.switch_interval)
+
+    @staticmethod
+    def run_threads(*targets):
+        threads = [threading.Thread(target=target) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrency_incrementsAreNotLost(self):
+        doc = self.fs.collection('counters').document('likes')
+        doc.set({'count': 0})
+
+        def increment():
+            for _ in range(200):
+                doc.update({'count': firestore.Increment(1)})
+
+        self.run_threads(*[increment] * 4)
+        self.assertEqual({'count': 800}, doc.get().to_dict())
+
+    def test_concurrency_mergedFieldsAreNotLost(self):
+        doc = self.fs.collection('users').document('alovelace')
+
+        def merge(field):
+            return lambda: [doc.set({field: i}, merge=True) for i in range(100)]
+
+        self.run_threads(*[merge('field{}'.format(i)) for i in range(4)])
+        self.assertEqual({'field{}'.format(i): 99 for i in range(4)}, doc.get().to_dict())
+
+    def test_concurrency_queriesDuringWrites(self):
+        collection = self.fs.collection('users')
+        for i in range(100):
+            collection.document(str(i)).set({'age': i})
+        results = []
+
+        def write():
+            for i in range(500):
+                collection.document(str(i % 150)).set({'age': (i * 7) % 100})
+                if i % 10 == 0:
+                    collection.document(str((i + 75) % 150)).delete()
+
+        def query():
+            for _ in range(50):
+                results.append([doc.id for doc in collection.order_by('age').limit(20).stream()])
+                results.append([doc.id for doc in collection.where('age', '>=', 50).stream()])
+
+        self.run_threads(write, query, query)
+        self.assertEqual(200, len(results))
+        for doc_ids in results:
+            self.assertEqual(len(doc_ids), len(set(doc_ids)))
+
+    def test_concurrency_batchIncrementsAreNotLost(self):
+        doc = self.fs.collection('counters').document('likes')
+        doc.set({'count': 0})
+
+        def increment():
+            for _ in range(200):
+                batch = self.fs.batch()
+                batch.update(doc, {'count': firestore.Increment(1)})
+                batch.commit()
+
+        self.run_threads(*[increment] * 4)
+        self.assertEqual({'count': 800}, doc.get().to_dict())
+
+    def test_concurrency_bulkWriterIncrementsAreNotLost(self):
+        doc = self.fs.collection('counters').document('likes')
+        doc.set({'count': 0})
+
+        def increment():
+            bulk_writer = self.fs.bulk_writer()
+            for _ in range(200):
+                bulk_writer.update(doc, {'count': firestore.Increment(1)})
+                bulk_writer.flush()
+            bulk_writer.close()
+
+        self.run_threads(*[increment] * 4)
+        self.assertEqual({'count': 800}, doc.get().to_dict())
+
+    def test_concurrency_createSucceedsOnce(self):
+        collection = self.fs.collection('users')
+        created = []
+
+        def create(i):
+            def target():
+                for n in range(50):
+                    try:
+                        batch = self.fs.batch()
+                        batch.create(collection.document(str(n)), {'by': i})
+                        batch.commit()
+                        created.append(n)
+                    except AlreadyExists:
+                        pass
+            return target
+
+        def bulk_create():
+            bulk_writer = self.fs.bulk_writer()
+            bulk_writer.on_write_result(lambda reference, result, writer: created.append(int(reference.id)))
+            for n in range(50):
+                bulk_writer.create(collection.document(str(n)), {'by': 'bulk'})
+                bulk_writer.flush()
+            bulk_writer.close()
+
+        self.run_threads(create(0), create(1), bulk_create)
+        self.assertEqual(list(range(50)), sorted(created))
+
+    def test_concurrency_listDocumentsDuringWrites(self):
+        collection = self.fs.collection('users')
+        results = []
+
+        def write():
+            for i in range(500):
+                collection.document(str(i)).set({'age': i})
+                if i % 3 == 0:
+                    collection.document(str(i)).delete()
+                if i % 5 == 0:
+                    collection.document('parent{}'.format(i)).collection('friends').document('a').set({'age': i})
+
+        def list_documents():
+            for _ in range(200):
+                results.append(len(collection.list_documents()))
+
+        self.run_threads(write, list_documents)
+        self.assertEqual(200, len(results))
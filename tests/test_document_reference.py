@@ -1,3 +1,5 @@
+import copy
+import pickle
 from unittest import TestCase
 
 from google.cloud import firestore
@@ -55,7 +57,7 @@ class TestDocumentReference(TestCase):
         self.assertEqual({}, doc)
 
     def test_get_nestedDocument(self):
-        fs = MockFirestore()
+        fs = MockFirestore(nested_collections=True)
         fs._data = {'top_collection': {
             'top_document': {
                 'id': 1,
@@ -96,6 +98,14 @@ class TestDocumentReference(TestCase):
         doc = fs.collection('foo').document('bar').get().to_dict()
         self.assertEqual(doc_content, doc)
 
+    def test_document_set_keepsSubcollections(self):
+        fs = MockFirestore()
+        fs.document('foo/first/bar/nested').set({'id': 1.1})
+        fs.collection('foo').document('first').set({'id': 1})
+        self.assertEqual({'id': 1}, fs.collection('foo').document('first').get().to_dict())
+        doc = fs.document('foo/first/bar/nested').get().to_dict()
+        self.assertEqual({'id': 1.1}, doc)
+
     def test_document_set_mergeNewValue(self):
         fs = MockFirestore()
         fs._data = {'foo': {
@@ -336,3 +346,31 @@ class TestDocumentReference(TestCase):
         doc = fs.collection("foo").document("first").get().to_dict()
         self.assertEqual(doc["arr"], [1, 2, 3, 4])
 
+
+    def test_document_heldReference_followsParentDeletionRestoreAndReset(self):
+        fs = MockFirestore()
+        doc_ref = fs.document("foo/first/bar/second/baz/third")
+        doc_ref.set({"id": 1})
+        baseline = fs.checkpoint()
+
+        doc_ref.update({"id": 2})
+        fs.restore(baseline)
+        self.assertEqual({"id": 1}, doc_ref.get().to_dict())
+
+        fs.collection("foo").document("first").delete()
+        self.assertFalse(doc_ref.get().exists)
+        doc_ref.set({"id": 3})
+        self.assertEqual({"id": 3}, fs.document("foo/first/bar/second/baz/third").get().to_dict())
+
+        fs.reset()
+        self.assertFalse(doc_ref.get().exists)
+        self.assertEqual([], list(doc_ref.parent.stream()))
+
+    def test_document_reference_copyAndPickle(self):
+        fs = MockFirestore()
+        doc_ref = fs.collection("foo").document("first")
+        doc_ref.set({"id": 1})
+        self.assertEqual(doc_ref, copy.copy(doc_ref))
+        unpickled = pickle.loads(pickle.dumps(doc_ref))
+        self.assertEqual(["foo", "first"], unpickled._path)
+        self.assertEqual({"id": 1}, unpickled.get().to_dict())
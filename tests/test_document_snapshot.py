@@ -37,6 +37,13 @@ class TestDocumentSnapshot(TestCase):
         doc = fs.collection('foo').document('second').get()
         self.assertFalse(doc.exists)
 
+    def test_documentSnapshot_exists_emptyDocument(self):
+        fs = MockFirestore()
+        fs.collection('foo').document('first').set({})
+        self.assertTrue(fs.collection('foo').document('first').get().exists)
+        fs.document('foo/second/bar/nested').set({'id': 1})
+        self.assertFalse(fs.collection('foo').document('second').get().exists)
+
     def test_documentSnapshot_reference(self):
         fs = MockFirestore()
         fs._data = {'foo': {
@@ -120,3 +127,31 @@ class TestDocumentSnapshot(TestCase):
         self.assertIsNot(
             doc.get('contact'),fs._data['foo']['first']['contact']
         )
+
+    def test_documentSnapshot_isolatedFromLaterUpdate(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1, 'nested': {'count': 1}}
+        }}
+        doc_ref = fs.collection('foo').document('first')
+        doc = doc_ref.get()
+        doc_ref.update({'nested.count': 2})
+        self.assertEqual({'id': 1, 'nested': {'count': 1}}, doc.to_dict())
+        self.assertEqual(1, doc.get('nested.count'))
+
+    def test_documentSnapshot_toDict_mutationIsolatedFromStore(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1}
+        }}
+        doc_ref = fs.collection('foo').document('first')
+        doc_ref.get().to_dict()['id'] = 2
+        self.assertEqual({'id': 1}, doc_ref.get().to_dict())
+
+    def test_documentSnapshot_readOnlySnapshots_shareStoredData(self):
+        fs = MockFirestore(read_only_snapshots=True)
+        fs._data = {'foo': {
+            'first': {'id': 1}
+        }}
+        doc = fs.collection('foo').document('first').get()
+        self.assertIs(fs._data['foo']['first'], doc.to_dict())
@@ -1,3 +1,7 @@
+import io
+import json
+import os
+import tempfile
 from unittest import TestCase
 
 from mockfirestore import MockFirestore
@@ -16,6 +20,51 @@ class TestMockFirestore(TestCase):
         expected_doc_snapshot = doc.get().to_dict()
         self.assertEqual(returned_doc_snapshot, expected_doc_snapshot)
 
+    def test_client_get_all_fieldPaths(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {'first': {'id': 1, 'nested': {'a': 1, 'b': 2}}}}
+        results = list(fs.get_all([fs.collection('foo').document('first')], field_paths=['nested.b']))
+        self.assertEqual({'nested': {'b': 2}}, results[0].to_dict())
+
+    def test_client_get_all_deduplicatesInOrder(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {'first': {'id': 1}, 'second': {'id': 2}}}
+        references = [fs.document('foo/second'), fs.collection('foo').document('first'), fs.document('foo/second')]
+        self.assertEqual(['second', 'first'], [doc.id for doc in fs.get_all(references)])
+
+    def test_client_document_returnsSameReference(self):
+        fs = MockFirestore()
+        doc = fs.document('foo/first/bar/second')
+        self.assertIs(doc, fs.document('foo/first/bar/second'))
+        self.assertIs(doc.parent, fs.collection('foo/first/bar'))
+        self.assertEqual(doc, fs.collection('foo').document('first').collection('bar').document('second'))
+        self.assertNotEqual(doc, fs.document('foo/first'))
+
+    def test_client_data_nestedCollectionsAndReadOnlyView(self):
+        fs = MockFirestore(nested_collections=True)
+        fs._data = {'foo': {
+            'first': {
+                'id': 1,
+                'address': {'city': 'London'},
+                'bar': {
+                    'first_nested': {'id': 1.1}
+                }
+            }
+        }}
+        self.assertEqual({'id': 1, 'address': {'city': 'London'}}, fs.document('foo/first').get().to_dict())
+        self.assertEqual({'id': 1.1}, fs.document('foo/first/bar/first_nested').get().to_dict())
+        with self.assertRaises(TypeError):
+            fs._data['foo']['second'] = {'id': 2}
+        with self.assertRaises(TypeError):
+            fs._data['baz'] = {}
+
+    def test_client_data_keepsNestedMapFields(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {'first': {'nested': {'a': {'b': 1}}}}}
+        self.assertEqual({'nested': {'a': {'b': 1}}}, fs.document('foo/first').get().to_dict())
+        self.assertEqual(['first'], [doc.id for doc in fs.collection('foo').where('nested.a.b', '==', 1).stream()])
+        self.assertEqual([], list(fs.collection('foo/first/nested').stream()))
+
     def test_client_collections(self):
         fs = MockFirestore()
         fs._data = {
@@ -31,3 +80,151 @@ class TestMockFirestore(TestCase):
         self.assertEqual(len(collections), len(expected_collections))
         for collection in collections:
             self.assertTrue(collection._path[0] in expected_collections)
+
+    def test_client_load_indexes(self):
+        fs = MockFirestore(require_indexes=True)
+        fs.load_indexes(io.StringIO(json.dumps({
+            'indexes': [{
+                'collectionGroup': 'foo',
+                'queryScope': 'COLLECTION',
+                'fields': [
+                    {'fieldPath': 'tags', 'arrayConfig': 'CONTAINS'},
+                    {'fieldPath': 'count', 'order': 'ASCENDING'},
+                ]
+            }],
+            'fieldOverrides': []
+        })))
+        fs._data = {'foo': {
+            'first': {'tags': ['a'], 'count': 2},
+            'second': {'tags': ['a', 'b'], 'count': 1},
+            'third': {'tags': ['b'], 'count': 0}
+        }}
+        docs = list(fs.collection('foo').where('tags', 'array_contains', 'a').order_by('count').stream())
+        self.assertEqual(['second', 'first'], [doc.id for doc in docs])
+
+    def test_client_collectionGroup(self):
+        fs = MockFirestore()
+        fs.collection('orders').document('a').set({'total': 3})
+        fs.collection('users').document('alice').collection('orders').document('b').set({'total': 1})
+        fs.collection('users').document('bob').collection('orders').document('c').set({'total': 2})
+        fs.collection('users').document('bob').collection('carts').document('d').set({'total': 4})
+
+        docs = list(fs.collection_group('orders').stream())
+        self.assertEqual([['orders', 'a'], ['users', 'alice', 'orders', 'b'], ['users', 'bob', 'orders', 'c']],
+                         [doc.reference._path for doc in docs])
+        self.assertEqual('bob', docs[2].reference.parent.parent.id)
+
+    def test_client_collectionGroup_whereOrderByLimit(self):
+        fs = MockFirestore()
+        for user in range(5):
+            orders = fs.collection('users').document(str(user)).collection('orders')
+            for order in range(3):
+                orders.document(str(order)).set({'total': user * 3 + order, 'open': order != 1})
+
+        query = fs.collection_group('orders').where('open', '==', True).order_by('total', direction='DESCENDING')
+        docs = list(query.limit(3).stream())
+        self.assertEqual([14, 12, 11], [doc.get('total') for doc in docs])
+        docs = list(query.start_after(docs[-1]).limit(2).stream())
+        self.assertEqual([9, 8], [doc.get('total') for doc in docs])
+
+    def test_client_collectionGroup_afterParentDeleted(self):
+        fs = MockFirestore()
+        fs.collection('users').document('alice').collection('orders').document('a').set({'total': 1})
+        fs.collection('users').document('bob').collection('orders').document('b').set({'total': 2})
+        fs.collection('users').document('alice').delete()
+
+        docs = list(fs.collection_group('orders').stream())
+        self.assertEqual(['b'], [doc.id for doc in docs])
+        self.assertEqual([('users', 'bob', 'orders')], fs._store.collection_group('orders'))
+
+    def test_client_load_ndjson(self):
+        fs = MockFirestore()
+        count = fs.load(io.StringIO(
+            '{"path": "users/alovelace", "data": {"born": 1815}}\n'
+            '\n'
+            '{"path": "users/alovelace/friends/cbabbage", "data": {"born": 1791}}\n'
+            '{"path": "users/cbabbage/friends/alovelace", "data": {"born": 1815}}\n'
+        ))
+        self.assertEqual(3, count)
+        self.assertEqual({'born': 1815}, fs.document('users/alovelace').get().to_dict())
+        self.assertEqual({'born': 1791}, fs.document('users/alovelace/friends/cbabbage').get().to_dict())
+        self.assertFalse(fs.document('users/cbabbage').get().exists)
+        self.assertEqual(['cbabbage', 'alovelace'], [doc.id for doc in fs.collection_group('friends').stream()])
+
+    def test_client_load_json(self):
+        fs = MockFirestore()
+        documents = {'users/{}'.format(i): {'id': i, 'text': 'x' * 1000} for i in range(200)}
+        documents['users/0/friends/1'] = {'id': 'nested'}
+        count = fs.load(io.BytesIO(json.dumps(documents, indent=2).encode()), format='json')
+        self.assertEqual(201, count)
+        self.assertEqual(200, len(list(fs.collection('users').stream())))
+        self.assertEqual({'id': 'nested'}, fs.document('users/0/friends/1').get().to_dict())
+
+    def test_client_load_invalidPath(self):
+        fs = MockFirestore()
+        with self.assertRaises(ValueError):
+            fs.load(io.StringIO('{"users": {"id": 1}}'), format='json')
+
+    def test_client_checkpointRestore(self):
+        fs = MockFirestore()
+        fs._data = {'foo': {
+            'first': {'id': 1},
+            'second': {'id': 2}
+        }}
+        doc = fs.collection('foo').document('first')
+        doc.collection('bar').document('nested').set({'id': 3})
+        checkpoint = fs.checkpoint()
+
+        for attempt in range(2):
+            doc.update({'id': 10})
+            fs.collection('foo').document('second').delete()
+            fs.collection('foo').document('third').set({'id': 4})
+            doc.collection('bar').document('nested').update({'id': 30})
+            fs.collection('baz').document('new').set({'id': 5})
+            self.assertEqual([10, 4], [snapshot.get('id') for snapshot in fs.collection('foo').order_by('id', direction='DESCENDING').stream()])
+
+            fs.restore(checkpoint)
+            self.assertEqual({'foo': {'first': {'id': 1}, 'second': {'id': 2}}}, fs._data)
+            self.assertEqual({'id': 1}, doc.get().to_dict())
+            self.assertEqual([3], [snapshot.get('id') for snapshot in fs.collection_group('bar').stream()])
+            self.assertEqual([2, 1], [snapshot.get('id') for snapshot in fs.collection('foo').order_by('id', direction='DESCENDING').stream()])
+
+    def test_client_reset_keepsReferences(self):
+        fs = MockFirestore()
+        doc = fs.collection('foo').document('first')
+        doc.set({'id': 1})
+        fs.reset()
+        self.assertFalse(doc.get().exists)
+        doc.set({'id': 2})
+        self.assertEqual({'foo': {'first': {'id': 2}}}, fs._data)
+
+    def test_client_saveLoadSnapshot(self):
+        fs = MockFirestore()
+        fs.collection('users').document('alovelace').set({'born': 1815, 'tags': ['a', 'b']})
+        fs.collection('users').document('alovelace').collection('friends').document('cbabbage').set({
+            'born': 1791, 'friend': fs.document('users/alovelace')})
+        fs.collection('users').document('cbabbage').set({'born': 1791, 'nested': {'bytes': b'x'}})
+        update_time = fs.document('users/alovelace').get().update_time
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fixture.mfs')
+            fs.save_snapshot(path)
+
+            loaded = MockFirestore()
+            doc = loaded.document('users/alovelace')
+            checkpoint = loaded.load_snapshot(path)
+            self.assertEqual({'born': 1815, 'tags': ['a', 'b']}, doc.get().to_dict())
+            self.assertEqual(update_time._timestamp, doc.get().update_time._timestamp)
+            self.assertEqual({'nested': {'bytes': b'x'}, 'born': 1791}, loaded.document('users/cbabbage').get().to_dict())
+            friend = loaded.document('users/alovelace/friends/cbabbage').get().get('friend')
+            self.assertEqual({'born': 1815, 'tags': ['a', 'b']}, friend.get().to_dict())
+            self.assertEqual(['cbabbage'], [snapshot.id for snapshot in loaded.collection_group('friends').stream()])
+            self.assertEqual(['cbabbage'], [snapshot.id for snapshot in
+                                            loaded.collection('users').where('born', '<', 1800).stream()])
+
+            doc.update({'born': 1816})
+            loaded.document('users/cbabbage').delete()
+            self.assertEqual(['alovelace'], [snapshot.id for snapshot in loaded.collection('users').stream()])
+            loaded.restore(checkpoint)
+            self.assertEqual(1815, doc.get().get('born'))
+            self.assertEqual(['alovelace', 'cbabbage'], [snapshot.id for snapshot in loaded.collection('users').stream()])
@@ -1,5 +1,6 @@
+import threading
 from unittest import TestCase
-from mockfirestore import MockFirestore, Transaction
+from mockfirestore import MockFirestore, Transaction, Aborted, transactional
 
 
 class TestTransaction(TestCase):
@@ -69,5 +70,82 @@ class TestTransaction(TestCase):
         doc = self.fs.collection('foo').document('first').get()
         self.assertEqual(False, doc.exists)
 
+    def test_transaction_commit_abortsWhenReadDocumentChanged(self):
+        doc = self.fs.collection('foo').document('first')
+        transaction = self.fs.transaction()
+        transaction._begin()
+        next(transaction.get(doc))
+        doc.update({'id': 10})
+        transaction.update(doc, {'id': 2})
+        with self.assertRaises(Aborted):
+            transaction.commit()
+        self.assertEqual({'id': 10}, doc.get().to_dict())
+
+    def test_transaction_commit_abortsWhenReadMissingDocumentCreated(self):
+        doc = self.fs.collection('foo').document('third')
+        transaction = self.fs.transaction()
+        transaction._begin()
+        self.assertFalse(next(transaction.get(doc)).exists)
+        doc.set({'id': 3})
+        transaction.set(doc, {'id': 30})
+        with self.assertRaises(Aborted):
+            transaction.commit()
+
+    def test_transaction_commit_ignoresWritesToUnreadDocuments(self):
+        transaction = self.fs.transaction()
+        transaction._begin()
+        list(transaction.get_all([self.fs.collection('foo').document('first')]))
+        self.fs.collection('foo').document('second').update({'id': 20})
+        transaction.update(self.fs.collection('foo').document('first'), {'id': 10})
+        transaction.commit()
+        self.assertEqual({'id': 10}, self.fs.collection('foo').document('first').get().to_dict())
+
+    def test_transactional_retriesConflicts(self):
+        doc = self.fs.collection('foo').document('first')
+        attempts = []
+
+        @transactional
+        def increment(transaction, reference):
+            snapshot = next(transaction.get(reference))
+            if not attempts:
+                reference.update({'id': 5})
+            attempts.append(snapshot.get('id'))
+            transaction.update(reference, {'id': snapshot.get('id') + 1})
+            return len(attempts)
+
+        self.assertEqual(2, increment(self.fs.transaction(), doc))
+        self.assertEqual([1, 5], attempts)
+        self.assertEqual({'id': 6}, doc.get().to_dict())
+
+    def test_transactional_raisesAfterMaxAttempts(self):
+        doc = self.fs.collection('foo').document('first')
+
+        @transactional
+        def always_conflicts(transaction, reference):
+            next(transaction.get(reference))
+            reference.update({'id': 5})
+            transaction.update(reference, {'id': 0})
+
+        transaction = self.fs.transaction(max_attempts=3)
+        with self.assertRaises(ValueError):
+            always_conflicts(transaction, doc)
+        self.assertFalse(transaction.in_progress)
+
+    def test_transactional_concurrentIncrementsAreSerializable(self):
+        doc = self.fs.collection('foo').document('first')
+
+        @transactional
+        def increment(transaction, reference):
+            snapshot = next(transaction.get(reference))
+            transaction.update(reference, {'id': snapshot.get('id') + 1})
 
+        def worker():
+            for _ in range(50):
+                increment(self.fs.transaction(max_attempts=1000), doc)
 
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({'id': 401}, doc.get().to_dict())
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from google.cloud import firestore
+
+from mockfirestore import MockFirestore
+
+
+class TestWriteAheadLog(TestCase):
+    def setUp(self) -> None:
+        self._directory = tempfile.TemporaryDirectory()
+        self.data_dir = self._directory.name
+
+    def tearDown(self) -> None:
+        self._directory.cleanup()
+
+    def test_wal_recoversWrites(self):
+        fs = MockFirestore(data_dir=self.data_dir)
+        fs.collection('users').document('alovelace').set({'born': 1815})
+        fs.collection('users').document('alovelace').update({'likes': firestore.Increment(2)})
+        fs.collection('users').document('alovelace').collection('friends').document('cbabbage').set({'born': 1791})
+        fs.collection('users').document('temporary').set({'born': 2000})
+        fs.collection('users').document('temporary').delete()
+        with fs.batch() as batch:
+            batch.set(fs.collection('users').document('mfaraday'), {'born': 1791})
+        transaction = fs.transaction()
+        transaction._begin()
+        transaction.update(fs.collection('users').document('mfaraday'), {'died': 1867})
+        transaction.commit()
+        update_time = fs.document('users/alovelace').get().update_time
+        fs.close()
+
+        recovered = MockFirestore(data_dir=self.data_dir)
+        self.assertEqual({'users': {'alovelace': {'born': 1815, 'likes': 2},
+                                    'mfaraday': {'born': 1791, 'died': 1867}}}, recovered._data)
+        self.assertEqual({'born': 1791}, recovered.document('users/alovelace/friends/cbabbage').get().to_dict())
+        self.assertEqual(update_time._timestamp, recovered.document('users/alovelace').get().update_time._timestamp)
+        recovered.close()
+
+    def test_wal_compactsAndDiscardsTornGroup(self):
+        fs = MockFirestore(data_dir=self.data_dir, sync_interval=0)
+        fs.collection('users').document('alovelace').set({'born': 1815})
+        fs.reset()
+        fs.collection('users').document('cbabbage').set({'born': 1791})
+        fs.compact()
+        fs.collection('users').document('mfaraday').set({'born': 1791})
+        fs.collection('users').document('cbabbage').update({'died': 1871})
+        fs.close()
+
+        log_path = os.path.join(self.data_dir, 'log.1')
+        with open(log_path, 'r+b') as f:
+            f.truncate(os.path.getsize(log_path) - 3)
+        self.assertEqual(['log.1', 'snapshot.1.mfs'], sorted(os.listdir(self.data_dir)))
+
+        recovered = MockFirestore(data_dir=self.data_dir)
+        self.assertEqual({'users': {'cbabbage': {'born': 1791}, 'mfaraday': {'born': 1791}}}, recovered._data)
+        recovered.collection('users').document('cbabbage').update({'died': 1871})
+        recovered.close()
+        self.assertEqual({'born': 1791, 'died': 1871},
+                         MockFirestore(data_dir=self.data_dir).document('users/cbabbage').get().to_dict())
+
+    def test_wal_restoreIsDurable(self):
+        fs = MockFirestore(data_dir=self.data_dir)
+        fs.collection('users').document('alovelace').set({'born': 1815})
+        checkpoint = fs.checkpoint()
+        fs.collection('users').document('cbabbage').set({'born': 1791})
+        fs.restore(checkpoint)
+        fs.close()
+        self.assertEqual({'users': {'alovelace': {'born': 1815}}}, MockFirestore(data_dir=self.data_dir)._data)
@@ -0,0 +1,132 @@
+import queue
+import time
+from unittest import TestCase
+
+from mockfirestore import MockFirestore, ChangeType
+from mockfirestore.watch import COALESCE_INTERVAL
+
+
+class Snapshots:
+    """Callback collecting the snapshots of a watch."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def __call__(self, docs, changes, read_time):
+        self._queue.put(([doc.id for doc in docs],
+                         [(change.type, change.document.id, change.old_index, change.new_index)
+                          for change in changes]))
+
+    def next(self):
+        return self._queue.get(timeout=5)
+
+    def empty(self):
+        return self._queue.empty()
+
+
+class TestWatch(TestCase):
+    def setUp(self) -> None:
+        self.fs = MockFirestore()
+        self.fs._data = {'users': {
+            'alovelace': {'first': 'Ada', 'born': 1815},
+            'cbabbage': {'first': 'Charles', 'born': 1791},
+        }}
+
+    def tearDown(self) -> None:
+        # Every test unsubscribes its watches, after which the dispatcher thread stops.
+        listeners = self.fs._store.listeners
+        thread = None if listeners is None else listeners._thread
+        if thread is not None:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+
+    def test_documentOnSnapshot_receivesChanges(self):
+        snapshots = Snapshots()
+        doc = self.fs.collection('users').document('alovelace')
+        watch = doc.on_snapshot(snapshots)
+        self.assertEqual((['alovelace'], [(ChangeType.ADDED, 'alovelace', -1, 0)]), snapshots.next())
+
+        doc.update({'born': 1816})
+        self.assertEqual((['alovelace'], [(ChangeType.MODIFIED, 'alovelace', 0, 0)]), snapshots.next())
+        doc.delete()
+        self.assertEqual(([], [(ChangeType.REMOVED, 'alovelace', 0, -1)]), snapshots.next())
+        watch.unsubscribe()
+
+    def test_queryOnSnapshot_incrementalChanges(self):
+        snapshots = Snapshots()
+        users = self.fs.collection('users')
+        watch = users.where('born', '>', 1790).order_by('born').on_snapshot(snapshots)
+        self.assertEqual((['cbabbage', 'alovelace'], [(ChangeType.ADDED, 'cbabbage', -1, 0),
+                                                      (ChangeType.ADDED, 'alovelace', -1, 1)]),
+                         snapshots.next())
+
+        users.document('mfaraday').set({'first': 'Michael', 'born': 1791.5})
+        self.assertEqual((['cbabbage', 'mfaraday', 'alovelace'], [(ChangeType.ADDED, 'mfaraday', -1, 1)]),
+                         snapshots.next())
+        users.document('alovelace').update({'born': 1700})
+        self.assertEqual((['cbabbage', 'mfaraday'], [(ChangeType.REMOVED, 'alovelace', 2, -1)]),
+                         snapshots.next())
+        users.document('cbabbage').update({'born': 1800})
+        self.assertEqual((['mfaraday', 'cbabbage'], [(ChangeType.MODIFIED, 'cbabbage', 0, 1)]),
+                         snapshots.next())
+        watch.unsubscribe()
+
+    def test_queryOnSnapshot_burstIsCoalesced(self):
+        snapshots = Snapshots()
+        users = self.fs.collection('users')
+        watch = users.on_snapshot(snapshots)
+        snapshots.next()
+
+        batch = self.fs.batch()
+        for i in range(50):
+            batch.set(users.document('user{:02}'.format(i)), {'n': i})
+        batch.commit()
+        docs, changes = snapshots.next()
+        self.assertEqual(52, len(docs))
+        self.assertEqual(50, len(changes))
+        self.assertTrue(all(change[0] == ChangeType.ADDED for change in changes))
+        watch.unsubscribe()
+
+    def test_queryOnSnapshot_limitWindowMoves(self):
+        snapshots = Snapshots()
+        users = self.fs.collection('users')
+        users.document('mfaraday').set({'born': 1791.5})
+        watch = users.order_by('born', direction='DESCENDING').limit(2).on_snapshot(snapshots)
+        self.assertEqual(['alovelace', 'mfaraday'], snapshots.next()[0])
+
+        users.document('alovelace').delete()
+        self.assertEqual((['mfaraday', 'cbabbage'], [(ChangeType.REMOVED, 'alovelace', 0, -1),
+                                                     (ChangeType.ADDED, 'cbabbage', -1, 1)]),
+                         snapshots.next())
+        watch.unsubscribe()
+
+    def test_collectionGroupOnSnapshot(self):
+        snapshots = Snapshots()
+        watch = self.fs.collection_group('friends').on_snapshot(snapshots)
+        self.assertEqual(([], []), snapshots.next())
+
+        self.fs.collection('users').document('alovelace').collection('friends').document('mfaraday').set({'a': 1})
+        self.assertEqual((['mfaraday'], [(ChangeType.ADDED, 'mfaraday', -1, 0)]), snapshots.next())
+        self.fs.collection('users').document('alovelace').delete()
+        self.assertEqual(([], [(ChangeType.REMOVED, 'mfaraday', 0, -1)]), snapshots.next())
+        watch.unsubscribe()
+
+    def test_onSnapshot_resetRemovesEverything(self):
+        snapshots = Snapshots()
+        watch = self.fs.collection('users').on_snapshot(snapshots)
+        snapshots.next()
+        self.fs.reset()
+        docs, changes = snapshots.next()
+        self.assertEqual([], docs)
+        self.assertEqual({ChangeType.REMOVED}, {change[0] for change in changes})
+        watch.unsubscribe()
+
+    def test_onSnapshot_unsubscribeStopsCallbacks(self):
+        snapshots = Snapshots()
+        doc = self.fs.document('users/alovelace')
+        watch = doc.on_snapshot(snapshots)
+        snapshots.next()
+        watch.unsubscribe()
+        doc.update({'born': 1816})
+        time.sleep(COALESCE_INTERVAL * 10)
+        self.assertTrue(snapshots.empty())